@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """small in-process LRU cache whose entries also expire after a ttl (seconds)"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        # when each key was last invalidated, on a clock every invalidation moves. keys that fall off
+        # the end leave their time in _forgotten, which then stands in for all of them
+        self._clock = 0
+        self._invalidated: OrderedDict[Hashable, int] = OrderedDict()
+        self._forgotten = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def generation(self, key: Hashable) -> int:
+        """taken before reading the value to cache; set() drops it if key was invalidated in the meantime"""
+        return self._invalidated.get(key, self._forgotten)
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, generation: int | None = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        if generation is not None and self.generation(key) != generation:
+            # a write landed while the value was being read, it may already be stale
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+        self._clock += 1
+        self._invalidated[key] = self._clock
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > max(self.maxsize, 1):
+            _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self._clock += 1
+        self._invalidated.clear()
+        self._forgotten = self._clock
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
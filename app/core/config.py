@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -7,6 +8,38 @@ class Settings(BaseSettings):
     secrete_key: str
     algorithm : str
     access_key_expire_minutes: int
+    principal_cache_size: int = 1024
+    principal_cache_ttl_seconds: float = 30
+    permissions_reload_interval_seconds: float = 0
+    password_hash_executor: Literal["thread", "process"] = "thread"
+    password_hash_workers: int = 4
+    asset_cache_size: int = 2048
+    asset_cache_ttl_seconds: float = 60
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    db_query_cache_size: int = 500
+    db_sqlite_journal_mode: Literal["WAL", "DELETE", "TRUNCATE", "MEMORY"] = "WAL"
+    db_sqlite_synchronous: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"
+    db_sqlite_busy_timeout_ms: int = 5000
+    db_sqlite_cache_size_kib: int = 65536
+    db_sqlite_mmap_size_bytes: int = 268435456
+    db_sqlite_foreign_keys: bool = True
+    db_replica_urls: list[str] = []
+    # reads go to the primary this long after a client's write; the write time travels in the last_write cookie,
+    # so clients that do not send cookies back read from the replicas right away
+    db_read_your_writes_seconds: float = 5
+    slow_request_seconds: float = 1.0
+    storage_dir: str = "storage"
+    chunk_gc_interval_seconds: float = 3600
+    chunk_gc_grace_seconds: float = 3600
+    preview_workers: int = 2
+    preview_max_side: int = 256
+    preview_cache_max_bytes: int = 268435456
+    preview_failure_ttl_seconds: float = 600
+    preview_max_input_bytes: int = 268435456
 
     model_config = SettingsConfigDict(env_file=".env")
 
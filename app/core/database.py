@@ -1,22 +1,208 @@
-
+import itertools, secrets, time
+from fastapi import Request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, Session
 
-from app.core.config import get_settings
+from app.core.config import get_settings, Settings
 
 DB_URL = get_settings().db_url
 
 Base = declarative_base()
 
-db_engine = create_async_engine(DB_URL, echo = False)
+
+def first_row_version() -> int:
+    # a row's row_version is its ETag. ids of deleted rows can come back (SQLite hands out the highest id
+    # again), so new rows start at a random version instead of 1 and a reused id does not revive old tags
+    return secrets.randbits(30) + 1
+
+
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """queue pool that also counts checkouts in progress and checkout timeouts"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.timeouts = 0
+
+    def _do_get(self):
+        self.waiting += 1
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.timeouts = self.timeouts
+        return pool
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url: str, settings: Settings) -> dict:
+    url = make_url(url)
+    options = {"echo": False, "query_cache_size": settings.db_query_cache_size}
+    # in-memory sqlite lives on a single shared connection, there is nothing to size
+    if not _is_memory_sqlite(url):
+        options.update(poolclass=MonitoredQueuePool,
+                       pool_size=settings.db_pool_size,
+                       max_overflow=settings.db_max_overflow,
+                       pool_timeout=settings.db_pool_timeout_seconds,
+                       pool_recycle=settings.db_pool_recycle_seconds,
+                       pool_pre_ping=settings.db_pool_pre_ping)
+    return options
+
+
+def apply_sqlite_profile(engine, settings: Settings):
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = [f"PRAGMA busy_timeout = {settings.db_sqlite_busy_timeout_ms}",
+               f"PRAGMA synchronous = {settings.db_sqlite_synchronous}",
+               f"PRAGMA cache_size = -{settings.db_sqlite_cache_size_kib}",
+               f"PRAGMA mmap_size = {settings.db_sqlite_mmap_size_bytes}",
+               "PRAGMA temp_store = MEMORY",
+               # off by default in sqlite; deletes rely on ON DELETE CASCADE like on any other database
+               f"PRAGMA foreign_keys = {'ON' if settings.db_sqlite_foreign_keys else 'OFF'}"]
+    if not _is_memory_sqlite(engine.url):
+        pragmas.insert(0, f"PRAGMA journal_mode = {settings.db_sqlite_journal_mode}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def create_engine(url: str, settings: Settings):
+    engine = create_async_engine(url, **engine_options(url, settings))
+    apply_sqlite_profile(engine, settings)
+    return engine
+
+
+def pool_stats(engine=None) -> dict:
+    pool = (engine or db_engine).pool
+    if not isinstance(pool, MonitoredQueuePool):
+        return {"pool": type(pool).__name__}
+    return {"pool": type(pool).__name__, "size": pool.size(), "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(), "overflow": pool.overflow(),
+            "waiting": pool.waiting, "timeouts": pool.timeouts}
+
+
+class ReadRouter:
+    """hands out read sessions: replicas round-robin, primary for clients that wrote in the last few seconds"""
+
+    def __init__(self, primary: async_sessionmaker, replicas: list[async_sessionmaker], sticky_seconds: float):
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self._next_replica = itertools.cycle(range(len(replicas)))
+
+    def sticky(self, last_write: float | None) -> bool:
+        return last_write is not None and time.time() - last_write < self.sticky_seconds
+
+    async def session(self, last_write: float | None = None) -> AsyncSession:
+        if self.sticky(last_write):
+            return self.primary()
+        start = next(self._next_replica, 0)
+        for offset in range(len(self.replicas)):
+            db = self.replicas[(start + offset) % len(self.replicas)]()
+            try:
+                await db.connection()
+                db.info["replica"] = True
+                return db
+            except (exc.DBAPIError, OSError):
+                # replica is down, try the next one and fall back to the primary last
+                await db.close()
+        return self.primary()
+
+
+def on_replica(db: AsyncSession) -> bool:
+    """whether a read session was handed to a replica, which may lag the primary"""
+    return db.info.get("replica", False)
+
+
+# the time of a client's last write travels with the client, so whichever worker serves its next read knows
+# about it; the server keeps nothing per client. a client that drops the cookie only loses the stickiness
+LAST_WRITE_COOKIE = "last_write"
+
+
+def _last_write(request: Request) -> float | None:
+    try:
+        return float(request.cookies[LAST_WRITE_COOKIE])
+    except (KeyError, ValueError):
+        return None
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_write(session):
+    request_state = session.info.get("request_state")
+    if request_state is not None:
+        request_state["last_write"] = time.time()
+
+
+class ReadYourWritesMiddleware:
+    """sets the last write cookie on responses to requests that committed something"""
+
+    def __init__(self, app, sticky_seconds: float):
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # the same dict request.state writes to, the session sees it through get_db_session
+        request_state = scope.setdefault("state", {})
+
+        async def send_with_cookie(message):
+            last_write = request_state.get("last_write")
+            if message["type"] == "http.response.start" and last_write is not None:
+                cookie = f"{LAST_WRITE_COOKIE}={last_write:.3f}; Max-Age={max(int(self.sticky_seconds), 1)}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+settings = get_settings()
+
+db_engine = create_engine(DB_URL, settings)
 
 async_session_local = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
 
-async def get_db_session():
+replica_engines = [create_engine(url, settings) for url in settings.db_replica_urls]
+
+read_router = ReadRouter(async_session_local,
+                         [async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) for engine in replica_engines],
+                         settings.db_read_your_writes_seconds)
+
+async def get_db_session(request: Request):
     
     db = async_session_local()
+    db.sync_session.info["request_state"] = request.scope.get("state")
     try:
         yield db
     finally:
         await db.close()
 
+
+def get_db_sessionmaker() -> async_sessionmaker:
+    # for dependencies that only need the database now and then, a session costs nothing until it is opened
+    return async_session_local
+
+
+async def get_db_read_session(request: Request):
+
+    db = await read_router.session(_last_write(request))
+    try:
+        yield db
+    finally:
+        await db.close()
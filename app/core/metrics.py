@@ -0,0 +1,136 @@
+import bisect, logging, time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+
+
+# the stats object is shared by reference, so queries run in sqlalchemy's greenlets and in child tasks still count
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["statement_started"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+@event.listens_for(Engine, "handle_error")
+def _abort_statement(exception_context):
+    started = exception_context.connection.info.get("statement_started") if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# every histogram made, wherever it lives, shows up on /metrics
+_histograms: list["Histogram"] = []
+
+
+class Histogram:
+    """cumulative prometheus histogram, one series per label tuple"""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        _histograms.append(self)
+
+    def observe(self, label_values: tuple, value: float):
+        series = self._series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self._series.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+request_latency = Histogram("http_request_duration_seconds", "Request latency by route.",
+                            ("method", "route", "status"), LATENCY_BUCKETS)
+request_statements = Histogram("http_request_sql_statements", "SQL statements issued per request.",
+                               ("method", "route"), STATEMENT_BUCKETS)
+request_db_time = Histogram("http_request_db_seconds", "Time spent in SQL per request.",
+                            ("method", "route"), LATENCY_BUCKETS)
+
+
+def gauges(prefix: str, stats: dict) -> list[str]:
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, (int, float)):
+            lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+    return lines
+
+
+def render(extra: dict[str, dict] | None = None) -> str:
+    lines = [line for histogram in _histograms for line in histogram.render()]
+    for prefix, stats in (extra or {}).items():
+        lines += gauges(prefix, stats)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """times every http request until its last body chunk is sent, streaming responses included"""
+
+    def __init__(self, app, slow_request_seconds: float):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            # the route template, not the raw path, keeps the label set bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            request_latency.observe((method, route, status), elapsed)
+            request_statements.observe((method, route), stats.statements)
+            request_db_time.observe((method, route), stats.db_seconds)
+            if elapsed >= self.slow_request_seconds:
+                logger.warning("slow request %s %s took %.3fs (%d statements, %.3fs in db)",
+                               method, scope["path"], elapsed, stats.statements, stats.db_seconds)
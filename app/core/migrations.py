@@ -0,0 +1,81 @@
+import logging
+from sqlalchemy import Connection, inspect, select, update, func, text
+from sqlalchemy.schema import CreateColumn
+
+from app.models.asset import Asset, AssetVersion
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# columns added to tables that already existed. create_all only creates missing tables, so a database
+# from before them gets them here, through ALTER TABLE, and their values are backfilled from the rows
+ADDED_COLUMNS = [
+    Asset.__table__.c.latest_version_id,
+    Asset.__table__.c.latest_published_version_id,
+    Asset.__table__.c.last_version_number,
+    Asset.__table__.c.row_version,
+    AssetVersion.__table__.c.checksum,
+    AssetVersion.__table__.c.size,
+    AssetVersion.__table__.c.row_version,
+    User.__table__.c.row_version,
+]
+
+VERSION_NUMBER_UNIQUE = "uq_asset_versions_asset_id_version_number"
+
+
+def _add_columns(connection: Connection) -> set[str]:
+    inspector = inspect(connection)
+    existing = {table: {column["name"] for column in inspector.get_columns(table)}
+                for table in {column.table.name for column in ADDED_COLUMNS}}
+    added = set()
+    for column in ADDED_COLUMNS:
+        if column.name not in existing[column.table.name]:
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {ddl}"))
+            added.add(f"{column.table.name}.{column.name}")
+    return added
+
+
+def _add_indexes(connection: Connection):
+    for table in (Asset.__table__, AssetVersion.__table__):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+    inspector = inspect(connection)
+    if any(VERSION_NUMBER_UNIQUE in (entry["name"] for entry in found)
+           for found in (inspector.get_unique_constraints("asset_versions"), inspector.get_indexes("asset_versions"))):
+        return
+    # a unique index does the constraint's job, SQLite can not add constraints to an existing table
+    try:
+        with connection.begin_nested():
+            connection.execute(text(f"CREATE UNIQUE INDEX {VERSION_NUMBER_UNIQUE} ON asset_versions (asset_id, version_number)"))
+    except Exception as e:
+        # data from before the constraint can repeat a version number, it has to be cleaned up by hand
+        logger.warning("version numbers are not unique per asset, %s was not created: %s", VERSION_NUMBER_UNIQUE, e)
+
+
+def _backfill(connection: Connection, added: set[str]):
+    def newest(*criteria):
+        return (select(AssetVersion.id).where(AssetVersion.asset_id == Asset.id, *criteria)
+                .order_by(AssetVersion.version_number.desc()).limit(1).scalar_subquery())
+
+    values = {}
+    if "assets.latest_version_id" in added:
+        values["latest_version_id"] = newest()
+    if "assets.latest_published_version_id" in added:
+        values["latest_published_version_id"] = newest(AssetVersion.status == "Published")
+    if "assets.last_version_number" in added:
+        values["last_version_number"] = (select(func.coalesce(func.max(AssetVersion.version_number), 0))
+                                         .where(AssetVersion.asset_id == Asset.id).scalar_subquery())
+    if values:
+        # last_update is kept, nothing about the assets changed
+        connection.execute(update(Asset.__table__).values(last_update=Asset.__table__.c.last_update, **values))
+
+
+def upgrade(connection: Connection):
+    """brings a database created by an older release up to the current models; runs after create_all"""
+    added = _add_columns(connection)
+    _add_indexes(connection)
+    _backfill(connection, added)
+    if added:
+        logger.info("added columns %s", ", ".join(sorted(added)))
@@ -0,0 +1,25 @@
+import re
+from fastapi import HTTPException
+
+
+# rows that can be edited carry a row_version counter, bumped by every update; it is their ETag
+_ROW_ETAG = re.compile(r'"(\d+)"')
+
+def precondition_failed() -> HTTPException:
+    # a fresh exception every time, a shared one would carry the traceback of every request that raised it
+    return HTTPException(status_code=412, detail="Precondition Failed, The Resource Has Changed")
+
+
+def row_etag(row_version: int) -> str:
+    return f'"{row_version}"'
+
+
+def expected_row_versions(if_match: str | None) -> list[int] | None:
+    """the row versions an If-Match header accepts, None when any version will do"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    # If-Match uses strong comparison, so weak tags and tags that are not row versions never match
+    versions = [int(match.group(1)) for tag in if_match.split(",") if (match := _ROW_ETAG.fullmatch(tag.strip()))]
+    if not versions:
+        raise precondition_failed()
+    return versions
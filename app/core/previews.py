@@ -0,0 +1,246 @@
+import asyncio, bisect, io, itertools, logging, os, pathlib, tempfile, time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core import metrics, storage
+from app.core.config import get_settings
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+JOB_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class NotAnImage(Exception):
+    pass
+
+
+class ChunkReader(io.RawIOBase):
+    """the content of (path, size) chunks as one seekable file, each read served from the chunk file it falls in"""
+
+    def __init__(self, chunks: list[tuple[str, int]]):
+        self.chunks = chunks
+        self.starts = list(itertools.accumulate((size for _, size in chunks), initial=0))
+        self.position = 0
+        self._file, self._index = None, None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.starts[-1]}[whence]
+        self.position = max(base + offset, 0)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        # fills the buffer across chunk boundaries, a short read only happens at the end of the content
+        view, filled = memoryview(buffer), 0
+        while filled < len(view) and self.position < self.starts[-1]:
+            index = bisect.bisect_right(self.starts, self.position) - 1
+            if index != self._index:
+                self._close_chunk()
+                self._file, self._index = open(self.chunks[index][0], "rb"), index
+            self._file.seek(self.position - self.starts[index])
+            count = self._file.readinto(view[filled:filled + self.starts[index + 1] - self.position])
+            if count == 0:
+                # the chunk file is shorter than the manifest says
+                break
+            filled += count
+            self.position += count
+        return filled
+
+    def _close_chunk(self):
+        if self._file is not None:
+            self._file.close()
+            self._file, self._index = None, None
+
+    def close(self):
+        self._close_chunk()
+        super().close()
+
+
+def render_preview(chunks: list[tuple[str, int]], max_side: int) -> bytes:
+    """downscaled png of the image stored in chunks, (path, size) each; runs in a worker process"""
+    # pillow is only needed where previews are made, the api itself runs without it
+    from PIL import Image
+
+    # pillow reads and seeks as it decodes, a worker never holds more of the content than its buffers
+    try:
+        with io.BufferedReader(ChunkReader(chunks), buffer_size=1 << 20) as f, Image.open(f) as image:
+            # draft lets jpeg decode at a reduced scale straight away, other formats ignore it
+            image.draft("RGB", (max_side, max_side))
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            if image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+            out = io.BytesIO()
+            image.save(out, format="PNG", optimize=False)
+    except FileNotFoundError:
+        # a chunk that is not on disk says nothing about the content
+        raise
+    except (OSError, Image.DecompressionBombError) as e:
+        # any other OSError is pillow failing to decode the bytes (UnidentifiedImageError is one);
+        # pillow's own exception types stay in the worker
+        raise NotAnImage(str(e)) from None
+    return out.getvalue()
+
+
+class PreviewCache:
+    """finished previews on disk, one file per checksum, least recently served removed past max_bytes"""
+
+    def __init__(self, max_side: int, max_bytes: int):
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.evicted = 0
+
+    def path(self, checksum: str) -> pathlib.Path:
+        # resolved per call, STORAGE_DIR is the single place that says where files live
+        return storage.STORAGE_DIR / "previews" / f"{checksum}-{self.max_side}.png"
+
+    @staticmethod
+    def _touch(path: pathlib.Path):
+        # the mtime is the recency the eviction goes by. it is set from time.time() every time,
+        # the kernel's own "now" can be coarser than the write timestamps it is compared with
+        now = time.time()
+        os.utime(path, (now, now))
+
+    def get(self, checksum: str) -> pathlib.Path | None:
+        path = self.path(checksum)
+        try:
+            self._touch(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, checksum: str, data: bytes):
+        path = self.path(checksum)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+        self._touch(path)
+        self._evict(keep=path)
+
+    def _evict(self, keep: pathlib.Path):
+        entries = []
+        for entry in os.scandir(keep.parent):
+            if entry.name.endswith(".png"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == str(keep):
+                continue
+            pathlib.Path(path).unlink(missing_ok=True)
+            total -= size
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {"max_bytes": self.max_bytes, "evicted": self.evicted}
+
+
+class PreviewPipeline:
+    """renders previews off the event loop, at most max_concurrency at a time, one job per checksum"""
+
+    def __init__(self, executor_factory: Callable[[], Executor], max_concurrency: int, cache: PreviewCache, failure_ttl_seconds: float,
+                 max_input_bytes: int):
+        self.executor_factory = executor_factory
+        self.executor = executor_factory()
+        self.cache = cache
+        self.max_input_bytes = max_input_bytes
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._jobs: dict[str, asyncio.Task] = {}
+        # only content pillow could not decode is remembered, so it is not retried on every request for it
+        self._failures = TTLCache(maxsize=4096, ttl=failure_ttl_seconds)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.job_latency = metrics.Histogram("preview_job_duration_seconds", "Time from queueing a preview to having it on disk.",
+                                             ("outcome",), JOB_BUCKETS)
+
+    def failed_for(self, checksum: str) -> bool:
+        return self._failures.get(checksum) is not None
+
+    def pending(self, checksum: str) -> bool:
+        return checksum in self._jobs
+
+    def too_large(self, size: int) -> bool:
+        return size > self.max_input_bytes
+
+    def submit(self, checksum: str, manifest: list[tuple[str, int]]) -> bool:
+        """queues a preview of the content unless one is cached, queued or recently failed, or it is too large to decode"""
+        if checksum in self._jobs or self.failed_for(checksum) or self.cache.path(checksum).exists():
+            return False
+        if self.too_large(sum(size for _, size in manifest)):
+            return False
+        task = asyncio.create_task(self._render(checksum, [(str(storage.chunk_path(chunk_hash)), size) for chunk_hash, size in manifest]))
+        self._jobs[checksum] = task
+        task.add_done_callback(lambda _: self._jobs.pop(checksum, None))
+        return True
+
+    async def _render(self, checksum: str, chunks: list[tuple[str, int]]):
+        self.queued += 1
+        queued_at = time.perf_counter()
+        outcome = "failed"
+        try:
+            async with self._semaphore:
+                self.queued -= 1
+                self.running += 1
+                executor = self.executor
+                try:
+                    data = await asyncio.get_running_loop().run_in_executor(executor, render_preview, chunks, self.cache.max_side)
+                    await asyncio.to_thread(self.cache.put, checksum, data)
+                    outcome = "ok"
+                    self.completed += 1
+                except NotAnImage as e:
+                    self.failed += 1
+                    self._failures.set(checksum, True)
+                    logger.info("content %s is not a readable image: %s", checksum, e)
+                except BrokenProcessPool:
+                    # a worker died (killed, out of memory); the pool refuses all further jobs until replaced
+                    self.failed += 1
+                    self._replace_executor(executor)
+                    logger.warning("preview of %s failed, the worker pool broke and was replaced", checksum)
+                except Exception as e:
+                    # a missing chunk, a full disk: nothing wrong with the content, the next request tries again
+                    self.failed += 1
+                    logger.warning("preview of %s failed: %s", checksum, e)
+                finally:
+                    self.running -= 1
+        finally:
+            self.job_latency.observe((outcome,), time.perf_counter() - queued_at)
+
+    def _replace_executor(self, broken: Executor):
+        # every job that was on the broken pool ends up here, only the first one replaces it
+        if self.executor is broken:
+            self.executor = self.executor_factory()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def drain(self):
+        while self._jobs:
+            await asyncio.gather(*list(self._jobs.values()), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"queued": self.queued, "running": self.running, "completed": self.completed, "failed": self.failed,
+                **{f"cache_{key}": value for key, value in self.cache.stats().items()}}
+
+
+def _pipeline(settings) -> PreviewPipeline:
+    # decoding and resampling hold the gil, so they get processes; the workers start on the first job
+    return PreviewPipeline(lambda: ProcessPoolExecutor(max_workers=settings.preview_workers), settings.preview_workers,
+                           PreviewCache(settings.preview_max_side, settings.preview_cache_max_bytes),
+                           settings.preview_failure_ttl_seconds, settings.preview_max_input_bytes)
+
+pipeline = _pipeline(get_settings())
@@ -1,20 +1,20 @@
-import jwt
+import asyncio, jwt, time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import timedelta, datetime, timezone
 from jwt.exceptions import InvalidTokenError
 from fastapi import Depends, HTTPException
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.future import select
 
 from typing import Annotated
-from pydantic import ValidationError
 
 import app.core.utils as util
-from app.core.database import get_db_session
+from app.core.cache import TTLCache
+from app.core.database import get_db_sessionmaker
 from app.core.config import Settings, get_settings
 from app.models.user import User
-from app.schemas.token import TokenData
 from app.schemas.user import UserInDb
 import app.repositories as repositories
 
@@ -24,6 +24,10 @@ oauth_scheme = OAuth2PasswordBearer(
                         )
 pwd_cntx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# authenticated users by id, so protected routes skip the user lookup on every request.
+# the cache is per process: repositories.user invalidates it on update/delete, other workers rely on the ttl
+principal_cache = TTLCache(maxsize=get_settings().principal_cache_size, ttl=get_settings().principal_cache_ttl_seconds)
+
 CREDENTIAL_EXCEPTION = HTTPException(status_code=401, detail="not a valid user", headers={"WWW-Authenticate": "Bearer"})
 
 
@@ -34,6 +38,49 @@ def check_plain_password(plain_password: str, hashed_password:str) -> bool:
     return pwd_cntx.verify(plain_password, hashed_password)
 
 
+class PasswordWorkPool:
+    """runs bcrypt on a bounded executor so a login never blocks the event loop"""
+
+    def __init__(self, executor: Executor, max_concurrency: int):
+        self.executor = executor
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_seconds_total = 0.0
+
+    async def run(self, fn, *args):
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        async with self._semaphore:
+            self.waiting -= 1
+            self.wait_seconds_total += time.perf_counter() - queued_at
+            self.running += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            finally:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        return {"waiting": self.waiting, "running": self.running, "completed": self.completed,
+                "wait_seconds_total": self.wait_seconds_total}
+
+
+def _password_executor(settings: Settings) -> Executor:
+    if settings.password_hash_executor == "process":
+        return ProcessPoolExecutor(max_workers=settings.password_hash_workers)
+    return ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password")
+
+password_pool = PasswordWorkPool(_password_executor(get_settings()), get_settings().password_hash_workers)
+
+async def hash_plain_password_async(password: str) -> str:
+    return await password_pool.run(hash_plain_password, password)
+
+async def check_plain_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(check_plain_password, plain_password, hashed_password)
+
+
 def create_access_token(settings: Settings, data: dict, expires_delta: timedelta|None=None):
     to_be_encoded = data.copy()
 
@@ -50,7 +97,7 @@ def create_access_token(settings: Settings, data: dict, expires_delta: timedelta
 def one_or_more_scopes(required_scopes: list[str]):
     async def _one_or_more_scopes(user: Annotated[UserInDb, Depends(get_current_user)]):
         user_avaiable_scopes = util.get_scopes(user.roles)
-        if not any(scope in user_avaiable_scopes for scope in required_scopes):
+        if not any(util.scope_granted(user_avaiable_scopes, scope) for scope in required_scopes):
             raise HTTPException(status_code=401, detail="User Not Authorized To Access")
         return user
     return _one_or_more_scopes
@@ -61,7 +108,7 @@ async def authenticate_user(username: str, password: str, db_session: AsyncSessi
     if user_in_db is None:
         raise CREDENTIAL_EXCEPTION
 
-    if not check_plain_password(password, user_in_db.password):
+    if not await check_plain_password_async(password, user_in_db.password):
         raise CREDENTIAL_EXCEPTION
     user_in_db = UserInDb.model_validate(user_in_db)
     return user_in_db
@@ -71,7 +118,7 @@ async def authenticate_user(username: str, password: str, db_session: AsyncSessi
 async def get_current_user(
             security_scopes: SecurityScopes,
             token: Annotated[str, Depends(oauth_scheme)],
-            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            session_local: Annotated[async_sessionmaker, Depends(get_db_sessionmaker)],
             settings: Annotated[Settings, Depends(get_settings)]) -> UserInDb:
     
     if security_scopes.scopes:
@@ -94,15 +141,23 @@ async def get_current_user(
         userid = int(userid)
         role: str = payload.get("role", "")
         token_scopes = util.get_scopes(role)
-        token_scope_list = token_scopes.split()
-        token_data = TokenData(user_id=userid, scopes=token_scope_list, role=[role])
-    except (InvalidTokenError, ValidationError):
+    except (InvalidTokenError, ValueError):
         raise CREDENTIAL_EXCEPTION
     
-    user_in_db = await repositories.user.get_user_by_id(userid, db_session)
-    user_in_db = UserInDb.model_validate(user_in_db)
+    user_in_db = principal_cache.get(userid)
+    if user_in_db is None:
+        # taken before the lookup, so a user updated or deleted while it runs is not cached as it was
+        generation = principal_cache.generation(userid)
+        # the primary is only opened on a miss, so a cached principal costs a read request no second session
+        async with session_local() as db_session:
+            user_in_db = await repositories.user.get_user_by_id(userid, db_session)
+        if user_in_db is None:
+            raise CREDENTIAL_EXCEPTION
+        user_in_db = UserInDb.model_validate(user_in_db)
+        # never keep a principal around longer than the token that produced it
+        principal_cache.set(userid, user_in_db, ttl=payload.get("exp", 0) - time.time(), generation=generation)
     for scope in security_scopes.scopes:
-        if scope not in token_data.scopes:
+        if not util.scope_granted(token_scopes, scope):
             raise HTTPException(
                 status_code=401,
                 detail="Not enough permissions",
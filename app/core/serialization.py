@@ -0,0 +1,20 @@
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=64)
+def type_adapter(tp: Any) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+
+def dump_json(tp: Any, value: Any) -> bytes:
+    # ORM rows are validated once, straight into the output model, and written out by pydantic-core
+    adapter = type_adapter(tp)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+def json_response(tp: Any, value: Any, **kwargs) -> Response:
+    return Response(content=dump_json(tp, value), media_type="application/json", **kwargs)
@@ -0,0 +1,229 @@
+import asyncio, hashlib, os, pathlib, random, tempfile
+from collections.abc import AsyncIterator
+
+from app.core.config import get_settings
+
+
+STORAGE_DIR = pathlib.Path(get_settings().storage_dir).resolve()
+# request chunks are small (64KiB or less); they are coalesced so each disk write and hash update
+# is one thread hop per MiB instead of per chunk
+WRITE_BUFFER_BYTES = 1 << 20
+READ_BUFFER_BYTES = 1 << 20
+CHUNK_FILE_BLOCK_BYTES = 8 << 20
+
+# content-defined chunking: a chunk ends after RUN_LENGTH consecutive bytes that _RUN_BITS maps to 1
+# (half of all byte values, picked once), so cut points depend only on the bytes right before them
+# and an edit only moves the cuts around it. both steps are a translate and a find, no python-level
+# loop per byte. a run of RUN_LENGTH such bytes turns up about every 2**(RUN_LENGTH + 1) bytes, ~2MiB for 20;
+# with CHUNK_MAX_BYTES cutting the long ones, benchmarks.dedup measures ~1.7MiB per chunk
+CHUNK_MIN_BYTES = 256 << 10
+CHUNK_MAX_BYTES = 4 << 20
+RUN_LENGTH = 20
+_RUN_BITS = bytes(1 if bit else 0 for bit in random.Random(0x5EED).sample([True] * 128 + [False] * 128, 256))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def upload_path(upload_id: str) -> pathlib.Path:
+    return STORAGE_DIR / "uploads" / upload_id
+
+def chunk_path(chunk_hash: str) -> pathlib.Path:
+    return STORAGE_DIR / "chunks" / chunk_hash[:2] / chunk_hash
+
+def content_uri(checksum: str) -> str:
+    # what file_path holds for versions whose bytes live in the chunk store
+    return f"cas://{checksum}"
+
+def is_managed(file_path: str) -> bool:
+    return file_path.startswith("cas://")
+
+def content_checksum(file_path: str) -> str:
+    return file_path.removeprefix("cas://")
+
+
+# sha256 state of each upload, as of the offset stored next to it. it is only a shortcut:
+# a missing or stale entry (restart, another worker took a part) is rebuilt from the bytes on disk
+_hashers: dict[str, tuple[int, "hashlib._Hash"]] = {}
+
+
+def _hash_prefix(path: pathlib.Path, length: int) -> "hashlib._Hash":
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while length > 0:
+            block = f.read(min(READ_BUFFER_BYTES, length))
+            if not block:
+                break
+            hasher.update(block)
+            length -= len(block)
+    return hasher
+
+
+async def _hasher_at(upload_id: str, offset: int) -> "hashlib._Hash":
+    cached = _hashers.get(upload_id)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    return await asyncio.to_thread(_hash_prefix, upload_path(upload_id), offset)
+
+
+def create_upload(upload_id: str):
+    path = upload_path(upload_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    _hashers[upload_id] = (0, hashlib.sha256())
+
+
+async def append(upload_id: str, offset: int, chunks: AsyncIterator[bytes], limit: int | None = None) -> int:
+    """writes chunks at offset and returns the new end of the upload. bytes past offset, left by
+    an earlier part that failed, are dropped first"""
+    hasher = await _hasher_at(upload_id, offset)
+    _hashers.pop(upload_id, None)
+    f = open(upload_path(upload_id), "r+b")
+    try:
+        f.truncate(offset)
+        f.seek(offset)
+
+        def flush(block: bytes):
+            f.write(block)
+            hasher.update(block)
+
+        pending, size = [], 0
+        try:
+            async for chunk in chunks:
+                if limit is not None and offset + size + len(chunk) > limit:
+                    raise UploadTooLarge
+                pending.append(chunk)
+                size += len(chunk)
+                if size >= WRITE_BUFFER_BYTES:
+                    await asyncio.to_thread(flush, b"".join(pending))
+                    offset, pending, size = offset + size, [], 0
+        finally:
+            if pending:
+                await asyncio.to_thread(flush, b"".join(pending))
+                offset += size
+            await asyncio.to_thread(f.flush)
+    finally:
+        f.close()
+    _hashers[upload_id] = (offset, hasher)
+    return offset
+
+
+async def digest(upload_id: str, offset: int) -> str:
+    hasher = await _hasher_at(upload_id, offset)
+    _hashers[upload_id] = (offset, hasher)
+    return hasher.hexdigest()
+
+
+def _next_cut(bits: bytes, start: int, end: int, eof: bool) -> int | None:
+    # end of the chunk starting at start, None when it can not be known before more bytes arrive
+    if end - start <= CHUNK_MIN_BYTES:
+        return end if eof else None
+    limit = min(end, start + CHUNK_MAX_BYTES)
+    run = bits.find(b"\x01" * RUN_LENGTH, start + CHUNK_MIN_BYTES - RUN_LENGTH, limit)
+    if run != -1:
+        return run + RUN_LENGTH
+    if limit == start + CHUNK_MAX_BYTES or eof:
+        return limit
+    return None
+
+def split(data: bytes) -> list[bytes]:
+    """the chunks the store would cut data into; clients use it to upload only the chunks that are missing"""
+    bits, chunks, start = data.translate(_RUN_BITS), [], 0
+    while start < len(data):
+        cut = _next_cut(bits, start, len(data), eof=True)
+        chunks.append(data[start:cut])
+        start = cut
+    return chunks
+
+def has_chunk(chunk_hash: str) -> bool:
+    return chunk_path(chunk_hash).exists()
+
+def hold_chunks(chunk_hashes: list[str]) -> list[str]:
+    """marks the chunks as just used, like put_chunk does for a chunk sent again, so garbage collection
+    leaves their files alone; returns the ones that are not on disk"""
+    missing = []
+    for chunk_hash in chunk_hashes:
+        try:
+            os.utime(chunk_path(chunk_hash))
+        except FileNotFoundError:
+            missing.append(chunk_hash)
+    return missing
+
+def put_chunk(data: bytes) -> tuple[str, int]:
+    chunk_hash = hashlib.sha256(data).hexdigest()
+    path = chunk_path(chunk_hash)
+    if path.exists():
+        # reused, so garbage collection that already picked it must leave it alone
+        os.utime(path)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed, a reader never sees half a chunk
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+    return chunk_hash, len(data)
+
+def chunk_file(path: pathlib.Path) -> list[tuple[str, int]]:
+    """cuts a file into the chunk store and returns its manifest, (sha256, size) per chunk in order"""
+    manifest, buffer, bits, eof = [], b"", b"", False
+    with open(path, "rb") as f:
+        while not eof or buffer:
+            if not eof:
+                block = f.read(CHUNK_FILE_BLOCK_BYTES)
+                eof = not block
+                buffer, bits = buffer + block, bits + block.translate(_RUN_BITS)
+            start = 0
+            while start < len(buffer) and (cut := _next_cut(bits, start, len(buffer), eof)) is not None:
+                manifest.append(put_chunk(buffer[start:cut]))
+                start = cut
+            buffer, bits = buffer[start:], bits[start:]
+    return manifest
+
+def remove_chunks(chunk_hashes: list[str], unused_since: float) -> list[str]:
+    """removes the chunk files not used since unused_since and returns the ones that were, which are kept"""
+    kept = []
+    for chunk_hash in chunk_hashes:
+        path = chunk_path(chunk_hash)
+        try:
+            if path.stat().st_mtime <= unused_since:
+                path.unlink()
+            else:
+                kept.append(chunk_hash)
+        except FileNotFoundError:
+            pass
+    return kept
+
+
+def _read(path: pathlib.Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+async def read_range(manifest: list[tuple[str, int]], start: int, end: int) -> AsyncIterator[bytes]:
+    """bytes [start, end) of the content described by manifest, streamed from the chunks that hold them"""
+    position = 0
+    for chunk_hash, size in manifest:
+        low, high = max(start - position, 0), min(end - position, size)
+        position += size
+        while low < high:
+            block = await asyncio.to_thread(_read, chunk_path(chunk_hash), low, min(READ_BUFFER_BYTES, high - low))
+            low += len(block)
+            yield block
+        if position >= end:
+            break
+
+def _hash_chunks(manifest: list[tuple[str, int]]) -> str:
+    hasher = hashlib.sha256()
+    for chunk_hash, _ in manifest:
+        with open(chunk_path(chunk_hash), "rb") as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+async def manifest_digest(manifest: list[tuple[str, int]]) -> str:
+    return await asyncio.to_thread(_hash_chunks, manifest)
+
+
+def discard(upload_id: str):
+    _hashers.pop(upload_id, None)
+    upload_path(upload_id).unlink(missing_ok=True)
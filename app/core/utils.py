@@ -1,14 +1,56 @@
-import json, pathlib
+import asyncio, json, logging, pathlib
+from functools import lru_cache
+from types import MappingProxyType
 
 
-with open(pathlib.Path(__file__).parent / "permissions.json") as f:
-    roles_access_scope = json.load(f)
+PERMISSIONS_FILE = pathlib.Path(__file__).parent / "permissions.json"
 
+logger = logging.getLogger(__name__)
 
-def get_scopes(role: str) -> str:
-    roles = role.split()
-    res = ""
-    for rl in roles:
-        for scope in roles_access_scope.get(rl, ""):
-            res = res + scope + " "
-    return res
\ No newline at end of file
+
+def _load_permissions() -> MappingProxyType:
+    with open(PERMISSIONS_FILE) as f:
+        raw = json.load(f)
+    return MappingProxyType({role: frozenset(scopes) for role, scopes in raw.items()})
+
+
+roles_access_scope = _load_permissions()
+
+
+@lru_cache(maxsize=256)
+def get_scopes(role: str) -> frozenset[str]:
+    scopes = frozenset()
+    for rl in role.split():
+        scopes = scopes | roles_access_scope.get(rl, frozenset())
+    return scopes
+
+
+@lru_cache(maxsize=256)
+def _covering_scopes(required: str) -> tuple[str, ...]:
+    # "asset:edit:me" is covered by itself, "asset:edit:*", "asset:*" and "*"
+    parts = required.split(":")
+    return (required, *(":".join(parts[:i] + ["*"]) for i in range(len(parts) - 1, -1, -1)))
+
+
+def scope_granted(scopes: frozenset[str], required: str) -> bool:
+    return any(scope in scopes for scope in _covering_scopes(required))
+
+
+def reload_permissions():
+    global roles_access_scope
+    roles_access_scope = _load_permissions()
+    get_scopes.cache_clear()
+
+
+async def watch_permissions(interval: float):
+    last_mtime = PERMISSIONS_FILE.stat().st_mtime
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            mtime = PERMISSIONS_FILE.stat().st_mtime
+            if mtime != last_mtime:
+                last_mtime = mtime
+                reload_permissions()
+        except (OSError, ValueError) as e:
+            # keep serving the last good permissions until the file is fixed
+            logger.warning("could not reload %s: %s", PERMISSIONS_FILE, e)
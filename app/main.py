@@ -1,30 +1,68 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 
-from app.routers import users, auth, assets
+from app.routers import users, auth, assets, uploads
 
-from app.core import config
+from app.core import config, utils, security, metrics, previews, migrations
 
 
 from typing import Annotated
 
 from app.core import database
+from app.repositories import asset as asset_repo
+from app.repositories import chunk as chunk_repo
 from app.models.user import User
+from app.core.security import one_or_more_scopes
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with database.db_engine.begin() as connection:
         await connection.run_sync(database.Base.metadata.create_all)
+        await connection.run_sync(migrations.upgrade)
+
+    settings = config.get_settings()
+    background_tasks = []
+    if settings.permissions_reload_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(utils.watch_permissions(settings.permissions_reload_interval_seconds)))
+    if settings.chunk_gc_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(chunk_repo.watch_garbage(settings.chunk_gc_interval_seconds,
+                                                                             settings.chunk_gc_grace_seconds)))
     yield
+    for task in background_tasks:
+        task.cancel()
+    security.password_pool.executor.shutdown(wait=False)
+    previews.pipeline.executor.shutdown(wait=False, cancel_futures=True)
+    await database.db_engine.dispose()
+    for replica_engine in database.replica_engines:
+        await replica_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware, slow_request_seconds=config.get_settings().slow_request_seconds)
+app.add_middleware(database.ReadYourWritesMiddleware, sticky_seconds=config.get_settings().db_read_your_writes_seconds)
 
 app.include_router(users.router)
 app.include_router(auth.router)
 app.include_router(assets.router)
+app.include_router(uploads.router)
 
 @app.get("/root")
 async def get_root():
     return {"we are alive!": "from Root"}
 
+# pool, cache and worker internals are for operators and their scrapers, a "monitor" role carries nothing else
+MONITORING = Depends(one_or_more_scopes(["system:*", "system:monitor"]))
+
+@app.get("/health/db", dependencies=[MONITORING])
+async def get_db_health():
+    return database.pool_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[MONITORING])
+async def get_metrics():
+    return metrics.render({"db_pool": database.pool_stats(),
+                           "principal_cache": security.principal_cache.stats(),
+                           "asset_response_cache": asset_repo.response_cache.stats(),
+                           "password_pool": security.password_pool.stats(),
+                           "preview_pipeline": previews.pipeline.stats()})
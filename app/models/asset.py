@@ -1,7 +1,7 @@
 from datetime import datetime
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, UniqueConstraint, event, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from app.core.database import Base
+from app.core.database import Base, first_row_version
 
 from app.schemas.asset import AssetStatus, AssetType
 
@@ -10,19 +10,36 @@ from app.schemas.asset import AssetStatus, AssetType
 
 class Asset(Base):
     __tablename__ = "assets"
+    __table_args__ = (
+        Index("ix_assets_last_update_id", "last_update", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(nullable=False)
+    name: Mapped[str] = mapped_column(nullable=False, index=True)
     description: Mapped[str] = mapped_column()
-    asset_type: Mapped[AssetType] = mapped_column(nullable=False)
-    created_at :  Mapped[datetime] = mapped_column(default=datetime.now)
+    asset_type: Mapped[AssetType] = mapped_column(nullable=False, index=True)
+    # index for older_than in the bulk delete
+    created_at :  Mapped[datetime] = mapped_column(default=datetime.now, index=True)
     last_update: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
+    # highest version_number overall / among Published versions, maintained by app.repositories.asset
+    latest_version_id: Mapped[int | None] = mapped_column(default=None)
+    latest_published_version_id: Mapped[int | None] = mapped_column(default=None)
+    # highest version_number handed out by the server, numbers of deleted versions are never reused
+    last_version_number: Mapped[int] = mapped_column(default=0, server_default="0")
+    # bumped by every change to the asset or its versions, the asset's ETag and If-Match token
+    row_version: Mapped[int] = mapped_column(default=first_row_version, server_default="1")
 
-    versions: Mapped[list["AssetVersion"]] = relationship(back_populates="parent_asset", cascade="all, delete-orphan")
+    # versions go with their asset through ON DELETE CASCADE, the orm never loads them just to delete them
+    versions: Mapped[list["AssetVersion"]] = relationship(back_populates="parent_asset", cascade="all, delete-orphan",
+                                                          passive_deletes=True)
 
 
 class AssetVersion(Base):
     __tablename__ = "asset_versions"
+    __table_args__ = (
+        UniqueConstraint("asset_id", "version_number", name="uq_asset_versions_asset_id_version_number"),
+        Index("ix_asset_versions_asset_id_status", "asset_id", "status", "version_number"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     version_number: Mapped[int] = mapped_column(nullable=False)
@@ -30,8 +47,30 @@ class AssetVersion(Base):
     file_path : Mapped[str] = mapped_column(nullable=False)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     last_update: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
-    
+    # set when the file was uploaded through the service and lives in managed storage
+    checksum: Mapped[str | None] = mapped_column(default=None, index=True)
+    size: Mapped[int | None] = mapped_column(default=None)
+    # bumped by every update, the version's ETag and If-Match token
+    row_version: Mapped[int] = mapped_column(default=first_row_version, server_default="1")
 
     asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete='CASCADE'))
     parent_asset: Mapped["Asset"] = relationship(back_populates="versions")
-    
\ No newline at end of file
+
+
+# full-text index over asset names and descriptions, SQLite only (FTS5).
+# rows are keyed by asset id and kept in sync by app.repositories.asset
+@event.listens_for(Base.metadata, "after_create")
+def _create_asset_search_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'assets_fts'")).first()
+    if exists:
+        return
+    connection.execute(text("CREATE VIRTUAL TABLE assets_fts USING fts5(name, description)"))
+    connection.execute(text("INSERT INTO assets_fts(rowid, name, description) SELECT id, name, description FROM assets"))
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def _drop_asset_search_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS assets_fts"))
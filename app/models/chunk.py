@@ -0,0 +1,27 @@
+from datetime import datetime
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.database import Base
+
+
+class Chunk(Base):
+    """one blob in app.core.storage's chunk store, shared by every version whose content contains it"""
+    __tablename__ = "chunks"
+    __table_args__ = (
+        Index("ix_chunks_refcount_released_at", "refcount", "released_at"),
+    )
+
+    hash: Mapped[str] = mapped_column(primary_key=True)
+    size: Mapped[int] = mapped_column(nullable=False)
+    refcount: Mapped[int] = mapped_column(default=0)
+    # when refcount last dropped to zero; unreferenced chunks are only removed after a grace period
+    released_at: Mapped[datetime | None] = mapped_column(default=None)
+
+
+class VersionChunk(Base):
+    """a version's content, as the ordered list of chunks it is made of"""
+    __tablename__ = "version_chunks"
+
+    version_id: Mapped[int] = mapped_column(ForeignKey("asset_versions.id", ondelete="CASCADE"), primary_key=True)
+    seq: Mapped[int] = mapped_column(primary_key=True)
+    chunk_hash: Mapped[str] = mapped_column(ForeignKey("chunks.hash"), index=True)
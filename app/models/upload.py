@@ -0,0 +1,24 @@
+from datetime import datetime
+from sqlalchemy import ForeignKey, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from app.core.database import Base
+
+from app.schemas.asset import AssetStatus
+
+
+class Upload(Base):
+    """an in-progress resumable upload; the bytes live in app.core.storage until it is completed into a version"""
+    __tablename__ = "uploads"
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), index=True)
+    version_number: Mapped[int | None] = mapped_column(default=None)
+    status: Mapped[AssetStatus] = mapped_column(default=AssetStatus.InProgress)
+    # declared total size and sha256, both optional and checked on completion
+    size: Mapped[int | None] = mapped_column(default=None)
+    checksum: Mapped[str | None] = mapped_column(default=None)
+    offset: Mapped[int] = mapped_column(default=0)
+    # json [[sha256, size], ...] when the client sends chunks instead of a byte stream
+    manifest: Mapped[str | None] = mapped_column(Text, default=None)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    last_update: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from app.core.database import Base
+from app.core.database import Base, first_row_version
 
 
 class User(Base):
@@ -9,5 +9,7 @@ class User(Base):
     username: Mapped[str] = mapped_column(unique=True)
     password: Mapped[str] = mapped_column()
     roles: Mapped[str] = mapped_column()
+    # bumped by every update, the user's ETag and If-Match token
+    row_version: Mapped[int] = mapped_column(default=first_row_version, server_default="1")
 
 
@@ -1,21 +1,215 @@
-from sqlalchemy import select
+import asyncio, base64, json
+from collections.abc import AsyncIterator
+from datetime import datetime
+from sqlalchemy import select, insert, update, delete, func, case, tuple_, or_, text, bindparam, table, column
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, raiseload, load_only, aliased
+from sqlalchemy.orm.attributes import set_committed_value
 
+from app.core import storage
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.repositories import chunk as chunk_repo
 from app.models.asset import Asset, AssetVersion
-from app.schemas.asset import AssetNew, AssetVersionNew, AssetUpdate, AssetVersionUpdate, AssetSearch, AssetVersionSearch
+from app.models.upload import Upload
+from app.schemas.asset import AssetNew, AssetBulkNew, AssetVersionNew, AssetVersionBulkNew, AssetUpdate, AssetVersionUpdate, AssetSearch, AssetVersionSearch, SearchOrder, AssetExport, AssetStatus, AssetProjection, AssetType, AssetDeleteFilter
 
 
 
+BULK_CHUNK_SIZE = 500
+
+# serialized GET responses per asset id ({None: asset body, version_id: version body}, each as (etag, body)).
+# every mutation below drops the asset's entry after it commits; other workers rely on the ttl
+response_cache = TTLCache(maxsize=get_settings().asset_cache_size, ttl=get_settings().asset_cache_ttl_seconds)
+
+# FTS5 table created by app.models.asset on SQLite, rowid is the asset id
+assets_fts = table("assets_fts", column("rowid"), column("rank"), column("assets_fts"))
+
+
 class AssetNotFound(Exception):
     pass
 
+class InvalidCursor(Exception):
+    pass
+
+class VersionAlreadyExists(Exception):
+    pass
+
+class EditConflict(Exception):
+    pass
+
+class ContentNotStored(Exception):
+    pass
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def _order_columns(model, order_by: SearchOrder) -> tuple:
+    if order_by == SearchOrder.last_update:
+        return (model.last_update, model.id)
+    return (model.id,)
+
+def _keyset_filter(model, order_by: SearchOrder, cursor: str):
+    # cursors are opaque to clients: base64 of the sort key of the last row on the previous page
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if order_by == SearchOrder.last_update:
+            last_update, last_id = datetime.fromisoformat(values[0]), int(values[1])
+            return tuple_(model.last_update, model.id) > tuple_(last_update, last_id)
+        return model.id > int(values[0])
+    except (ValueError, TypeError, IndexError, KeyError):
+        raise InvalidCursor
+
+def _paginate(query, model, search: AssetSearch | AssetVersionSearch):
+    query = query.order_by(*_order_columns(model, search.order_by)).limit(search.limit)
+    if search.cursor is None:
+        return query.offset(search.offset)
+    if search.cursor:
+        query = query.where(_keyset_filter(model, search.order_by, search.cursor))
+    return query
+
+def _chunks(rows: list, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _has_search_index(db_session: AsyncSession) -> bool:
+    return db_session.get_bind().dialect.name == "sqlite"
+
+async def _unindex_assets(asset_ids: list[int], db_session: AsyncSession):
+    if not _has_search_index(db_session):
+        return
+    statement = text("DELETE FROM assets_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True))
+    for chunk in _chunks(asset_ids):
+        await db_session.execute(statement, {"ids": chunk})
+
+async def _index_assets(asset_ids: list[int], db_session: AsyncSession):
+    if not _has_search_index(db_session):
+        return
+    statement = text("INSERT INTO assets_fts(rowid, name, description) "
+                     "SELECT id, name, description FROM assets WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+    for chunk in _chunks(asset_ids):
+        await db_session.execute(statement, {"ids": chunk})
+
+async def _refresh_latest_versions(asset_ids: list[int], db_session: AsyncSession):
+    # every caller changed some versions, which is a change to the asset too, so its row version moves
+    def newest(*criteria):
+        return (select(AssetVersion.id).where(AssetVersion.asset_id == Asset.id, *criteria)
+                .order_by(AssetVersion.version_number.desc()).limit(1).scalar_subquery())
+
+    for chunk in _chunks(asset_ids):
+        await db_session.execute(
+                    update(Asset).where(Asset.id.in_(chunk))
+                    .values(latest_version_id=newest(), latest_published_version_id=newest(AssetVersion.status == AssetStatus.Published),
+                            row_version=Asset.row_version + 1)
+                    .execution_options(synchronize_session=False))
+
+async def _allocate_version_numbers(wanted: dict[int, tuple[int, int]], db_session: AsyncSession) -> dict[int, range]:
+    """for each asset id, the next count version numbers of (count, claimed); assets that do not exist are left
+    out. concurrent publishers queue on the asset rows' locks instead of racing to the unique index, and a
+    rolled back insert gives its numbers back with the rest of the transaction. claimed is the highest number
+    the caller picked itself, the counter moves past it so the number is not handed out again once that
+    version is deleted"""
+    numbers = {}
+    for chunk in _chunks(sorted(wanted)):
+        count = case({asset_id: wanted[asset_id][0] for asset_id in chunk}, value=Asset.id)
+        claimed = case({asset_id: wanted[asset_id][1] for asset_id in chunk}, value=Asset.id)
+        # rows from before the counter are never handed out again either
+        highest = (select(func.coalesce(func.max(AssetVersion.version_number), 0))
+                   .where(AssetVersion.asset_id == Asset.id).scalar_subquery())
+        highest = case((highest >= claimed, highest), else_=claimed)
+        last = case((Asset.last_version_number >= highest, Asset.last_version_number), else_=highest) + count
+        # the rows are locked in id order, so two batches over the same assets can not deadlock
+        locked = select(Asset.id).where(Asset.id.in_(chunk)).order_by(Asset.id).with_for_update().correlate(None)
+        result = await db_session.execute(update(Asset).where(Asset.id.in_(locked)).values(last_version_number=last)
+                                          .returning(Asset.id, Asset.last_version_number).execution_options(synchronize_session=False))
+        for asset_id, last in result.all():
+            numbers[asset_id] = range(last - wanted[asset_id][0] + 1, last + 1)
+    return numbers
+
+def _row_version_filter(model, expected_versions: list[int] | None) -> list:
+    return [] if expected_versions is None else [model.row_version.in_(expected_versions)]
+
+async def _missing_or_stale(model, criteria: list, db_session: AsyncSession) -> Exception:
+    # only asked after an update matched nothing: the row is either gone or at another row version
+    result = await db_session.execute(select(model.id).where(*criteria))
+    return AssetNotFound() if result.first() is None else EditConflict()
+
+async def _resolve_content(rows: list[dict], db_session: AsyncSession) -> dict[str, list[tuple[str, int]]]:
+    """fills checksum and size of the version rows whose file_path names content in the chunk store and
+    returns the manifest per checksum, for add_references once the rows have ids"""
+    manifests = {}
+    for row in rows:
+        # every row gets the keys, a bulk insert takes its columns from all of them alike
+        row.setdefault("checksum", None)
+        row.setdefault("size", None)
+        if row["checksum"] is not None or not storage.is_managed(row["file_path"]):
+            continue
+        checksum = storage.content_checksum(row["file_path"])
+        if checksum not in manifests:
+            manifests[checksum] = await chunk_repo.find_manifest(checksum, db_session)
+            if manifests[checksum] is None:
+                raise ContentNotStored
+        row["checksum"], row["size"] = checksum, sum(size for _, size in manifests[checksum])
+    return manifests
+
+async def _reference_content(rows: list[dict], version_ids: list[int], manifests: dict[str, list[tuple[str, int]]],
+                             db_session: AsyncSession):
+    for row, version_id in zip(rows, version_ids):
+        if row["checksum"] in manifests:
+            await chunk_repo.add_references(version_id, manifests[row["checksum"]], db_session)
+
+def _load_options(projection: AssetProjection) -> list:
+    options = []
+    if projection.fields is not None:
+        # last_update stays loaded so cursors can still be built from the page
+        options.append(load_only(*(getattr(Asset, field) for field in projection.asset_fields()), Asset.last_update))
+    if projection.include_versions and projection.versions_limit is None:
+        options.append(selectinload(Asset.versions))
+    else:
+        options.append(raiseload(Asset.versions))
+    return options
+
+async def _apply_versions_limit(assets: list[Asset], projection: AssetProjection, db_session: AsyncSession):
+    if not projection.include_versions or projection.versions_limit is None:
+        return
+    versions_by_asset = {asset.id: [] for asset in assets}
+    if versions_by_asset and projection.versions_limit > 0:
+        ranked = select(AssetVersion, func.row_number().over(
+                        partition_by=AssetVersion.asset_id, order_by=AssetVersion.version_number.desc()).label("rank")
+                    ).where(AssetVersion.asset_id.in_(list(versions_by_asset))).subquery()
+        newest = aliased(AssetVersion, ranked)
+        result = await db_session.execute(
+                    select(newest).where(ranked.c.rank <= projection.versions_limit).order_by(newest.asset_id, newest.version_number))
+        for version in result.scalars():
+            versions_by_asset[version.asset_id].append(version)
+    for asset in assets:
+        set_committed_value(asset, "versions", versions_by_asset[asset.id])
+
+def _match_expression(words: list[str]) -> str:
+    # every word becomes a quoted prefix term, so user input can never be read as FTS5 query syntax
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+def _escape_like(word: str) -> str:
+    # the fallback matches words literally like the FTS5 path does, % and _ in them are not wildcards
+    return word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def next_cursor(rows: list[Asset] | list[AssetVersion], search: AssetSearch | AssetVersionSearch) -> str | None:
+    if len(rows) < search.limit:
+        return None
+    last = rows[-1]
+    if search.order_by == SearchOrder.last_update:
+        return _encode_cursor([last.last_update.isoformat(), last.id])
+    return _encode_cursor([last.id])
+
 async def add_new_asset(new_asset: AssetNew, db_session: AsyncSession) -> Asset:
     
     new_asset = Asset(**new_asset.model_dump())
     try:
         db_session.add(new_asset)
+        await db_session.flush()
+        await _index_assets([new_asset.id], db_session)
         await db_session.commit()
         await db_session.refresh(new_asset, attribute_names=["versions"])
         return new_asset        
@@ -25,52 +219,176 @@ async def add_new_asset(new_asset: AssetNew, db_session: AsyncSession) -> Asset:
     
 
 
-async def get_assets(db_session: AsyncSession, asset_id: int | None = None) -> Asset:
+async def add_new_assets(new_assets: list[AssetBulkNew], db_session: AsyncSession) -> list[tuple[int, list[int]]]:
+    try:
+        # a new asset has no other publishers yet, unnumbered versions simply follow the numbered ones
+        # and the counter starts past all of them
+        versions = []
+        for new_asset in new_assets:
+            last = max((version.version_number or 0 for version in new_asset.versions), default=0)
+            asset_versions = []
+            for version in new_asset.versions:
+                row = version.model_dump()
+                if row["version_number"] is None:
+                    last = row["version_number"] = last + 1
+                asset_versions.append(row)
+            versions.append((last, asset_versions))
+
+        asset_rows = [dict(new_asset.model_dump(exclude={"versions"}), last_version_number=last)
+                      for new_asset, (last, _) in zip(new_assets, versions)]
+        asset_ids = []
+        for chunk in _chunks(asset_rows):
+            result = await db_session.execute(insert(Asset).returning(Asset.id, sort_by_parameter_order=True), chunk)
+            asset_ids.extend(result.scalars().all())
+        await _index_assets(asset_ids, db_session)
+
+        version_rows = [dict(row, asset_id=asset_id) for asset_id, (_, asset_versions) in zip(asset_ids, versions) for row in asset_versions]
+        manifests = await _resolve_content(version_rows, db_session)
+        version_ids = {asset_id: [] for asset_id in asset_ids}
+        for chunk in _chunks(version_rows):
+            result = await db_session.execute(
+                        insert(AssetVersion).returning(AssetVersion.id, sort_by_parameter_order=True), chunk)
+            inserted_ids = result.scalars().all()
+            await _reference_content(chunk, inserted_ids, manifests, db_session)
+            for row, version_id in zip(chunk, inserted_ids):
+                version_ids[row["asset_id"]].append(version_id)
+        await _refresh_latest_versions([asset_id for asset_id, ids in version_ids.items() if ids], db_session)
+
+        await db_session.commit()
+        return [(asset_id, version_ids[asset_id]) for asset_id in asset_ids]
+    except IntegrityError:
+        await db_session.rollback()
+        raise VersionAlreadyExists
+    except Exception as e:
+        await db_session.rollback()
+        raise e
+
+
+async def get_assets(db_session: AsyncSession, asset_id: int | None = None, projection: AssetProjection | None = None) -> Asset:
+    projection = projection or AssetProjection()
+    query = select(Asset).options(*_load_options(projection))
     if not asset_id:
-        all_assets = await db_session.execute(select(Asset).options(selectinload(Asset.versions)))
-        return all_assets.scalars().all()
+        all_assets = await db_session.execute(query)
+        all_assets = all_assets.scalars().all()
+        await _apply_versions_limit(all_assets, projection, db_session)
+        return all_assets
         
     else:
         try:
-            asset = await db_session.execute(select(Asset).options(selectinload(Asset.versions)).where(Asset.id == asset_id))
-            return asset.scalar_one_or_none()
+            asset = await db_session.execute(query.where(Asset.id == asset_id))
+            asset = asset.scalar_one_or_none()
         except IntegrityError:
             raise AssetNotFound
+        if asset is not None:
+            await _apply_versions_limit([asset], projection, db_session)
+        return asset
         
-async def update_asset(asset_id: int, asset_update: AssetUpdate, db_session: AsyncSession) -> Asset:
-    asset_to_update = await db_session.execute(select(Asset).options(selectinload(Asset.versions)).where(Asset.id == asset_id))
-    asset_to_update = asset_to_update.scalar_one_or_none()
-    if asset_to_update is None:
-        raise AssetNotFound
-    
+async def get_assets_by_ids(asset_ids: list[int], db_session: AsyncSession) -> dict[int, Asset]:
+    assets = {}
+    for chunk in _chunks(asset_ids):
+        result = await db_session.execute(select(Asset).where(Asset.id.in_(chunk)).options(selectinload(Asset.versions)))
+        assets.update((asset.id, asset) for asset in result.scalars())
+    return assets
+
+async def get_asset_type(asset_id: int, db_session: AsyncSession) -> AssetType | None:
+    result = await db_session.execute(select(Asset.asset_type).where(Asset.id == asset_id))
+    return result.scalar_one_or_none()
+
+async def stream_assets(asset_export: AssetExport, db_session: AsyncSession) -> AsyncIterator[list[Asset]]:
+    query = select(Asset).options(selectinload(Asset.versions)).order_by(Asset.id)
+    if asset_export.asset_type:
+        query = query.where(Asset.asset_type == asset_export.asset_type)
+    if asset_export.updated_since:
+        query = query.where(Asset.last_update >= asset_export.updated_since)
+
+    result = await db_session.stream(query.execution_options(yield_per=asset_export.batch_size))
+    async for batch in result.scalars().partitions():
+        yield batch
+        # drop the batch from the identity map once the caller is done with it so memory stays flat
+        for asset in batch:
+            db_session.expunge(asset)
+
+async def update_asset(asset_id: int, asset_update: AssetUpdate, db_session: AsyncSession,
+                       expected_versions: list[int] | None = None) -> Asset:
+    # one UPDATE ... RETURNING; with expected_versions it only applies to the row version the client last saw
     updated_data_dict = asset_update.model_dump(exclude_unset=True)
-    for key, val in updated_data_dict.items():
-        setattr(asset_to_update, key, val)
-    
+    statement = (update(Asset).where(Asset.id == asset_id, *_row_version_filter(Asset, expected_versions))
+                 .values(**updated_data_dict, row_version=Asset.row_version + 1)
+                 .returning(Asset).options(selectinload(Asset.versions))
+                 .execution_options(populate_existing=True))
     try:
-        db_session.add(asset_to_update)
+        asset_to_update = (await db_session.execute(statement)).scalar_one_or_none()
+        if asset_to_update is None:
+            raise await _missing_or_stale(Asset, [Asset.id == asset_id], db_session)
+        if "name" in updated_data_dict or "description" in updated_data_dict:
+            await _unindex_assets([asset_id], db_session)
+            await _index_assets([asset_id], db_session)
         await db_session.commit()
-        await db_session.refresh(asset_to_update)
+        response_cache.invalidate(asset_id)
         return asset_to_update
     except Exception as e:
         await db_session.rollback()
         raise e
     
    
+async def _release_assets(criteria: list, db_session: AsyncSession) -> list[str]:
+    # what ON DELETE CASCADE can not do: give back chunk references and return the uploads whose staged bytes
+    # have to be removed from disk once the delete is committed
+    await chunk_repo.release_versions(select(AssetVersion.id).join(Asset, Asset.id == AssetVersion.asset_id).where(*criteria), db_session)
+    result = await db_session.execute(delete(Upload).where(Upload.asset_id.in_(select(Asset.id).where(*criteria))).returning(Upload.id))
+    return list(result.scalars())
+
+def _discard_uploads(upload_ids: list[str]):
+    for upload_id in upload_ids:
+        storage.discard(upload_id)
+
 async def delete_asset(asset_id: int , db_session: AsyncSession) -> Asset:
+    # versions are loaded for the response only; the rows go with one DELETE and the database's cascade
     result = await db_session.execute(select(Asset).options(selectinload(Asset.versions)).where(Asset.id==asset_id))
     asset_in_db = result.scalar_one_or_none()
     if asset_in_db is None:
         raise AssetNotFound
-    
-    await db_session.delete(asset_in_db)
-    await db_session.commit()
+
+    try:
+        upload_ids = await _release_assets([Asset.id == asset_id], db_session)
+        await db_session.execute(delete(Asset).where(Asset.id == asset_id))
+        await _unindex_assets([asset_id], db_session)
+        await db_session.commit()
+    except Exception as e:
+        await db_session.rollback()
+        raise e
+    response_cache.invalidate(asset_id)
+    await asyncio.to_thread(_discard_uploads, upload_ids)
 
     return asset_in_db
 
+async def delete_assets(asset_filter: AssetDeleteFilter, db_session: AsyncSession) -> int:
+    criteria = []
+    if asset_filter.ids is not None:
+        criteria.append(Asset.id.in_(asset_filter.ids))
+    if asset_filter.asset_type is not None:
+        criteria.append(Asset.asset_type == asset_filter.asset_type)
+    if asset_filter.older_than is not None:
+        criteria.append(Asset.created_at < asset_filter.older_than)
+
+    try:
+        upload_ids = await _release_assets(criteria, db_session)
+        result = await db_session.execute(delete(Asset).where(*criteria).returning(Asset.id)
+                                          .execution_options(synchronize_session=False))
+        deleted_ids = list(result.scalars())
+        await _unindex_assets(deleted_ids, db_session)
+        await db_session.commit()
+    except Exception as e:
+        await db_session.rollback()
+        raise e
+    for asset_id in deleted_ids:
+        response_cache.invalidate(asset_id)
+    await asyncio.to_thread(_discard_uploads, upload_ids)
+    return len(deleted_ids)
+
 
-async def search_assets(asset_search: AssetSearch, db_session: AsyncSession) list[Asset]:
-    query = select(Asset).options(selectinload(Asset.versions))
+async def search_assets(asset_search: AssetSearch, db_session: AsyncSession) -> list[Asset]:
+    query = select(Asset).options(*_load_options(asset_search))
 
     if asset_search.id:
         query = query.where(Asset.id == asset_search.id)
@@ -78,32 +396,100 @@ async def search_assets(asset_search: AssetSearch, db_session: AsyncSession) lis
         query = query.where(Asset.asset_type == asset_search.asset_type)
     if asset_search.name:
         query = query.where(Asset.name == asset_search.name)
+    words = (asset_search.q or "").split()
+    if words and _has_search_index(db_session):
+        query = query.join(assets_fts, assets_fts.c.rowid == Asset.id)
+        query = query.where(assets_fts.c.assets_fts.op("MATCH")(_match_expression(words)))
+        if asset_search.cursor is None:
+            query = query.order_by(assets_fts.c.rank)
+    elif words:
+        patterns = [f"%{_escape_like(word)}%" for word in words]
+        query = query.where(*(or_(Asset.name.ilike(pattern, escape="\\"), Asset.description.ilike(pattern, escape="\\"))
+                              for pattern in patterns))
     
-    query.limit(asset_search.limit).offset(asset_search.offset)
+    query = _paginate(query, Asset, asset_search)
     users = await db_session.execute(query)
     result = users.scalars().all()
+    await _apply_versions_limit(result, asset_search, db_session)
     return result
 
-async def add_new_version(new_version: AssetVersionNew, asset_id: int, db_session: AsyncSession) -> AssetVersion:
-
-    # asset_in_db = await db_session.execute(select(Asset).where(Asset.id == asset_id))
-    # if not asset_in_db:
-    #     raise AssetNotFound
+async def add_new_version(new_version: AssetVersionNew, asset_id: int, db_session: AsyncSession,
+                          checksum: str | None = None, size: int | None = None,
+                          manifest: list[tuple[str, int]] | None = None) -> AssetVersion:
 
-    new_version = AssetVersion(asset_id = asset_id,  **new_version.model_dump())
+    row = dict(new_version.model_dump(), checksum=checksum, size=size)
 
     try:
+        # a client's cas:// path gets the checksum, size and chunk references an upload would have given it
+        manifests = await _resolve_content([row], db_session)
+        if manifest is None:
+            manifest = manifests.get(row["checksum"])
+        new_version = AssetVersion(asset_id=asset_id, **row)
+        # the allocation doubles as the check that the asset exists, a client's own number claims nothing new
+        wanted = (1, 0) if new_version.version_number is None else (0, new_version.version_number)
+        numbers = (await _allocate_version_numbers({asset_id: wanted}, db_session)).get(asset_id)
+        if numbers is None:
+            raise AssetNotFound
+        if new_version.version_number is None:
+            new_version.version_number = numbers[0]
         db_session.add(new_version)
+        await db_session.flush()
+        if manifest is not None:
+            await chunk_repo.add_references(new_version.id, manifest, db_session)
+        await _refresh_latest_versions([asset_id], db_session)
         await db_session.commit()
+        response_cache.invalidate(asset_id)
         await db_session.refresh(new_version)
         return new_version
     except IntegrityError:
         await db_session.rollback()
-        raise AssetNotFound
+        raise VersionAlreadyExists
+    except Exception as e:
+        await db_session.rollback()
+        raise e
+
+async def add_new_versions(new_versions: list[AssetVersionBulkNew], db_session: AsyncSession) -> list[int | None]:
+    rows_by_asset = {}
+    for index, new_version in enumerate(new_versions):
+        rows_by_asset.setdefault(new_version.asset_id, []).append((index, new_version.model_dump()))
+
+    version_ids = [None] * len(new_versions)
+    try:
+        # an asset the allocation does not find, deleted or never there, is left out
+        wanted = {}
+        for asset_id, asset_rows in rows_by_asset.items():
+            numbers = [row["version_number"] for _, row in asset_rows]
+            wanted[asset_id] = (numbers.count(None), max((number or 0 for number in numbers), default=0))
+        allocated = await _allocate_version_numbers(wanted, db_session)
+        existing_ids, indexes, rows = sorted(allocated), [], []
+        for asset_id in existing_ids:
+            unnumbered = [row for _, row in rows_by_asset[asset_id] if row["version_number"] is None]
+            for row, number in zip(unnumbered, allocated[asset_id]):
+                row["version_number"] = number
+            indexes.extend(index for index, _ in rows_by_asset[asset_id])
+            rows.extend(row for _, row in rows_by_asset[asset_id])
+        manifests = await _resolve_content(rows, db_session)
+        inserted_ids = []
+        for chunk in _chunks(rows):
+            result = await db_session.execute(
+                        insert(AssetVersion).returning(AssetVersion.id, sort_by_parameter_order=True), chunk)
+            inserted_ids.extend(result.scalars().all())
+        await _reference_content(rows, inserted_ids, manifests, db_session)
+        await _refresh_latest_versions(existing_ids, db_session)
+        await db_session.commit()
+    except IntegrityError:
+        await db_session.rollback()
+        raise VersionAlreadyExists
     except Exception as e:
         await db_session.rollback()
         raise e
 
+    for asset_id in existing_ids:
+        response_cache.invalidate(asset_id)
+    for index, version_id in zip(indexes, inserted_ids):
+        version_ids[index] = version_id
+    return version_ids
+
 async def get_asset_verison(asset_id: int, version_id: int, db_session: AsyncSession) -> AssetVersion:
     try:
         result = await db_session.execute(select(AssetVersion).where(AssetVersion.asset_id == asset_id).where(AssetVersion.id == version_id))
@@ -115,23 +501,55 @@ async def get_asset_verison(asset_id: int, version_id: int, db_session: AsyncSes
         await db_session.rollback()
         raise e
 
-async def update_asset_version(asset_id: int, version_id: int, version_update: AssetVersionUpdate, db_session: AsyncSession) -> AssetVersion:
-    version_in_db = await get_asset_verison(asset_id,version_id, db_session)
+async def get_latest_version(asset_id: int, published: bool, db_session: AsyncSession) -> AssetVersion | None:
+    pointer = Asset.latest_published_version_id if published else Asset.latest_version_id
+    result = await db_session.execute(select(AssetVersion).join(Asset, pointer == AssetVersion.id).where(Asset.id == asset_id))
+    return result.scalar_one_or_none()
 
-    if version_in_db is None:
-        raise AssetNotFound
-    
-    updated_version_dict = version_update.model_dump(exclude_unset=True)
-    for key, val in updated_version_dict.items():
-        setattr(version_in_db, key, val)
+async def _repoint_content(criteria: list, file_path: str | None, db_session: AsyncSession) -> dict:
+    """moves the chunk references of a version to the content its new file_path names and returns the checksum
+    and size that go with it; a path outside the chunk store leaves the version without stored content"""
+    result = await db_session.execute(select(AssetVersion.id, AssetVersion.file_path).where(*criteria).with_for_update())
+    current = result.first()
+    # a missing version is reported by the update itself
+    if current is None or file_path is None or file_path == current.file_path:
+        return {}
+    checksum, manifest = None, None
+    if storage.is_managed(file_path):
+        checksum = storage.content_checksum(file_path)
+        manifest = await chunk_repo.find_manifest(checksum, db_session)
+        if manifest is None:
+            raise ContentNotStored
+    await chunk_repo.release_versions([current.id], db_session)
+    if manifest is not None:
+        await chunk_repo.add_references(current.id, manifest, db_session)
+    return {"checksum": checksum, "size": None if manifest is None else sum(size for _, size in manifest)}
 
+async def update_asset_version(asset_id: int, version_id: int, version_update: AssetVersionUpdate, db_session: AsyncSession,
+                               expected_versions: list[int] | None = None) -> AssetVersion:
+    criteria = [AssetVersion.asset_id == asset_id, AssetVersion.id == version_id]
+    updated_data_dict = version_update.model_dump(exclude_unset=True)
     try:
-        db_session.add(version_in_db)
+        # checksum, size and chunk references follow file_path in the same transaction, so they never disagree
+        if "file_path" in updated_data_dict:
+            updated_data_dict.update(await _repoint_content(criteria, updated_data_dict["file_path"], db_session))
+        statement = (update(AssetVersion).where(*criteria, *_row_version_filter(AssetVersion, expected_versions))
+                     .values(**updated_data_dict, row_version=AssetVersion.row_version + 1)
+                     .returning(AssetVersion)
+                     .execution_options(populate_existing=True))
+        version_in_db = (await db_session.execute(statement)).scalar_one_or_none()
+        if version_in_db is None:
+            raise await _missing_or_stale(AssetVersion, criteria, db_session)
+        if "version_number" in updated_data_dict:
+            # a number moved past the counter is claimed like a client picked one on publish
+            await _allocate_version_numbers({asset_id: (0, version_in_db.version_number)}, db_session)
+        await _refresh_latest_versions([asset_id], db_session)
         await db_session.commit()
-        await db_session.refresh(version_in_db)
+        response_cache.invalidate(asset_id)
         return version_in_db
     except IntegrityError:
-        raise AssetNotFound
+        await db_session.rollback()
+        raise VersionAlreadyExists
     except Exception as e:
         await db_session.rollback()
         raise e
@@ -142,8 +560,12 @@ async def delete_asset_version(asset_id: int, version_id: int, db_sesssion: Asyn
         raise AssetNotFound
     
     try:
+        await chunk_repo.release_versions([version_id], db_sesssion)
         await db_sesssion.delete(version_in_db)
+        await db_sesssion.flush()
+        await _refresh_latest_versions([asset_id], db_sesssion)
         await db_sesssion.commit()
+        response_cache.invalidate(asset_id)
         return version_in_db
     except IntegrityError:
         raise AssetNotFound
@@ -162,7 +584,7 @@ async def search_assets_version(asset_id:int, version_search: AssetVersionSearch
     if version_search.status:
         query = query.where(AssetVersion.status == version_search.status)
     
-    query.limit(version_search.limit).offset(version_search.offset)
+    query = _paginate(query, AssetVersion, version_search)
     users = await db_session.execute(query)
     result = users.scalars().all()
     return result
\ No newline at end of file
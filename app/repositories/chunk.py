@@ -0,0 +1,112 @@
+import asyncio, logging
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy import Select, select, insert, update, delete, func, case, bindparam
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import storage
+from app.core.database import async_session_local
+from app.models.asset import AssetVersion
+from app.models.chunk import Chunk, VersionChunk
+
+
+logger = logging.getLogger(__name__)
+
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+chunks_table = Chunk.__table__
+
+
+async def register_chunks(manifest: list[tuple[str, int]], db_session: AsyncSession):
+    # chunks are on disk before any version holds them; a row with no references makes them collectable
+    # if the version never gets created. a released row starts its grace period again, the chunk was just
+    # used and its file's mtime says so too, so the row is not collected while the file is kept
+    if manifest:
+        now = datetime.now()
+        upsert = _UPSERTS[db_session.get_bind().dialect.name](chunks_table)
+        upsert = upsert.on_conflict_do_update(index_elements=["hash"],
+                                              set_={"released_at": case((chunks_table.c.refcount <= 0, now),
+                                                                        else_=chunks_table.c.released_at)})
+        await db_session.execute(upsert, [{"hash": chunk_hash, "size": size, "refcount": 0, "released_at": now}
+                                          for chunk_hash, size in dict(manifest).items()])
+    await db_session.commit()
+
+async def add_references(version_id: int, manifest: list[tuple[str, int]], db_session: AsyncSession):
+    counts = Counter(chunk_hash for chunk_hash, _ in manifest)
+    sizes = dict(manifest)
+    if counts:
+        upsert = _UPSERTS[db_session.get_bind().dialect.name](chunks_table)
+        upsert = upsert.on_conflict_do_update(index_elements=["hash"],
+                                              set_={"refcount": chunks_table.c.refcount + upsert.excluded.refcount, "released_at": None})
+        await db_session.execute(upsert, [{"hash": chunk_hash, "size": sizes[chunk_hash], "refcount": count, "released_at": None}
+                                          for chunk_hash, count in counts.items()])
+        await db_session.execute(insert(VersionChunk), [{"version_id": version_id, "seq": seq, "chunk_hash": chunk_hash}
+                                                        for seq, (chunk_hash, _) in enumerate(manifest)])
+
+async def release_versions(version_ids: list[int] | Select, db_session: AsyncSession):
+    # version_ids may also be a select of ids, so a bulk delete never has to fetch them
+    if isinstance(version_ids, list) and not version_ids:
+        return
+    result = await db_session.execute(select(VersionChunk.chunk_hash, func.count())
+                                      .where(VersionChunk.version_id.in_(version_ids))
+                                      .group_by(VersionChunk.chunk_hash))
+    released = [{"chunk_hash": chunk_hash, "count": count} for chunk_hash, count in result.all()]
+    if released:
+        remaining = chunks_table.c.refcount - bindparam("count")
+        await db_session.execute(update(chunks_table)
+                                 .where(chunks_table.c.hash == bindparam("chunk_hash"))
+                                 .values(refcount=remaining,
+                                         released_at=case((remaining <= 0, datetime.now()), else_=chunks_table.c.released_at)),
+                                 released)
+        await db_session.execute(delete(VersionChunk).where(VersionChunk.version_id.in_(version_ids)))
+
+async def get_manifest(version_id: int, db_session: AsyncSession) -> list[tuple[str, int]]:
+    result = await db_session.execute(select(VersionChunk.chunk_hash, Chunk.size)
+                                      .join(Chunk, Chunk.hash == VersionChunk.chunk_hash)
+                                      .where(VersionChunk.version_id == version_id)
+                                      .order_by(VersionChunk.seq))
+    return [(chunk_hash, size) for chunk_hash, size in result.all()]
+
+async def find_manifest(checksum: str, db_session: AsyncSession) -> list[tuple[str, int]] | None:
+    """the manifest of some version holding the content, None when no version does"""
+    result = await db_session.execute(select(AssetVersion.id).where(AssetVersion.checksum == checksum).limit(1))
+    version_id = result.scalar_one_or_none()
+    return None if version_id is None else await get_manifest(version_id, db_session)
+
+async def content_exists(checksum: str, manifest: list[tuple[str, int]], db_session: AsyncSession) -> bool:
+    # some version already holds exactly this content, so there is nothing left to verify.
+    # the manifests of every version with the checksum come back in one query, grouped by version
+    result = await db_session.execute(select(AssetVersion.id, VersionChunk.chunk_hash, Chunk.size)
+                                      .outerjoin(VersionChunk, VersionChunk.version_id == AssetVersion.id)
+                                      .outerjoin(Chunk, Chunk.hash == VersionChunk.chunk_hash)
+                                      .where(AssetVersion.checksum == checksum)
+                                      .order_by(AssetVersion.id, VersionChunk.seq))
+    for _, rows in groupby(result.all(), key=lambda row: row[0]):
+        if [(chunk_hash, size) for _, chunk_hash, size in rows if chunk_hash is not None] == manifest:
+            return True
+    return False
+
+async def collect_garbage(grace_seconds: float, db_session: AsyncSession) -> list[str]:
+    cutoff = datetime.now() - timedelta(seconds=grace_seconds)
+    result = await db_session.execute(delete(Chunk).where(Chunk.refcount <= 0, Chunk.released_at <= cutoff).returning(Chunk.hash, Chunk.size))
+    sizes = dict(result.all())
+    await db_session.commit()
+    kept = await asyncio.to_thread(storage.remove_chunks, list(sizes), cutoff.timestamp())
+    # a file used again after its row was picked stays, and gets a row back so a later round can still collect it
+    await register_chunks([(chunk_hash, sizes[chunk_hash]) for chunk_hash in kept], db_session)
+    kept = set(kept)
+    return [chunk_hash for chunk_hash in sizes if chunk_hash not in kept]
+
+async def watch_garbage(interval: float, grace_seconds: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with async_session_local() as db_session:
+                removed = await collect_garbage(grace_seconds, db_session)
+            if removed:
+                logger.info("removed %d unreferenced chunks", len(removed))
+        except Exception as e:
+            # chunks that were not removed stay unreferenced and are picked up next round
+            logger.warning("chunk garbage collection failed: %s", e)
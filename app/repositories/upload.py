@@ -0,0 +1,191 @@
+import asyncio, hashlib, json, uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import storage
+from app.models.asset import Asset, AssetVersion
+from app.models.upload import Upload
+from app.repositories import asset as asset_repo
+from app.repositories import chunk as chunk_repo
+from app.schemas.asset import AssetVersionNew
+from app.schemas.upload import UploadNew
+
+
+class UploadNotFound(Exception):
+    pass
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        self.offset = offset
+
+class UploadIncomplete(Exception):
+    pass
+
+class ChecksumMismatch(Exception):
+    pass
+
+class NotInManifest(Exception):
+    pass
+
+class WrongUploadKind(Exception):
+    pass
+
+
+# one writer per upload at a time, in this process. an entry only lives while some request holds or waits
+# for it, so ids that were never found and uploads that were abandoned leave nothing behind
+_locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+
+@asynccontextmanager
+async def _upload_lock(upload_id: str):
+    lock, users = _locks.get(upload_id) or (asyncio.Lock(), 0)
+    _locks[upload_id] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _locks[upload_id]
+        if users == 1:
+            del _locks[upload_id]
+        else:
+            _locks[upload_id] = (lock, users - 1)
+
+
+def manifest_of(upload: Upload) -> list[tuple[str, int]] | None:
+    if upload.manifest is None:
+        return None
+    return [(chunk_hash, size) for chunk_hash, size in json.loads(upload.manifest)]
+
+async def missing_chunks(upload: Upload) -> list[str] | None:
+    manifest = manifest_of(upload)
+    if manifest is None:
+        return None
+    distinct = list(dict.fromkeys(chunk_hash for chunk_hash, _ in manifest))
+    return await asyncio.to_thread(lambda: [chunk_hash for chunk_hash in distinct if not storage.has_chunk(chunk_hash)])
+
+
+async def _version_exists(asset_id: int, version_number: int, db_session: AsyncSession) -> bool:
+    result = await db_session.execute(select(AssetVersion.id).where(AssetVersion.asset_id == asset_id,
+                                                                    AssetVersion.version_number == version_number))
+    return result.scalar_one_or_none() is not None
+
+async def add_upload(asset_id: int, new_upload: UploadNew, db_session: AsyncSession) -> Upload:
+    asset_in_db = await db_session.execute(select(Asset.id).where(Asset.id == asset_id))
+    if asset_in_db.scalar_one_or_none() is None:
+        raise asset_repo.AssetNotFound
+    # checked up front too, so nobody sends gigabytes for a version number that is already taken
+    if new_upload.version_number is not None and await _version_exists(asset_id, new_upload.version_number, db_session):
+        raise asset_repo.VersionAlreadyExists
+
+    upload = Upload(id=uuid.uuid4().hex, asset_id=asset_id, **new_upload.model_dump(exclude={"chunks"}))
+    if new_upload.chunks is not None:
+        upload.manifest = json.dumps([[chunk.hash, chunk.size] for chunk in new_upload.chunks])
+        upload.size = sum(chunk.size for chunk in new_upload.chunks)
+    db_session.add(upload)
+    await db_session.commit()
+    if upload.manifest is None:
+        storage.create_upload(upload.id)
+    return upload
+
+async def get_upload(upload_id: str, db_session: AsyncSession) -> Upload:
+    upload = await db_session.get(Upload, upload_id, populate_existing=True)
+    if upload is None:
+        raise UploadNotFound
+    return upload
+
+async def _read_upload(upload_id: str, db_session: AsyncSession) -> Upload:
+    # parts and completions stream or hash for minutes, the transaction that read the upload is over
+    # before they start so they hold no pooled connection and no sqlite read snapshot meanwhile
+    upload = await get_upload(upload_id, db_session)
+    await db_session.commit()
+    return upload
+
+async def write_part(upload_id: str, offset: int, chunks: AsyncIterator[bytes], db_session: AsyncSession) -> Upload:
+    async with _upload_lock(upload_id):
+        upload = await _read_upload(upload_id, db_session)
+        if upload.manifest is not None:
+            raise WrongUploadKind
+        if offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+        new_offset = await storage.append(upload_id, offset, chunks, limit=upload.size)
+        result = await db_session.execute(update(Upload).where(Upload.id == upload_id).values(offset=new_offset)
+                                          .returning(Upload).execution_options(populate_existing=True))
+        upload = result.scalar_one_or_none()
+        if upload is None:
+            # aborted while the part was streamed
+            raise UploadNotFound
+        await db_session.commit()
+        return upload
+
+async def write_chunk(upload_id: str, chunk_hash: str, body: AsyncIterator[bytes], db_session: AsyncSession):
+    upload = await _read_upload(upload_id, db_session)
+    manifest = manifest_of(upload)
+    if manifest is None:
+        raise WrongUploadKind
+    size = dict(manifest).get(chunk_hash)
+    if size is None:
+        raise NotInManifest
+
+    parts, received = [], 0
+    async for part in body:
+        received += len(part)
+        if received > size:
+            raise storage.UploadTooLarge
+        parts.append(part)
+    data = b"".join(parts)
+    if hashlib.sha256(data).hexdigest() != chunk_hash:
+        raise ChecksumMismatch
+    await asyncio.to_thread(storage.put_chunk, data)
+    await chunk_repo.register_chunks([(chunk_hash, size)], db_session)
+
+async def complete_upload(upload_id: str, db_session: AsyncSession) -> AssetVersion:
+    async with _upload_lock(upload_id):
+        upload = await _read_upload(upload_id, db_session)
+        manifest = manifest_of(upload)
+        if manifest is None:
+            if upload.size is not None and upload.offset != upload.size:
+                raise UploadIncomplete
+            checksum = await storage.digest(upload_id, upload.offset)
+            if upload.checksum is not None and checksum != upload.checksum:
+                raise ChecksumMismatch
+            try:
+                manifest = await asyncio.to_thread(storage.chunk_file, storage.upload_path(upload_id))
+            except FileNotFoundError:
+                # aborted while it was hashed
+                raise UploadNotFound
+            await chunk_repo.register_chunks(manifest, db_session)
+        else:
+            # held before they are verified: garbage collection running until add_references below neither
+            # deletes the rows of released chunks nor their files
+            await chunk_repo.register_chunks(manifest, db_session)
+            distinct = list(dict.fromkeys(chunk_hash for chunk_hash, _ in manifest))
+            if await asyncio.to_thread(storage.hold_chunks, distinct):
+                raise UploadIncomplete
+            checksum = upload.checksum
+            # re-publishing content some version already holds is metadata only, anything else is verified
+            exists = await chunk_repo.content_exists(checksum, manifest, db_session)
+            await db_session.commit()
+            if not exists and await storage.manifest_digest(manifest) != checksum:
+                raise ChecksumMismatch
+
+        # read again for the commit that publishes it, another worker may have aborted or extended it meanwhile
+        offset, upload = upload.offset, await get_upload(upload_id, db_session)
+        if upload.offset != offset:
+            raise UploadIncomplete
+        new_version = AssetVersionNew(version_number=upload.version_number, file_path=storage.content_uri(checksum), status=upload.status)
+        # the upload goes in the same commit as the version: a retried completion finds no upload instead of
+        # publishing a second version (a server picked number never conflicts) and referencing the chunks twice
+        await db_session.delete(upload)
+        version = await asset_repo.add_new_version(new_version, upload.asset_id, db_session,
+                                                   checksum=checksum, size=sum(size for _, size in manifest), manifest=manifest)
+    await asyncio.to_thread(storage.discard, upload_id)
+    return version
+
+async def delete_upload(upload_id: str, db_session: AsyncSession) -> Upload:
+    upload = await get_upload(upload_id, db_session)
+    await db_session.delete(upload)
+    await db_session.commit()
+    await asyncio.to_thread(storage.discard, upload_id)
+    return upload
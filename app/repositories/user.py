@@ -1,3 +1,4 @@
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
@@ -10,8 +11,11 @@ from app.core import security
 class UsernameAlreadyExists(Exception):
     pass
 
+class EditConflict(Exception):
+    pass
+
 async def add_new_user(user_input: UserInput, db_session: AsyncSession) -> User:
-    hashed_pass = security.hash_plain_password(user_input.password)
+    hashed_pass = await security.hash_plain_password_async(user_input.password)
     new_user = User(username = user_input.username, password=hashed_pass, roles = "guest")
     try:
         db_session.add(new_user)
@@ -50,20 +54,27 @@ async def delete_user_with_id(id: int, db_session: AsyncSession) -> bool:
     
     await db_session.delete(user_in_db)
     await db_session.commit()
+    security.principal_cache.invalidate(id)
     return True
 
-async def update_user(id: int, user_update: UserUpdate, db_session: AsyncSession) -> User:
-    result = await db_session.execute(select(User).where(User.id == id))
-    user_db = result.scalar_one_or_none()
-    if not user_db:
-        return None
-    
-    update_data = user_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(user_db, key, value)
-    db_session.add(user_db)
-    await db_session.commit()
-    await db_session.refresh(user_db) 
+async def update_user(id: int, user_update: UserUpdate, db_session: AsyncSession, expected_versions: list[int] | None = None) -> User:
+    statement = update(User).where(User.id == id)
+    if expected_versions is not None:
+        statement = statement.where(User.row_version.in_(expected_versions))
+    statement = (statement.values(**user_update.model_dump(exclude_unset=True), row_version=User.row_version + 1)
+                 .returning(User).execution_options(populate_existing=True))
+    try:
+        user_db = (await db_session.execute(statement)).scalar_one_or_none()
+        if user_db is None:
+            await db_session.rollback()
+            if expected_versions is not None and await get_user_by_id(id, db_session) is not None:
+                raise EditConflict
+            return None
+        await db_session.commit()
+    except IntegrityError:
+        await db_session.rollback()
+        raise UsernameAlreadyExists
+    security.principal_cache.invalidate(id)
     return user_db
 
 async def find_user(
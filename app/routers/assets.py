@@ -1,32 +1,211 @@
+import asyncio, json, secrets
+from datetime import datetime
+from email.utils import formatdate
 from typing import Annotated
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, Body, Header, HTTPException, Request, Response
+from pydantic import ValidationError
+from fastapi.responses import StreamingResponse, RedirectResponse, FileResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.repositories import asset as asset_repo
+from app.repositories import chunk as chunk_repo
 from app.schemas.user import UserInDb
-from app.schemas.asset import AssetNew, AssetOut, AssetInDb, AssetUpdate, AssetSearch
-from app.schemas.asset import AssetVersionInDb, AssetVersionNew, AssetVersionOut, AssetVersionUpdate
-from app.core.database import get_db_session
+from app.schemas.asset import AssetNew, AssetOut, AssetInDb, AssetUpdate, AssetSearch, AssetPage, AssetExport, AssetProjection
+from app.schemas.asset import AssetIds, AssetMultiOut, AssetType, AssetDeleteFilter, AssetDeleteOut, MAX_MULTI_GET
+from app.schemas.asset import AssetBulkNew, AssetBulkOut, AssetBulkCreated, AssetBulkError, MAX_BULK_ITEMS
+from app.schemas.asset import AssetVersionBulkNew, AssetVersionBulkOut, AssetVersionBulkCreated
+from app.schemas.asset import AssetVersionInDb, AssetVersionNew, AssetVersionOut, AssetVersionUpdate, AssetVersionSearch, AssetVersionPage
+from app.core import storage, previews
+from app.core.database import get_db_session, get_db_read_session, on_replica
+from app.core.preconditions import row_etag, expected_row_versions, precondition_failed
+from app.core.serialization import dump_json, json_response
 from app.core.security import get_current_user, one_or_more_scopes
 
 
 router = APIRouter(tags=["Assets"])
 
+# more ranges than this in one request are served as the whole body instead
+MAX_RANGES = 16
 
-@router.post("/assets")
+
+def _project(asset, projection: AssetProjection) -> dict:
+    data = {field: getattr(asset, field) for field in projection.asset_fields()}
+    if projection.include_versions:
+        data["versions"] = [AssetVersionInDb.model_validate(version) for version in asset.versions]
+    return data
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+def _conditional_response(request: Request, etag: str, body: bytes) -> Response:
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def _byte_ranges(request: Request, etag: str, size: int) -> list[tuple[int, int]] | None:
+    # comma separated "first-last", "first-" or "-suffix" specs after "bytes="; a header with any spec that
+    # does not parse, or with more than MAX_RANGES of them, is ignored and the whole body served
+    header = request.headers.get("range", "")
+    if not header.startswith("bytes="):
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    specs = header.removeprefix("bytes=").split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition("-")
+        try:
+            if not dash:
+                return None
+            if first:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last) + 1, size) if last else size
+            else:
+                start, end = max(size - int(last), 0), size
+        except ValueError:
+            return None
+        # a spec past the end is left out, the request fails only if nothing is left
+        if start < end:
+            ranges.append((start, end))
+    if not ranges:
+        raise HTTPException(status_code=416, detail="Range Not Satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return ranges
+
+def _part_header(boundary: str, start: int, end: int, size: int) -> bytes:
+    return (f"--{boundary}\r\nContent-Type: application/octet-stream\r\n"
+            f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n").encode()
+
+async def _read_ranges(manifest: list[tuple[str, int]], ranges: list[tuple[int, int]], boundary: str, size: int):
+    # multipart/byteranges body, each part streamed from the chunks that hold it
+    for start, end in ranges:
+        yield _part_header(boundary, start, end, size)
+        async for block in storage.read_range(manifest, start, end):
+            yield block
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+@router.post("/assets", response_model=AssetOut)
 async def add_new_asset(
             new_asset: AssetNew, 
             db_session: Annotated[AsyncSession,Depends(get_db_session)],
             user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:add"]))]):
     
     try:
-        result = await asset_repo.add_new_asset(new_asset, db_session)
-        new_asset_in_db = AssetInDb.model_validate(result)
-        return AssetOut(**new_asset_in_db.model_dump())
+        return await asset_repo.add_new_asset(new_asset, db_session)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
+
+async def _read_bulk_assets(request: Request) -> tuple[list[tuple[int, AssetBulkNew]], list[AssetBulkError]]:
+    valid, errors = [], []
+
+    def check(index: int, validate, raw):
+        if index >= MAX_BULK_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At Most {MAX_BULK_ITEMS} Assets Per Request")
+        try:
+            valid.append((index, validate(raw)))
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append(AssetBulkError(index=index, detail=detail))
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        index, pending = 0, b""
+        async for chunk in request.stream():
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    check(index, AssetBulkNew.model_validate_json, line)
+                    index += 1
+        if pending.strip():
+            check(index, AssetBulkNew.model_validate_json, pending)
+    else:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body Must Be A JSON List Or NDJSON")
+        for index, item in enumerate(items):
+            check(index, AssetBulkNew.model_validate, item)
+
+    return valid, errors
+
+
+@router.post("/assets/bulk", response_model=AssetBulkOut)
+async def add_new_assets(
+            request: Request,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:add"]))]):
+    valid, errors = await _read_bulk_assets(request)
+    try:
+        created = await asset_repo.add_new_assets([new_asset for _, new_asset in valid], db_session)
+    except asset_repo.VersionAlreadyExists:
+        raise HTTPException(status_code=409, detail="Version Number Already Exists")
+    except asset_repo.ContentNotStored:
+        raise HTTPException(status_code=409, detail="No Stored Content Has That Checksum")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
 
-@router.post("/assets/{asset_id}")
+    return AssetBulkOut(
+            created=[AssetBulkCreated(index=index, id=asset_id, version_ids=version_ids)
+                     for (index, _), (asset_id, version_ids) in zip(valid, created)],
+            errors=errors)
+
+
+async def _get_many(asset_ids: list[int], db_session: AsyncSession) -> AssetMultiOut:
+    asset_ids = list(dict.fromkeys(asset_ids))
+    try:
+        assets = await asset_repo.get_assets_by_ids(asset_ids, db_session)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
+    return AssetMultiOut(items=[AssetOut.model_validate(assets[asset_id]) for asset_id in asset_ids if asset_id in assets],
+                         missing=[asset_id for asset_id in asset_ids if asset_id not in assets])
+
+
+@router.post("/assets/lookup", response_model=AssetMultiOut)
+async def get_assets_by_ids_long(
+            asset_ids: AssetIds,
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:view"]))]):
+    return await _get_many(asset_ids.ids, db_session)
+
+
+@router.post("/assets/versions/bulk", response_model=AssetVersionBulkOut)
+async def add_new_versions(
+            new_versions: Annotated[list[AssetVersionBulkNew], Body()],
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    if len(new_versions) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At Most {MAX_BULK_ITEMS} Versions Per Request")
+    try:
+        version_ids = await asset_repo.add_new_versions(new_versions, db_session)
+    except asset_repo.VersionAlreadyExists:
+        raise HTTPException(status_code=409, detail="Version Number Already Exists")
+    except asset_repo.ContentNotStored:
+        raise HTTPException(status_code=409, detail="No Stored Content Has That Checksum")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There Was An Internal Error: {e}")
+
+    created, errors = [], []
+    for index, (new_version, version_id) in enumerate(zip(new_versions, version_ids)):
+        if version_id is None:
+            errors.append(AssetBulkError(index=index, detail=f"Asset {new_version.asset_id} Not Found"))
+        else:
+            created.append(AssetVersionBulkCreated(index=index, id=version_id, asset_id=new_version.asset_id))
+    return AssetVersionBulkOut(created=created, errors=errors)
+
+
+@router.post("/assets/{asset_id}", response_model=AssetVersionOut)
 async def add_new_version(
             asset_id:int, 
             new_version: AssetVersionNew, 
@@ -36,46 +215,121 @@ async def add_new_version(
         new_version = await asset_repo.add_new_version(new_version, asset_id, db_session)
     except asset_repo.AssetNotFound:
         raise HTTPException(status_code=404, detail="Asset Not Found!")
+    except asset_repo.VersionAlreadyExists:
+        raise HTTPException(status_code=409, detail="Version Number Already Exists")
+    except asset_repo.ContentNotStored:
+        raise HTTPException(status_code=409, detail="No Stored Content Has That Checksum")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"There Was An Internal Error: {e}")
     
-    new_version_in_db = AssetVersionInDb.model_validate(new_version)
-    return AssetVersionOut(**new_version_in_db.model_dump())
+    return new_version
+
+
+@router.get("/assets", response_model=AssetMultiOut)
+async def get_assets_by_ids(
+            request: Request,
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:view"]))],
+            ids: str | None = None):
+    if ids is None:
+        # without ids this is still the search endpoint, as it was before multi-get
+        return RedirectResponse(request.url.replace(path=request.url.path + "/"), status_code=307)
+    try:
+        asset_ids = AssetIds(ids=[asset_id for asset_id in ids.split(",") if asset_id.strip()])
+    except ValidationError:
+        raise HTTPException(status_code=422, detail=f"ids Must Be 1 To {MAX_MULTI_GET} Comma Separated Integers")
+    return await _get_many(asset_ids.ids, db_session)
+
+
+@router.get("/assets/export")
+async def export_assets(
+            asset_export: Annotated[AssetExport, Query()],
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:export"]))]):
+
+    async def ndjson_lines():
+        async for batch in asset_repo.stream_assets(asset_export, db_session):
+            yield b"".join(dump_json(AssetInDb, asset) + b"\n" for asset in batch)
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 
 @router.get("/assets/{asset_id}")
 async def get_asset_by_id(
             asset_id: int,
-            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            request: Request,
+            projection: Annotated[AssetProjection, Query()],
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
             user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:view"]))]):
-    try:    
-        asset = await asset_repo.get_assets(asset_id=asset_id, db_session=db_session)
-    except asset_repo.AssetNotFound:
-        raise HTTPException(status_code=404, detail="Asset Not Found")
-    if asset is None:
-        raise HTTPException(status_code=404, detail="Asset Not Found")
-    return AssetOut.model_validate(asset)
+    if not projection.is_default():
+        # partial representations are cheap to build and are not cached
+        asset = await asset_repo.get_assets(asset_id=asset_id, db_session=db_session, projection=projection)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Asset Not Found")
+        return json_response(dict, _project(asset, projection))
+
+    generation = asset_repo.response_cache.generation(asset_id)
+    cached = asset_repo.response_cache.get(asset_id) or {}
+    if None not in cached:
+        try:    
+            asset = await asset_repo.get_assets(asset_id=asset_id, db_session=db_session)
+        except asset_repo.AssetNotFound:
+            raise HTTPException(status_code=404, detail="Asset Not Found")
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Asset Not Found")
+        entry = (row_etag(asset.row_version), dump_json(AssetOut, asset))
+        # a lagging replica could put back a body a write has just invalidated, only the primary fills the cache
+        if on_replica(db_session):
+            return _conditional_response(request, *entry)
+        cached[None] = entry
+        asset_repo.response_cache.set(asset_id, cached, generation=generation)
 
+    etag, body = cached[None]
+    return _conditional_response(request, etag, body)
 
-@router.put("/assets/{asset_id}")
+
+@router.put("/assets/{asset_id}", response_model=AssetOut)
 async def update_asset(
             asset_id: int, 
             asset_updat:AssetUpdate, 
+            response: Response,
             db_session: Annotated[AsyncSession, Depends(get_db_session)],
-            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:update"]))]):
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:update"]))],
+            if_match: Annotated[str | None, Header()] = None):
+    expected_versions = expected_row_versions(if_match)
     try:
-        updated_asset = await asset_repo.update_asset(asset_id, asset_updat, db_session)
+        updated_asset = await asset_repo.update_asset(asset_id, asset_updat, db_session, expected_versions)
     except asset_repo.AssetNotFound:
         raise HTTPException(status_code=404, detail="Asset Not Found")
+    except asset_repo.EditConflict:
+        raise precondition_failed()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Somethin Went Wrong: {e}")
     
-    if update_asset is None:
+    if updated_asset is None:
         raise HTTPException(status_code=404, detail="Asset Not Found")
     
-    return AssetOut.model_validate(updated_asset)
+    response.headers["ETag"] = row_etag(updated_asset.row_version)
+    return updated_asset
+
+@router.delete("/assets", response_model=AssetDeleteOut)
+async def delete_assets(
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:delete"]))],
+            ids: str | None = None,
+            asset_type: AssetType | None = None,
+            older_than: datetime | None = None):
+    try:
+        asset_filter = AssetDeleteFilter(ids=[asset_id for asset_id in ids.split(",") if asset_id.strip()] if ids is not None else None,
+                                         asset_type=asset_type, older_than=older_than)
+    except ValidationError:
+        raise HTTPException(status_code=422, detail=f"Give ids (1 To {MAX_MULTI_GET} Comma Separated Integers), asset_type Or older_than")
+    try:
+        return AssetDeleteOut(deleted=await asset_repo.delete_assets(asset_filter, db_session))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
 
-@router.delete("/assets/{asset_id}")
+@router.delete("/assets/{asset_id}", response_model=AssetOut)
 async def delete_asset(
             asset_id: int, 
             db_session: Annotated[AsyncSession, Depends(get_db_session)],
@@ -87,25 +341,95 @@ async def delete_asset(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
     
-    return AssetOut.model_validate(deleted_asset)
+    return deleted_asset
 
 @router.get("/assets/")
 async def search_assets(
             asset_search: Annotated[AssetSearch, Query()], 
-            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
             user: Annotated[UserInDb, Depends(one_or_more_scopes(["asset:*", "asset:search"]))]):
     try:
         result = await asset_repo.search_assets(asset_search, db_session)
-        return [AssetOut.model_validate(user) for user in result]
+    except asset_repo.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid Cursor")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
+
+    if asset_search.is_default():
+        assets, assets_type = result, list[AssetOut]
+    else:
+        assets, assets_type = [_project(asset, asset_search) for asset in result], list[dict]
+    if asset_search.cursor is None:
+        return json_response(assets_type, assets)
+    return json_response(AssetPage, {"items": assets, "next_cursor": asset_repo.next_cursor(result, asset_search)})
+
+
+@router.get("/assets/{asset_id}/versions/")
+async def search_asset_versions(
+            asset_id: int,
+            version_search: Annotated[AssetVersionSearch, Query()],
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:view"]))]):
+    try:
+        result = await asset_repo.search_assets_version(asset_id, version_search, db_session)
+    except asset_repo.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid Cursor")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
 
+    if version_search.cursor is None:
+        return json_response(list[AssetVersionOut], result)
+    return json_response(AssetVersionPage, {"items": result, "next_cursor": asset_repo.next_cursor(result, version_search)})
+
+
+@router.get("/assets/{asset_id}/latest", response_model=AssetVersionOut)
+async def get_latest_version(
+            asset_id: int,
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:view"]))],
+            published: bool = False):
+    try:
+        version_in_db = await asset_repo.get_latest_version(asset_id, published, db_session)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
+    if version_in_db is None:
+        raise HTTPException(status_code=404, detail="Asset Or Version Not Found!")
+    return version_in_db
+
 
 @router.get("/assets/{asset_id}/{version_id}")
 async def get_asset_version(
             asset_id: int, 
             version_id: int, 
-            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            request: Request,
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:view"]))]):
+    generation = asset_repo.response_cache.generation(asset_id)
+    cached = asset_repo.response_cache.get(asset_id) or {}
+    if version_id not in cached:
+        try:
+            version_in_db = await asset_repo.get_asset_verison(asset_id, version_id, db_session)
+        except asset_repo.AssetNotFound:
+            raise HTTPException(status_code=404, detail="Asset Not Found")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
+        if version_in_db is None:
+            raise HTTPException(status_code=404, detail="Asset Or Version Not Found!")
+        entry = (row_etag(version_in_db.row_version), dump_json(AssetVersionOut, version_in_db))
+        if on_replica(db_session):
+            return _conditional_response(request, *entry)
+        cached[version_id] = entry
+        asset_repo.response_cache.set(asset_id, cached, generation=generation)
+
+    etag, body = cached[version_id]
+    return _conditional_response(request, etag, body)
+
+@router.get("/assets/{asset_id}/{version_id}/content")
+async def get_asset_version_content(
+            asset_id: int,
+            version_id: int,
+            request: Request,
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
             user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:view"]))]):
     try:
         version_in_db = await asset_repo.get_asset_verison(asset_id, version_id, db_session)
@@ -115,27 +439,104 @@ async def get_asset_version(
         raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
     if version_in_db is None:
         raise HTTPException(status_code=404, detail="Asset Or Version Not Found!")
-    return version_in_db
+    # only content uploaded through the service is served, file_path of older versions is just a client string
+    if version_in_db.checksum is None or not storage.is_managed(version_in_db.file_path):
+        raise HTTPException(status_code=404, detail="Version Has No Stored Content")
+
+    etag = f'"{version_in_db.checksum}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    manifest = await chunk_repo.get_manifest(version_id, db_session)
+    size = sum(chunk_size for _, chunk_size in manifest)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes",
+               "Last-Modified": formatdate(version_in_db.created_at.timestamp(), usegmt=True),
+               "Content-Disposition": f'inline; filename="{asset_id}-v{version_in_db.version_number}"'}
+
+    ranges = _byte_ranges(request, etag, size)
+    if ranges is not None and len(ranges) > 1:
+        boundary = secrets.token_hex(16)
+        length = sum(len(_part_header(boundary, start, end, size)) + end - start + 2 for start, end in ranges) + len(boundary) + 6
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(_read_ranges(manifest, ranges, boundary, size), status_code=206,
+                                 media_type=f"multipart/byteranges; boundary={boundary}", headers=headers)
+    if ranges is None:
+        start, end, status_code = 0, size, 200
+    else:
+        [(start, end)], status_code = ranges, 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    # only the chunks overlapping the range are read, a block at a time
+    return StreamingResponse(storage.read_range(manifest, start, end), status_code=status_code,
+                             media_type="application/octet-stream", headers=headers)
+
+@router.get("/assets/{asset_id}/{version_id}/preview")
+async def get_asset_version_preview(
+            asset_id: int,
+            version_id: int,
+            request: Request,
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:view"]))]):
+    try:
+        version_in_db = await asset_repo.get_asset_verison(asset_id, version_id, db_session)
+        asset_type = await asset_repo.get_asset_type(asset_id, db_session)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
+    if version_in_db is None:
+        raise HTTPException(status_code=404, detail="Asset Or Version Not Found!")
+    if asset_type != AssetType.texture:
+        raise HTTPException(status_code=404, detail="Previews Are Only Made For Textures")
+    if version_in_db.checksum is None or not storage.is_managed(version_in_db.file_path):
+        raise HTTPException(status_code=404, detail="Version Has No Stored Content")
+
+    checksum = version_in_db.checksum
+    etag = f'"{checksum}-{previews.pipeline.cache.max_side}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    path = await asyncio.to_thread(previews.pipeline.cache.get, checksum)
+    if path is not None:
+        return FileResponse(path, media_type="image/png", headers={"ETag": etag, "Cache-Control": "public, max-age=86400"})
+    if previews.pipeline.failed_for(checksum):
+        raise HTTPException(status_code=422, detail="Content Is Not A Readable Image")
+    if previews.pipeline.too_large(version_in_db.size):
+        raise HTTPException(status_code=422, detail="Content Is Too Large For A Preview")
+    # evicted, or queued before a restart: made again on demand
+    if not previews.pipeline.pending(checksum):
+        previews.pipeline.submit(checksum, await chunk_repo.get_manifest(version_id, db_session))
+    return JSONResponse(status_code=202, content={"detail": "Preview Is Being Generated"}, headers={"Retry-After": "1"})
 
-@router.put("/assets/{asset_id}/{version_id}")
+@router.put("/assets/{asset_id}/{version_id}", response_model=AssetVersionOut)
 async def update_asset_version(
             asset_id: int, 
             version_id: int, 
             version_update: AssetVersionUpdate, 
+            response: Response,
             db_session: Annotated[AsyncSession, Depends(get_db_session)],
-            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:edit"]))]):
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:edit"]))],
+            if_match: Annotated[str | None, Header()] = None):
+    expected_versions = expected_row_versions(if_match)
     try:
-        updated_version = await asset_repo.update_asset_version(asset_id,version_id,version_update, db_session)
+        updated_version = await asset_repo.update_asset_version(asset_id,version_id,version_update, db_session, expected_versions)
     except asset_repo.AssetNotFound:
         raise HTTPException(status_code=404, detail="Asset Not Found")
+    except asset_repo.EditConflict:
+        raise precondition_failed()
+    except asset_repo.VersionAlreadyExists:
+        raise HTTPException(status_code=409, detail="Version Number Already Exists")
+    except asset_repo.ContentNotStored:
+        raise HTTPException(status_code=409, detail="No Stored Content Has That Checksum")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Something Went Wrong: {e}")
     if updated_version is None:
         raise HTTPException(status_code=404, detail="Asset Not Found")
+    # new content gets its preview started like an upload does; submit skips content that already has one
+    if ("file_path" in version_update.model_fields_set and updated_version.checksum is not None
+            and await asset_repo.get_asset_type(asset_id, db_session) == AssetType.texture):
+        previews.pipeline.submit(updated_version.checksum, await chunk_repo.get_manifest(version_id, db_session))
     
-    return AssetVersionOut.model_validate(updated_version)
+    response.headers["ETag"] = row_etag(updated_version.row_version)
+    return updated_version
 
-@router.delete("/assets/{asset_id}/{version_id}")
+@router.delete("/assets/{asset_id}/{version_id}", response_model=AssetVersionOut)
 async def delete_asset_version(
             asset_id: int, 
             version_id: int, 
@@ -149,4 +550,4 @@ async def delete_asset_version(
         raise HTTPException(status_code=500, detail="Something Went Wrong")
     if deleted_version is None:
         raise HTTPException(status_code=404, detail="Asset Not Found")
-    return AssetVersionOut.model_validate(deleted_version)
+    return deleted_version
@@ -12,7 +12,7 @@ from app.schemas.token import Token
 
 router = APIRouter(tags=["authentication"])
 
-@router.post("/token")
+@router.post("/token", response_model=Token)
 async def get_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
                     db_session: Annotated[AsyncSession, Depends(get_db_session)],
                     settings: Annotated[Settings, Depends(get_settings)]):
@@ -0,0 +1,142 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from starlette.requests import ClientDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import storage, previews
+from app.core.database import get_db_session
+from app.core.security import one_or_more_scopes
+from app.core.serialization import json_response
+from app.repositories import asset as asset_repo
+from app.repositories import chunk as chunk_repo
+from app.repositories import upload as upload_repo
+from app.schemas.user import UserInDb
+from app.schemas.asset import AssetType
+from app.schemas.upload import UploadNew, UploadOut, UploadedVersion
+from app.models.upload import Upload
+
+
+router = APIRouter(tags=["uploads"])
+
+
+async def _body(request: Request):
+    # a dropped connection ends the part early instead of failing it, the bytes that made it are kept
+    try:
+        async for chunk in request.stream():
+            yield chunk
+    except ClientDisconnect:
+        return
+
+
+async def _upload_out(upload: Upload) -> Response:
+    # missing_chunks is not a column, so the fields are gathered here and validated once, straight into the response
+    fields = {field: getattr(upload, field) for field in UploadOut.model_fields if field != "missing_chunks"}
+    return json_response(UploadOut, dict(fields, missing_chunks=await upload_repo.missing_chunks(upload)))
+
+
+@router.post("/assets/{asset_id}/uploads", response_model=UploadOut)
+async def start_upload(
+            asset_id: int,
+            new_upload: UploadNew,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    try:
+        return await _upload_out(await upload_repo.add_upload(asset_id, new_upload, db_session))
+    except asset_repo.AssetNotFound:
+        raise HTTPException(status_code=404, detail="Asset Not Found!")
+    except asset_repo.VersionAlreadyExists:
+        raise HTTPException(status_code=409, detail="Version Number Already Exists")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There Was An Internal Error: {e}")
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadOut)
+async def get_upload(
+            upload_id: str,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    try:
+        return await _upload_out(await upload_repo.get_upload(upload_id, db_session))
+    except upload_repo.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload Not Found")
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadOut)
+async def upload_part(
+            upload_id: str,
+            offset: int,
+            request: Request,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    try:
+        return await upload_repo.write_part(upload_id, offset, _body(request), db_session)
+    except upload_repo.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload Not Found")
+    except upload_repo.WrongUploadKind:
+        raise HTTPException(status_code=409, detail="Upload Takes Chunks")
+    except upload_repo.OffsetMismatch as e:
+        raise HTTPException(status_code=409, detail=f"Upload Is At Offset {e.offset}", headers={"Upload-Offset": str(e.offset)})
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload Is Larger Than Its Declared Size")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There Was An Internal Error: {e}")
+
+
+@router.put("/uploads/{upload_id}/chunks/{chunk_hash}", status_code=204)
+async def upload_chunk(
+            upload_id: str,
+            chunk_hash: str,
+            request: Request,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    try:
+        await upload_repo.write_chunk(upload_id, chunk_hash, request.stream(), db_session)
+    except upload_repo.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload Not Found")
+    except upload_repo.WrongUploadKind:
+        raise HTTPException(status_code=409, detail="Upload Takes A Byte Stream")
+    except upload_repo.NotInManifest:
+        raise HTTPException(status_code=404, detail="Chunk Not In Manifest")
+    except storage.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Chunk Is Larger Than Its Declared Size")
+    except upload_repo.ChecksumMismatch:
+        raise HTTPException(status_code=422, detail="Checksum Mismatch")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There Was An Internal Error: {e}")
+    return Response(status_code=204)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadedVersion)
+async def complete_upload(
+            upload_id: str,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    try:
+        version = await upload_repo.complete_upload(upload_id, db_session)
+    except upload_repo.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload Not Found")
+    except upload_repo.UploadIncomplete:
+        raise HTTPException(status_code=409, detail="Upload Is Not Complete")
+    except upload_repo.ChecksumMismatch:
+        raise HTTPException(status_code=422, detail="Checksum Mismatch")
+    except asset_repo.AssetNotFound:
+        raise HTTPException(status_code=404, detail="Asset Not Found!")
+    except asset_repo.VersionAlreadyExists:
+        raise HTTPException(status_code=409, detail="Version Number Already Exists")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"There Was An Internal Error: {e}")
+    # the preview is started now so it is usually ready before anyone asks for it
+    if await asset_repo.get_asset_type(version.asset_id, db_session) == AssetType.texture:
+        previews.pipeline.submit(version.checksum, await chunk_repo.get_manifest(version.id, db_session))
+    return version
+
+
+@router.delete("/uploads/{upload_id}", response_model=UploadOut)
+async def abort_upload(
+            upload_id: str,
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            user: Annotated[UserInDb, Depends(one_or_more_scopes(["version:*", "version:add"]))]):
+    try:
+        return await upload_repo.delete_upload(upload_id, db_session)
+    except upload_repo.UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload Not Found")
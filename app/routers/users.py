@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, Query, Body, HTTPException
+from fastapi import APIRouter, Depends, Query, Body, Header, HTTPException, Response
 from typing import Annotated
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core import utils
 from app.schemas.user import UserInput, UserInDb, UserOut, UserUpdate, UserSearch
-from app.core.database import get_db_session
+from app.core.database import get_db_session, get_db_read_session
+from app.core.preconditions import row_etag, expected_row_versions, precondition_failed
 from app.core.security import get_current_user, one_or_more_scopes
 from app.repositories import user as userRepo
 
@@ -12,7 +13,7 @@ from app.repositories import user as userRepo
 router = APIRouter(tags=["Users"])
 
 
-@router.post("/signup")
+@router.post("/signup", response_model=UserOut)
 async def create_new_account(
             db_session: Annotated[AsyncSession, Depends(get_db_session)],
             user_input: Annotated[UserInput, Body()]):
@@ -24,33 +25,31 @@ async def create_new_account(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"something whent wrong; {e}")
     
-    new_user_in_db = UserInDb.model_validate(new_user)
-    return UserOut(**new_user_in_db.model_dump())
+    return new_user
     
 
 @router.get("/user/me", response_model=UserOut)
 async def get_user_me(
             user: Annotated[UserInDb, Depends(get_current_user)]):
     
-    user = user.model_dump()
-    return UserOut(**user)
+    return user
 
 @router.get("/users/{user_id}", response_model=UserOut)
 async def get_user(
             user_id:int, 
+            response: Response,
             user: Annotated[UserInDb, Depends(one_or_more_scopes(["user:*", "user:me"]))], 
-            db_session: Annotated[AsyncSession, Depends(get_db_session)]):
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)]):
     
     user_scopes = utils.get_scopes(user.roles)
-    user_scopes_list = user_scopes.split(" ")
     user_in_db = await userRepo.get_user_by_id(user_id, db_session)
     if user_in_db is None:
         raise HTTPException(status_code=404, detail="user not found")
-    user_in_db = UserInDb.model_validate(user_in_db)
-    if "user:*" in user_scopes_list:
-        return UserOut(**user_in_db.model_dump())
-    elif "user:me" in user_scopes_list and user.id == user_id:
-        return UserOut(**user_in_db.model_dump())
+    response.headers["ETag"] = row_etag(user_in_db.row_version)
+    if utils.scope_granted(user_scopes, "user:*"):
+        return user_in_db
+    elif utils.scope_granted(user_scopes, "user:me") and user.id == user_id:
+        return user_in_db
     raise HTTPException(status_code=401, detail="you do not have access to user you wanted")
 
 
@@ -66,25 +65,31 @@ async def delete_user(
     return {"deleted id:": user_id}
 
 
-@router.put("/users/{user_id}")
+@router.put("/users/{user_id}", response_model=UserOut)
 async def update_user(
             user_id: int,
             updated_user: UserUpdate,
+            response: Response,
             user: Annotated[UserInDb, Depends(one_or_more_scopes(["user:*"]))],
-            db_session: Annotated[AsyncSession, Depends(get_db_session)]):
+            db_session: Annotated[AsyncSession, Depends(get_db_session)],
+            if_match: Annotated[str | None, Header()] = None):
 
-    user_updated = await userRepo.update_user(user_id, updated_user, db_session)
+    try:
+        user_updated = await userRepo.update_user(user_id, updated_user, db_session, expected_row_versions(if_match))
+    except userRepo.EditConflict:
+        raise precondition_failed()
+    except userRepo.UsernameAlreadyExists:
+        raise HTTPException(status_code=400, detail="username already exists")
     if not user_updated:
         raise HTTPException(status_code=404, detail="user not found")
-    user_in_db = UserInDb.model_validate(user_updated)
-    return UserOut(**user_in_db.model_dump())
+    response.headers["ETag"] = row_etag(user_updated.row_version)
+    return user_updated
 
 
-@router.get("/users/")
+@router.get("/users/", response_model=list[UserOut])
 async def search_user(
-            db_session: Annotated[AsyncSession, Depends(get_db_session)], 
+            db_session: Annotated[AsyncSession, Depends(get_db_read_session)], 
             user: Annotated[UserInDb, Depends(get_current_user)],
             user_search: Annotated[UserSearch, Query()]):
     
-    users = await userRepo.find_user(db_session=db_session, user_search=user_search)
-    return [UserOut.model_validate(user) for user in users]
\ No newline at end of file
+    return await userRepo.find_user(db_session=db_session, user_search=user_search)
\ No newline at end of file
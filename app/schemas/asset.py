@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from datetime import datetime
 from enum import Enum
 
@@ -14,10 +14,17 @@ class AssetType(str, Enum):
     rig = "rig"
     animaton = "animation"
 
+class SearchOrder(str, Enum):
+    id = "id"
+    last_update = "last_update"
+
+MAX_PAGE_SIZE = 100
+
 
 #ASSET VERSION
 class AssetVersionNew(BaseModel):
-    version_number: int
+    # left out, the server gives the version the asset's next number
+    version_number: int | None = None
     file_path: str
     status: AssetStatus = AssetStatus.InProgress
     
@@ -25,12 +32,14 @@ class AssetVersionNew(BaseModel):
 class AssetVersionInDb(AssetVersionNew):
     model_config = ConfigDict(from_attributes=True)
 
+    version_number: int
     id: int
     asset_id: int
     status : AssetStatus
 
 class AssetVersionOut(AssetVersionNew):
     model_config = ConfigDict(from_attributes=True)
+    version_number: int
     id: int
     asset_id: int
 
@@ -39,12 +48,26 @@ class AssetVersionUpdate(BaseModel):
     file_path: str | None = None
     status: AssetStatus | None = None
 
+class AssetVersionBulkNew(AssetVersionNew):
+    asset_id: int
+
+class AssetVersionBulkCreated(BaseModel):
+    index: int
+    id: int
+    asset_id: int
+
+class AssetVersionPage(BaseModel):
+    items: list[AssetVersionOut]
+    next_cursor: str | None
+
 class AssetVersionSearch(BaseModel):
     id: int | None = None
     version_number: int | None = None
     status: AssetStatus | None = None
-    limit: int = 10
+    limit: int = Field(default=10, ge=1, le=MAX_PAGE_SIZE)
     offset: int = 0
+    cursor: str | None = None
+    order_by: SearchOrder = SearchOrder.id
     
 
 
@@ -55,6 +78,38 @@ class AssetNew(BaseModel):
     description: str
     asset_type: AssetType
 
+class AssetBulkNew(AssetNew):
+    versions: list[AssetVersionNew] = []
+
+    @field_validator("versions")
+    @classmethod
+    def check_version_numbers(cls, versions: list[AssetVersionNew]) -> list[AssetVersionNew]:
+        # caught here the item is reported on its own, in the database it would fail the whole batch
+        numbers = [version.version_number for version in versions if version.version_number is not None]
+        repeated = sorted({number for number in numbers if numbers.count(number) > 1})
+        if repeated:
+            raise ValueError(f"version numbers {repeated} are listed more than once")
+        return versions
+
+class AssetBulkCreated(BaseModel):
+    index: int
+    id: int
+    version_ids: list[int]
+
+class AssetBulkError(BaseModel):
+    index: int
+    detail: str
+
+class AssetBulkOut(BaseModel):
+    created: list[AssetBulkCreated]
+    errors: list[AssetBulkError]
+
+class AssetVersionBulkOut(BaseModel):
+    created: list[AssetVersionBulkCreated]
+    errors: list[AssetBulkError]
+
+MAX_BULK_ITEMS = 10000
+
 class AssetInDb(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
@@ -73,14 +128,77 @@ class AssetOut(AssetNew):
     versions: list[AssetVersionInDb] | None
 
 
+MAX_MULTI_GET = 1000
+
+class AssetIds(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=MAX_MULTI_GET)
+
+class AssetMultiOut(BaseModel):
+    items: list[AssetOut]
+    missing: list[int]
+
+class AssetDeleteFilter(BaseModel):
+    ids: list[int] | None = Field(default=None, min_length=1, max_length=MAX_MULTI_GET)
+    asset_type: AssetType | None = None
+    # compared with created_at
+    older_than: datetime | None = None
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        # an empty filter would match every asset, that is never what a caller meant
+        if self.ids is None and self.asset_type is None and self.older_than is None:
+            raise ValueError("at least one of ids, asset_type or older_than is required")
+        return self
+
+class AssetDeleteOut(BaseModel):
+    deleted: int
+
+
 class AssetUpdate(BaseModel):
     name: str | None = None
     description: str | None = None
     asset_type: AssetType | None = None
 
-class AssetSearch(BaseModel):
+ASSET_FIELDS = ("id", "name", "description", "asset_type")
+
+class AssetProjection(BaseModel):
+    fields: str | None = None
+    include_versions: bool = True
+    versions_limit: int | None = Field(default=None, ge=0, le=MAX_PAGE_SIZE)
+
+    @field_validator("fields")
+    @classmethod
+    def check_fields(cls, fields: str | None) -> str | None:
+        if fields is not None:
+            unknown = set(fields.split(",")) - set(ASSET_FIELDS)
+            if unknown:
+                raise ValueError(f"unknown fields {sorted(unknown)}, expected some of {list(ASSET_FIELDS)}")
+        return fields
+
+    def asset_fields(self) -> list[str]:
+        if self.fields is None:
+            return list(ASSET_FIELDS)
+        requested = set(self.fields.split(","))
+        return [field for field in ASSET_FIELDS if field == "id" or field in requested]
+
+    def is_default(self) -> bool:
+        return self.fields is None and self.include_versions and self.versions_limit is None
+
+class AssetSearch(AssetProjection):
     id: int | None = None
     name: str | None = None
+    q: str | None = None
     asset_type: AssetType | None = None
-    limit: int = 10
+    limit: int = Field(default=10, ge=1, le=MAX_PAGE_SIZE)
     offset: int = 0
+    cursor: str | None = None
+    order_by: SearchOrder = SearchOrder.id
+
+class AssetExport(BaseModel):
+    asset_type: AssetType | None = None
+    updated_since: datetime | None = None
+    batch_size: int = Field(default=500, ge=1, le=5000)
+
+class AssetPage(BaseModel):
+    items: list[AssetOut] | list[dict]
+    next_cursor: str | None
@@ -0,0 +1,47 @@
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from app.core.storage import CHUNK_MAX_BYTES
+from app.schemas.asset import AssetStatus, AssetVersionOut
+
+
+class ChunkRef(BaseModel):
+    hash: str = Field(pattern="^[0-9a-f]{64}$")
+    # write_chunk holds a chunk in memory to hash it, the size bounds that
+    size: int = Field(ge=1, le=CHUNK_MAX_BYTES)
+
+class UploadNew(BaseModel):
+    # left out, the version is numbered when the upload completes
+    version_number: int | None = None
+    status: AssetStatus = AssetStatus.InProgress
+    size: int | None = Field(default=None, ge=0)
+    checksum: str | None = Field(default=None, pattern="^[0-9a-f]{64}$")
+    # the content as chunks (see app.core.storage.split); only the missing ones have to be sent
+    chunks: list[ChunkRef] | None = None
+
+    @model_validator(mode="after")
+    def check_manifest(self):
+        if self.chunks is None:
+            return self
+        if self.checksum is None:
+            raise ValueError("checksum is required with chunks")
+        if self.size is not None and self.size != sum(chunk.size for chunk in self.chunks):
+            raise ValueError("size does not match the chunks")
+        sizes = {}
+        for chunk_ref in self.chunks:
+            if sizes.setdefault(chunk_ref.hash, chunk_ref.size) != chunk_ref.size:
+                raise ValueError(f"chunk {chunk_ref.hash} is listed with different sizes")
+        return self
+
+class UploadOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    asset_id: int
+    version_number: int | None
+    size: int | None
+    offset: int
+    missing_chunks: list[str] | None = None
+
+class UploadedVersion(AssetVersionOut):
+    checksum: str
+    size: int
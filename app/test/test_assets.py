@@ -1,11 +1,16 @@
+import hashlib, json
 import pytest
 import pytest_asyncio
+from sqlalchemy import event, select
 
 
-from app.core import security
+from app.core import security, storage
+from app.repositories import asset as asset_repo
+from app.models.asset import AssetVersion
+from app.models.chunk import Chunk, VersionChunk
 from app.models.user import User
 from app.schemas.asset import AssetNew, AssetVersionNew, AssetUpdate, AssetVersionUpdate, AssetSearch
-from app.test.test_config import async_client, clean_db, get_test_session
+from app.test.test_config import async_client, clean_db, engine, get_test_session
 
 
 ADMINUSER = {"username":"admin", "password":"admin", "roles": "admin", "id":1}
@@ -19,6 +24,8 @@ Ver1 = {"version_number": 1, "file_path": "/somewhere/imp", "status": "Published
 ver2 = {"version_number": 2, "file_path": "/somewhere/imp2", "status": "ReadyForReview", "id":0, "asset_id": 0}
 ver3 = {"version_number": 3, "file_path": "/somewhere/imp3", "status": "Published", "id":0, "asset_id": 0}
 
+ETAGS = {}
+
 @pytest_asyncio.fixture
 async def admin_token(async_client):
     data = {"username": ADMINUSER["username"], "password": ADMINUSER["password"]}
@@ -92,6 +99,9 @@ async def test_add_version(async_client, admin_token):
     ver2["asset_id"] = response_data['asset_id']
     ASSET1['versions'].append(response_data)
 
+    response = await async_client.post(f"/assets/{ASSET1['id']}", headers = headers, json=payload)
+    assert response.status_code == 409
+
 
 @pytest.mark.asyncio
 async def test_get_asset(async_client, admin_token):
@@ -106,6 +116,20 @@ async def test_get_asset(async_client, admin_token):
     assert response.status_code == 404
     assert response.json() == {'detail': 'Asset Not Found'}
 
+@pytest.mark.asyncio
+async def test_latest_version(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get(f"/assets/{ASSET1['id']}/latest", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == ASSET1["versions"][1]
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}/latest", headers=headers, params={"published": True})
+    assert response.status_code == 200
+    assert response.json() == ASSET1["versions"][0]
+
+    response = await async_client.get(f"/assets/{ASSET2['id']}/latest", headers=headers)
+    assert response.status_code == 404
+
 @pytest.mark.asyncio
 async def test_update_asset(async_client, admin_token):
     headers = {"Authorization": f"Bearer {admin_token}"}
@@ -144,6 +168,26 @@ async def test_get_asset_version(async_client, admin_token):
 
 
 
+@pytest.mark.asyncio
+async def test_conditional_get(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get(f"/assets/{ASSET1['id']}", headers=headers)
+    assert response.status_code == 200
+    ETAGS["asset"] = response.headers["etag"]
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}", headers={**headers, "If-None-Match": ETAGS["asset"]})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}/{Ver1['id']}", headers=headers)
+    assert response.status_code == 200
+    ETAGS["version"] = response.headers["etag"]
+    assert ETAGS["version"] != ETAGS["asset"]
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}/{Ver1['id']}", headers={**headers, "If-None-Match": '"other", ' + ETAGS["version"]})
+    assert response.status_code == 304
+
+
 @pytest.mark.asyncio
 async def test_update_asset_version(async_client, admin_token):
     headers = {"Authorization": f"Bearer {admin_token}"}
@@ -155,6 +199,14 @@ async def test_update_asset_version(async_client, admin_token):
     Ver1["status"] = "ReadyForReview"
     ASSET1["versions"][0] = Ver1
 
+    for path, etag in ((f"/assets/{ASSET1['id']}", ETAGS["asset"]), (f"/assets/{ASSET1['id']}/{Ver1['id']}", ETAGS["version"])):
+        response = await async_client.get(path, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}/latest", headers=headers, params={"published": True})
+    assert response.status_code == 404
+
     response = await async_client.put(f"/assets/{ASSET1['id']}/{200}", headers=headers, json=payload)
     assert response.status_code == 404
     assert response.json() == {'detail': 'Asset Not Found'}
@@ -163,6 +215,77 @@ async def test_update_asset_version(async_client, admin_token):
     assert response.status_code == 404
     assert response.json() == {'detail': 'Asset Not Found'}
 
+@pytest.mark.asyncio
+async def test_update_if_match(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get(f"/assets/{ASSET1['id']}", headers=headers)
+    seen = response.headers["etag"]
+    response = await async_client.put(f"/assets/{ASSET1['id']}", headers={**headers, "If-Match": seen}, json={"description": ASSET1["description"]})
+    assert response.status_code == 200
+    assert response.headers["etag"] != seen
+
+    # the second artist still holds the old tag and must not overwrite the first one's edit
+    for stale in (seen, "W/" + response.headers["etag"], '"not-a-row-version"'):
+        response = await async_client.put(f"/assets/{ASSET1['id']}", headers={**headers, "If-Match": stale}, json={"description": "lost update"})
+        assert response.status_code == 412
+    response = await async_client.get(f"/assets/{ASSET1['id']}", headers=headers)
+    assert response.json()["description"] == ASSET1["description"]
+    response = await async_client.put(f"/assets/{100}", headers={**headers, "If-Match": seen}, json={"description": "lost update"})
+    assert response.status_code == 404
+
+    url = f"/assets/{ASSET1['id']}/{Ver1['id']}"
+    response = await async_client.get(url, headers=headers)
+    seen = response.headers["etag"]
+    response = await async_client.put(url, headers={**headers, "If-Match": seen}, json={"status": Ver1["status"]})
+    assert response.status_code == 200
+    response = await async_client.put(url, headers={**headers, "If-Match": seen}, json={"status": "Published"})
+    assert response.status_code == 412
+    response = await async_client.put(url, headers={**headers, "If-Match": "*"}, json={"status": Ver1["status"]})
+    assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_cache_fill_racing_a_write(async_client, admin_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post("/assets", headers=headers, json={"name": "race", "description": "old", "asset_type": "rig"})
+    asset_id = response.json()["id"]
+    get_assets = asset_repo.get_assets
+
+    async def read_then_write(*args, **kwargs):
+        # the read is done, an edit commits before its result goes into the cache
+        monkeypatch.setattr(asset_repo, "get_assets", get_assets)
+        asset = await get_assets(*args, **kwargs)
+        response = await async_client.put(f"/assets/{asset_id}", headers=headers, json={"description": "new"})
+        assert response.status_code == 200
+        return asset
+
+    monkeypatch.setattr(asset_repo, "get_assets", read_then_write)
+    response = await async_client.get(f"/assets/{asset_id}", headers=headers)
+    assert response.json()["description"] == "old"
+    response = await async_client.get(f"/assets/{asset_id}", headers=headers)
+    assert response.json()["description"] == "new"
+    await async_client.delete(f"/assets/{asset_id}", headers=headers)
+
+@pytest.mark.asyncio
+async def test_etags_of_reused_ids(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    # a deleted row's id can be handed out again, its tags must not match the new row
+    seen = {}
+    for name in ("first", "second"):
+        response = await async_client.post("/assets", headers=headers, json={"name": name, "description": name, "asset_type": "rig"})
+        asset_id = response.json()["id"]
+        response = await async_client.post(f"/assets/{asset_id}", headers=headers, json={"file_path": f"/reused/{name}"})
+        version_id = response.json()["id"]
+        if seen:
+            assert (asset_id, version_id) == seen["ids"]
+            for path, etag in ((f"/assets/{asset_id}", seen["asset"]), (f"/assets/{asset_id}/{version_id}", seen["version"])):
+                response = await async_client.get(path, headers={**headers, "If-None-Match": etag})
+                assert response.status_code == 200
+            assert response.json()["file_path"] == "/reused/second"
+        seen = {"ids": (asset_id, version_id),
+                "asset": (await async_client.get(f"/assets/{asset_id}", headers=headers)).headers["etag"],
+                "version": (await async_client.get(f"/assets/{asset_id}/{version_id}", headers=headers)).headers["etag"]}
+        await async_client.delete(f"/assets/{asset_id}", headers=headers)
+
 @pytest.mark.asyncio
 async def test_search_asset(async_client, admin_token):
     headers = {"Authorization": f"Bearer {admin_token}"}
@@ -171,6 +294,124 @@ async def test_search_asset(async_client, admin_token):
     assert response.status_code == 200
     assert response.json() == [ASSET1, ASSET2]
 
+@pytest.mark.asyncio
+async def test_search_asset_full_text(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get("/assets/", headers=headers, params={"q": "chang"})
+    assert response.status_code == 200
+    assert response.json() == [ASSET1]
+
+    response = await async_client.get("/assets/", headers=headers, params={"q": "describe asset"})
+    assert response.status_code == 200
+    assert [asset["id"] for asset in response.json()] == [ASSET2["id"]]
+
+    response = await async_client.get("/assets/", headers=headers, params={"q": 'asset2" OR *'})
+    assert response.status_code == 200
+    assert response.json() == []
+
+@pytest.mark.asyncio
+async def test_search_asset_without_index(async_client, admin_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    # databases without FTS5 match substrings, the words are still taken literally
+    monkeypatch.setattr(asset_repo, "_has_search_index", lambda db_session: False)
+    response = await async_client.get("/assets/", headers=headers, params={"q": "set"})
+    assert sorted(asset["id"] for asset in response.json()) == sorted([ASSET1["id"], ASSET2["id"]])
+    for q in ("asset_", "%", "\\"):
+        response = await async_client.get("/assets/", headers=headers, params={"q": q})
+        assert response.status_code == 200
+        assert response.json() == []
+
+@pytest.mark.asyncio
+async def test_search_asset_projection(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get("/assets/", headers=headers, params={"fields": "name", "include_versions": False})
+    assert response.status_code == 200
+    assert response.json() == [{"id": ASSET1["id"], "name": ASSET1["name"]}, {"id": ASSET2["id"], "name": ASSET2["name"]}]
+
+    response = await async_client.get("/assets/", headers=headers, params={"versions_limit": 1, "cursor": ""})
+    assert response.status_code == 200
+    assert [asset["versions"] for asset in response.json()["items"]] == [ASSET1["versions"][1:], []]
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}", headers=headers, params={"fields": "asset_type", "versions_limit": 5})
+    assert response.status_code == 200
+    assert response.json() == {"id": ASSET1["id"], "asset_type": ASSET1["asset_type"], "versions": ASSET1["versions"]}
+
+    response = await async_client.get("/assets/", headers=headers, params={"fields": "name,password"})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_search_asset_cursor(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get("/assets/", headers=headers, params={"limit": 1, "cursor": ""})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["items"] == [ASSET1]
+    assert data["next_cursor"] is not None
+
+    response = await async_client.get("/assets/", headers=headers, params={"limit": 1, "cursor": data["next_cursor"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["items"] == [ASSET2]
+
+    response = await async_client.get("/assets/", headers=headers, params={"limit": 1, "cursor": data["next_cursor"]})
+    assert response.status_code == 200
+    assert response.json() == {"items": [], "next_cursor": None}
+
+    response = await async_client.get("/assets/", headers=headers, params={"order_by": "last_update", "cursor": ""})
+    assert response.status_code == 200
+    assert [asset["id"] for asset in response.json()["items"]] == [ASSET2["id"], ASSET1["id"]]
+
+    response = await async_client.get("/assets/", headers=headers, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    response = await async_client.get("/assets/", headers=headers, params={"limit": 1000})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_search_asset_version_cursor(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get(f"/assets/{ASSET1['id']}/versions/", headers=headers, params={"limit": 1, "cursor": ""})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["items"] == [ASSET1["versions"][0]]
+
+    response = await async_client.get(f"/assets/{ASSET1['id']}/versions/", headers=headers, params={"limit": 1, "cursor": data["next_cursor"]})
+    assert response.status_code == 200
+    assert response.json()["items"] == [ASSET1["versions"][1]]
+
+@pytest.mark.asyncio
+async def test_export_assets(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get("/assets/export", headers=headers, params={"batch_size": 1})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [ASSET1["id"], ASSET2["id"]]
+    assert lines[0]["versions"] == ASSET1["versions"]
+
+    response = await async_client.get("/assets/export", headers=headers, params={"asset_type": "texture"})
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [ASSET2["id"]]
+
+@pytest.mark.asyncio
+async def test_get_assets_by_ids(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    ids = f"{ASSET2['id']},100,{ASSET1['id']},{ASSET2['id']}"
+    response = await async_client.get("/assets", headers=headers, params={"ids": ids})
+    assert response.status_code == 200
+    assert response.json() == {"items": [ASSET2, ASSET1], "missing": [100]}
+
+    response = await async_client.post("/assets/lookup", headers=headers, json={"ids": [ASSET1["id"], 100]})
+    assert response.status_code == 200
+    assert response.json() == {"items": [ASSET1], "missing": [100]}
+
+    response = await async_client.get("/assets", headers=headers, params={"ids": "1,two"})
+    assert response.status_code == 422
+
+    response = await async_client.get("/assets", headers=headers, params={"name": ASSET2["name"]}, follow_redirects=True)
+    assert response.status_code == 200
+    assert response.json() == [ASSET2]
+
 @pytest.mark.asyncio
 async def test_delete_version(async_client, admin_token):
     headers = {"Authorization": f"Bearer {admin_token}"}
@@ -190,4 +431,166 @@ async def test_delete_asset_version(async_client, admin_token):
     assert response.status_code == 404
 
     response = await async_client.get(f"assets/{ASSET1}/{Ver1['id']}")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_add_assets_bulk(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    payload = [
+        {"name": "bulk1", "description": "d", "asset_type": "rig"},
+        {"name": "bulk2", "description": "d", "asset_type": "nope"},
+        {"name": "bulk3", "description": "d", "asset_type": "texture",
+         "versions": [{"version_number": 1, "file_path": "/bulk/3/1"}, {"version_number": 2, "file_path": "/bulk/3/2"}]},
+        {"name": "bulk4", "description": "d", "asset_type": "rig",
+         "versions": [{"version_number": 1, "file_path": "/bulk/4/1"}, {"version_number": 1, "file_path": "/bulk/4/1again"}]},
+    ]
+    response = await async_client.post("/assets/bulk", headers=headers, json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["index"] for item in data["created"]] == [0, 2]
+    assert [error["index"] for error in data["errors"]] == [1, 3]
+    assert "listed more than once" in data["errors"][1]["detail"]
+    assert data["created"][0]["version_ids"] == []
+    assert len(data["created"][1]["version_ids"]) == 2
+
+    response = await async_client.get(f"/assets/{data['created'][1]['id']}", headers=headers)
+    assert response.status_code == 200
+    assert [version["file_path"] for version in response.json()["versions"]] == ["/bulk/3/1", "/bulk/3/2"]
+
+    ndjson = "\n".join(json.dumps(item) for item in payload[:1]) + "\nnot json\n"
+    response = await async_client.post("/assets/bulk", headers={**headers, "Content-Type": "application/x-ndjson"}, content=ndjson)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["index"] for item in data["created"]] == [0]
+    assert [error["index"] for error in data["errors"]] == [1]
+
+
+@pytest.mark.asyncio
+async def test_add_versions_bulk(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    payload = [
+        {"asset_id": ASSET2["id"], "version_number": 1, "file_path": "/bulk/a2/1"},
+        {"asset_id": 999, "version_number": 1, "file_path": "/bulk/missing"},
+        {"asset_id": ASSET2["id"], "version_number": 2, "file_path": "/bulk/a2/2", "status": "Published"},
+    ]
+    response = await async_client.post("/assets/versions/bulk", headers=headers, json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["index"] for item in data["created"]] == [0, 2]
+    assert data["errors"] == [{"index": 1, "detail": "Asset 999 Not Found"}]
+
+    response = await async_client.get(f"/assets/{ASSET2['id']}", headers=headers)
+    assert [version["id"] for version in response.json()["versions"]] == [item["id"] for item in data["created"]]
+
+    response = await async_client.get(f"/assets/{ASSET2['id']}/latest", headers=headers, params={"published": True})
+    assert response.json()["id"] == data["created"][1]["id"]
+
+@pytest.mark.asyncio
+async def test_server_numbered_versions(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    # ASSET2 holds client numbered versions 1 and 2, the server carries on after them
+    numbers = []
+    for n in range(3):
+        response = await async_client.post(f"/assets/{ASSET2['id']}", headers=headers, json={"file_path": f"/auto/{n}"})
+        assert response.status_code == 200
+        numbers.append(response.json()["version_number"])
+    assert numbers == [3, 4, 5]
+
+    # numbers are not reused once their version is deleted
+    response = await async_client.get(f"/assets/{ASSET2['id']}/latest", headers=headers)
+    await async_client.delete(f"/assets/{ASSET2['id']}/{response.json()['id']}", headers=headers)
+    payload = [{"asset_id": ASSET2["id"], "file_path": "/auto/bulk/1"},
+               {"asset_id": ASSET2["id"], "version_number": 10, "file_path": "/auto/bulk/10"},
+               {"asset_id": ASSET2["id"], "file_path": "/auto/bulk/2"}]
+    response = await async_client.post("/assets/versions/bulk", headers=headers, json=payload)
+    assert len(response.json()["created"]) == 3
+    response = await async_client.get(f"/assets/{ASSET2['id']}", headers=headers)
+    # like in a new asset, unnumbered versions follow the highest number in the batch
+    assert [version["version_number"] for version in response.json()["versions"]][-3:] == [10, 11, 12]
+    response = await async_client.post(f"/assets/{ASSET2['id']}", headers=headers, json={"file_path": "/auto/after"})
+    assert response.json()["version_number"] == 13
+
+    # a number the client picked is not handed out again after its version is deleted either
+    response = await async_client.post(f"/assets/{ASSET2['id']}", headers=headers, json={"version_number": 20, "file_path": "/auto/20"})
+    await async_client.delete(f"/assets/{ASSET2['id']}/{response.json()['id']}", headers=headers)
+    response = await async_client.post(f"/assets/{ASSET2['id']}", headers=headers, json={"file_path": "/auto/after/20"})
+    assert response.json()["version_number"] == 21
+
+    # nor is a number a version was edited to
+    response = await async_client.put(f"/assets/{ASSET2['id']}/{response.json()['id']}", headers=headers, json={"version_number": 30})
+    assert response.status_code == 200
+    await async_client.delete(f"/assets/{ASSET2['id']}/{response.json()['id']}", headers=headers)
+    response = await async_client.post(f"/assets/{ASSET2['id']}", headers=headers, json={"file_path": "/auto/after/30"})
+    assert response.json()["version_number"] == 31
+
+    response = await async_client.post(f"/assets/{999}", headers=headers, json={"file_path": "/auto/missing"})
+    assert response.status_code == 404
+
+    response = await async_client.post("/assets/bulk", headers=headers,
+                                       json=[{"name": "auto", "description": "d", "asset_type": "rig", "versions": [{"file_path": "/b/1"}, {"version_number": 4, "file_path": "/b/4"}, {"file_path": "/b/5"}]}])
+    asset_id = response.json()["created"][0]["id"]
+    response = await async_client.get(f"/assets/{asset_id}", headers=headers)
+    assert [version["version_number"] for version in response.json()["versions"]] == [4, 5, 6]
+    await async_client.delete(f"/assets/{asset_id}/{response.json()['versions'][-1]['id']}", headers=headers)
+    payload = [{"asset_id": asset_id, "version_number": 8, "file_path": "/b/8"}, {"asset_id": 999, "file_path": "/b/missing"},
+               {"asset_id": ASSET2["id"], "file_path": "/auto/bulk/3"}]
+    allocations = []
+    def count_allocations(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE assets SET") and "last_version_number=" in statement:
+            allocations.append(statement)
+    # all assets of a batch get their numbers in one statement
+    event.listen(engine.sync_engine, "before_cursor_execute", count_allocations)
+    try:
+        response = await async_client.post("/assets/versions/bulk", headers=headers, json=payload)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_allocations)
+    assert len(allocations) == 1
+    assert [error["index"] for error in response.json()["errors"]] == [1]
+    await async_client.delete(f"/assets/{asset_id}/{response.json()['created'][0]['id']}", headers=headers)
+    response = await async_client.post(f"/assets/{asset_id}", headers=headers, json={"file_path": "/b/next"})
+    assert response.json()["version_number"] == 9
+
+@pytest.mark.asyncio
+async def test_bulk_delete(async_client, admin_token, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_DIR", tmp_path)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    asset_ids, contents = [], []
+    for n, asset_type in enumerate(["texture", "texture", "rig"]):
+        response = await async_client.post("/assets", headers=headers, json={"name": f"crate{n}", "description": "d", "asset_type": asset_type})
+        asset_ids.append(response.json()["id"])
+        contents.append(hashlib.sha256(f"crate{n}".encode()).hexdigest().encode())
+        response = await async_client.post(f"/assets/{asset_ids[-1]}/uploads", headers=headers,
+                                           json={"version_number": 1, "checksum": hashlib.sha256(contents[-1]).hexdigest()})
+        upload_id = response.json()["id"]
+        await async_client.put(f"/uploads/{upload_id}", headers=headers, params={"offset": 0}, content=contents[-1])
+        response = await async_client.post(f"/uploads/{upload_id}/complete", headers=headers)
+        assert response.status_code == 200
+    response = await async_client.post(f"/assets/{asset_ids[0]}/uploads", headers=headers, json={"version_number": 2})
+    pending_upload = response.json()["id"]
+    assert storage.upload_path(pending_upload).exists()
+
+    response = await async_client.delete("/assets", headers=headers)
+    assert response.status_code == 422
+
+    response = await async_client.delete("/assets", headers=headers, params={"asset_type": "texture", "ids": f"{asset_ids[0]},{asset_ids[1]},{asset_ids[2]}"})
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 2}
+
+    response = await async_client.get("/assets", headers=headers, params={"ids": ",".join(map(str, asset_ids))})
+    assert response.json()["missing"] == asset_ids[:2]
+    response = await async_client.get("/assets/", headers=headers, params={"q": "crate"})
+    assert [asset["id"] for asset in response.json()] == asset_ids[2:]
+    # the versions, their chunk references and the staged upload went with the assets
+    async for session in get_test_session():
+        versions = select(AssetVersion.id).where(AssetVersion.asset_id.in_(asset_ids))
+        assert (await session.execute(select(AssetVersion.asset_id).where(AssetVersion.asset_id.in_(asset_ids)))).scalars().all() == asset_ids[2:]
+        assert len((await session.execute(select(VersionChunk).where(VersionChunk.version_id.in_(versions)))).all()) == 1
+        hashes = [hashlib.sha256(content).hexdigest() for content in contents]
+        refcounts = dict((await session.execute(select(Chunk.hash, Chunk.refcount).where(Chunk.hash.in_(hashes)))).all())
+        assert [refcounts[chunk_hash] for chunk_hash in hashes] == [0, 0, 1]
+    assert not storage.upload_path(pending_upload).exists()
+    response = await async_client.get(f"/uploads/{pending_upload}", headers=headers)
+    assert response.status_code == 404
+
+    response = await async_client.delete("/assets", headers=headers, params={"older_than": "2000-01-01T00:00:00"})
+    assert response.json() == {"deleted": 0}
@@ -8,8 +8,8 @@ from httpx import AsyncClient, ASGITransport
 from app.main import app
 from app.models.user import User
 from app.schemas.user import UserUpdate
-from app.core.database import Base
-from app.core.security import get_db_session
+from app.core.config import get_settings
+from app.core.database import Base, get_db_session, get_db_read_session, get_db_sessionmaker, apply_sqlite_profile
 from app.core import security
 from app.repositories import user as user_repo
 
@@ -18,12 +18,15 @@ from app.repositories import user as user_repo
 
 DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 engine = create_async_engine(DATABASE_URL, echo=False)
+# same pragmas as the app's engine, foreign keys and their cascades included
+apply_sqlite_profile(engine, get_settings())
 
 @pytest_asyncio.fixture
 async def clean_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+    security.principal_cache.clear()
 
 
 AsyncTestSessionLocal = async_sessionmaker(
@@ -51,4 +54,6 @@ async def get_test_session():
     finally:
         await db.close()
 
-app.dependency_overrides[get_db_session] = get_test_session
\ No newline at end of file
+app.dependency_overrides[get_db_session] = get_test_session
+app.dependency_overrides[get_db_read_session] = get_test_session
+app.dependency_overrides[get_db_sessionmaker] = lambda: AsyncTestSessionLocal
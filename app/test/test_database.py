@@ -0,0 +1,129 @@
+import time
+from typing import Annotated
+import pytest
+from fastapi import FastAPI, Depends, Request
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from app.core import database, migrations
+from app.core.config import get_settings
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pool_profile(tmp_path):
+    settings = get_settings().model_copy(update={"db_pool_size": 1, "db_max_overflow": 0, "db_pool_timeout_seconds": 0.1})
+    engine = database.create_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", settings)
+    try:
+        async with engine.connect() as connection:
+            journal_mode = (await connection.execute(text("PRAGMA journal_mode"))).scalar()
+            busy_timeout = (await connection.execute(text("PRAGMA busy_timeout"))).scalar()
+            assert journal_mode == "wal"
+            assert busy_timeout == settings.db_sqlite_busy_timeout_ms
+            assert database.pool_stats(engine)["checked_out"] == 1
+
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+
+        stats = database.pool_stats(engine)
+        assert stats["checked_out"] == 0
+        assert stats["waiting"] == 0
+        assert stats["timeouts"] == 1
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_read_router(tmp_path):
+    settings = get_settings()
+    engines = [database.create_engine(f"sqlite+aiosqlite:///{tmp_path / name}", settings) for name in ("primary.db", "replica.db")]
+    primary, replica = [async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) for engine in engines]
+    broken = async_sessionmaker(database.create_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}", settings))
+    try:
+        for engine, name in zip(engines, ("primary", "replica")):
+            async with engine.begin() as connection:
+                await connection.execute(text("CREATE TABLE node (name TEXT)"))
+                await connection.execute(text(f"INSERT INTO node VALUES ('{name}')"))
+
+        async def served_by(router, last_write=None):
+            async with await router.session(last_write) as db:
+                name = (await db.execute(text("SELECT name FROM node"))).scalar()
+                # only primary reads may fill the response cache
+                assert database.on_replica(db) == (name == "replica")
+                return name
+
+        router = database.ReadRouter(primary, [replica, broken], sticky_seconds=60)
+        # round robin over the replicas, the unreachable one falls through to the next
+        assert [await served_by(router) for _ in range(4)] == ["replica"] * 4
+        assert await served_by(database.ReadRouter(primary, [broken], sticky_seconds=60)) == "primary"
+
+        assert await served_by(router, time.time() - 1) == "primary"
+        assert await served_by(router, time.time() - 61) == "replica"
+    finally:
+        for engine in engines:
+            await engine.dispose()
+        await broken.kw["bind"].dispose()
+
+
+@pytest.mark.asyncio
+async def test_last_write_cookie():
+    app = FastAPI()
+    app.add_middleware(database.ReadYourWritesMiddleware, sticky_seconds=5)
+
+    @app.post("/write")
+    async def write(db: Annotated[AsyncSession, Depends(database.get_db_session)]):
+        await db.execute(text("SELECT 1"))
+        await db.commit()
+
+    @app.get("/read")
+    async def read(request: Request):
+        return database._last_write(request)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/read")
+        assert "set-cookie" not in response.headers
+        assert response.json() is None
+
+        # any worker serving the next read finds the write in the cookie the client sends back
+        response = await client.post("/write")
+        assert response.cookies[database.LAST_WRITE_COOKIE]
+        assert database.read_router.sticky((await client.get("/read")).json())
+
+
+# the tables as the first release created them
+FIRST_RELEASE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE, password VARCHAR, roles VARCHAR)",
+    "CREATE TABLE assets (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, description VARCHAR, asset_type VARCHAR(7) NOT NULL, "
+    "created_at DATETIME, last_update DATETIME)",
+    "CREATE TABLE asset_versions (id INTEGER PRIMARY KEY, version_number INTEGER NOT NULL, status VARCHAR(14), "
+    "file_path VARCHAR NOT NULL, created_at DATETIME, last_update DATETIME, asset_id INTEGER REFERENCES assets (id) ON DELETE CASCADE)",
+    "INSERT INTO users VALUES (1, 'admin', 'x', 'admin')",
+    "INSERT INTO assets VALUES (1, 'rock', 'mossy', 'texture', '2024-01-01 00:00:00', '2024-01-01 00:00:00')",
+    "INSERT INTO asset_versions VALUES (1, 1, 'Published', '/v1', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1)",
+    "INSERT INTO asset_versions VALUES (2, 2, 'InProgress', '/v2', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 1)",
+]
+
+@pytest.mark.asyncio
+async def test_upgrade_first_release_database(tmp_path):
+    engine = database.create_engine(f"sqlite+aiosqlite:///{tmp_path / 'old.db'}", get_settings())
+    try:
+        async with engine.begin() as connection:
+            for statement in FIRST_RELEASE_SCHEMA:
+                await connection.execute(text(statement))
+        # a second start finds nothing left to do
+        for _ in range(2):
+            async with engine.begin() as connection:
+                await connection.run_sync(database.Base.metadata.create_all)
+                await connection.run_sync(migrations.upgrade)
+
+        async with engine.connect() as connection:
+            asset = (await connection.execute(text("SELECT latest_version_id, latest_published_version_id, last_version_number, "
+                                                   "row_version, last_update FROM assets"))).one()
+            assert tuple(asset) == (2, 1, 2, 1, "2024-01-01 00:00:00")
+            assert (await connection.execute(text("SELECT row_version FROM users"))).scalar() == 1
+            assert (await connection.execute(text("SELECT count(checksum), sum(row_version) FROM asset_versions"))).one() == (0, 2)
+            indexes = {row.name for row in await connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+            assert {"ix_assets_name", "ix_asset_versions_checksum", migrations.VERSION_NUMBER_UNIQUE} <= indexes
+    finally:
+        await engine.dispose()
@@ -0,0 +1,61 @@
+import pytest
+import pytest_asyncio
+
+from app.models.user import User
+from app.core import security
+
+from app.test.test_config import async_client, get_test_session, clean_db
+
+
+ADMINUSER = {"username":"admin", "password":"admin", "roles": "admin", "id":1}
+MONITOR = {"username":"scraper", "password":"scraper", "roles": "monitor", "id":2}
+ARTUSER = {"username":"art", "password":"art", "roles": "artist", "id":3}
+
+
+async def _token(async_client, user: dict) -> str:
+    response = await async_client.post("/token", data={"username": user["username"], "password": user["password"]})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+@pytest_asyncio.fixture
+async def create_users(clean_db):
+    async for session in get_test_session():
+        for user in (ADMINUSER, MONITOR, ARTUSER):
+            session.add(User(username=user["username"], password=security.hash_plain_password(user["password"]), roles=user["roles"]))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_monitoring_needs_a_scope(async_client, create_users):
+    artist_token = await _token(async_client, ARTUSER)
+    for path in ("/metrics", "/health/db"):
+        response = await async_client.get(path)
+        assert response.status_code == 401
+        response = await async_client.get(path, headers={"Authorization": f"Bearer {artist_token}"})
+        assert response.status_code == 401
+        for user in (ADMINUSER, MONITOR):
+            response = await async_client.get(path, headers={"Authorization": f"Bearer {await _token(async_client, user)}"})
+            assert response.status_code == 200
+
+    response = await async_client.get("/health/db", headers={"Authorization": f"Bearer {await _token(async_client, MONITOR)}"})
+    assert "pool" in response.json()
+
+
+@pytest.mark.asyncio
+async def test_metrics(async_client, create_users):
+    def samples(text: str) -> dict:
+        return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+    headers = {"Authorization": f"Bearer {await _token(async_client, ADMINUSER)}"}
+    route = 'method="GET",route="/users/{user_id}"'
+    before = samples((await async_client.get("/metrics", headers=headers)).text)
+    response = await async_client.get(f"users/{ADMINUSER['id']}", headers=headers)
+    assert response.status_code == 200
+
+    after = samples((await async_client.get("/metrics", headers=headers)).text)
+    count = "http_request_duration_seconds_count{" + route + ',status="200"}'
+    assert int(after[count]) == int(before.get(count, 0)) + 1
+    # the user lookup always hits the database, so no request on this route can land in the zero-statement bucket
+    assert int(after["http_request_sql_statements_bucket{" + route + ',le="0"}']) == 0
+    assert float(after["http_request_db_seconds_sum{" + route + "}"]) > 0
+    assert "principal_cache_hits" in after
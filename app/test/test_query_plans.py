@@ -0,0 +1,87 @@
+import re
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import event
+
+from app.core.database import Base
+from app.repositories import asset as asset_repo
+from app.repositories import user as user_repo
+from app.repositories import chunk as chunk_repo
+from app.schemas.asset import AssetSearch, AssetVersionSearch, AssetExport, AssetDeleteFilter
+from app.schemas.user import UserSearch
+from app.test.test_config import engine, get_test_session
+
+
+# "SCAN <table>" with no index is SQLite's full table scan, "SCAN <table> USING INDEX" walks an index in order.
+# scans of subqueries (already filtered through an index) are fine, only real tables count
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+LAST_PAGE = SimpleNamespace(id=1, last_update=datetime(2024, 1, 1))
+ID_CURSOR = asset_repo.next_cursor([LAST_PAGE], AssetSearch(limit=1, cursor=""))
+LAST_UPDATE_CURSOR = asset_repo.next_cursor([LAST_PAGE], AssetSearch(limit=1, cursor="", order_by="last_update"))
+# matches nothing, the bulk deletes below leave the rows alone
+LONG_AGO = datetime(2000, 1, 1)
+
+
+async def _drain(stream):
+    async for _ in stream:
+        pass
+
+# every filtered repository read and the lookups of the bulk delete; User.roles substring search (ILIKE '%role%')
+# is left out on purpose, a leading wildcard can not use a b-tree index
+REPOSITORY_QUERIES = [
+    lambda db: asset_repo.get_assets(db, asset_id=1),
+    lambda db: asset_repo.get_assets_by_ids([3, 1, 2], db),
+    lambda db: asset_repo.search_assets(AssetSearch(id=1), db),
+    lambda db: asset_repo.search_assets(AssetSearch(name="asset1"), db),
+    lambda db: asset_repo.search_assets(AssetSearch(asset_type="texture"), db),
+    lambda db: asset_repo.search_assets(AssetSearch(cursor=ID_CURSOR), db),
+    lambda db: asset_repo.search_assets(AssetSearch(q="asset"), db),
+    lambda db: asset_repo.search_assets(AssetSearch(asset_type="rig", fields="name", versions_limit=3), db),
+    lambda db: asset_repo.search_assets(AssetSearch(cursor=LAST_UPDATE_CURSOR, order_by="last_update"), db),
+    lambda db: _drain(asset_repo.stream_assets(AssetExport(asset_type="texture"), db)),
+    lambda db: asset_repo.get_asset_verison(1, 1, db),
+    lambda db: asset_repo.get_latest_version(1, True, db),
+    lambda db: asset_repo.search_assets_version(1, AssetVersionSearch(), db),
+    lambda db: asset_repo.search_assets_version(1, AssetVersionSearch(id=1), db),
+    lambda db: asset_repo.search_assets_version(1, AssetVersionSearch(version_number=1), db),
+    lambda db: asset_repo.search_assets_version(1, AssetVersionSearch(status="Published"), db),
+    lambda db: asset_repo.search_assets_version(1, AssetVersionSearch(cursor=ID_CURSOR), db),
+    lambda db: asset_repo.delete_assets(AssetDeleteFilter(ids=[0]), db),
+    lambda db: asset_repo.delete_assets(AssetDeleteFilter(older_than=LONG_AGO), db),
+    lambda db: asset_repo.delete_assets(AssetDeleteFilter(asset_type="texture", older_than=LONG_AGO), db),
+    lambda db: chunk_repo.get_manifest(1, db),
+    lambda db: chunk_repo.content_exists("0" * 64, [], db),
+    lambda db: user_repo.get_user_by_id(1, db),
+    lambda db: user_repo.get_user_by_username("admin", db),
+    lambda db: user_repo.find_user(db, UserSearch(id=1)),
+    lambda db: user_repo.find_user(db, UserSearch(username="admin")),
+]
+
+
+@pytest.mark.asyncio
+async def test_repository_queries_use_indexes():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "DELETE")):
+            statements.append((statement, parameters))
+
+    async for db_session in get_test_session():
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            for query in REPOSITORY_QUERIES:
+                await query(db_session)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    assert statements
+    full_scans = []
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            full_scans += [(statement, row.detail) for row in plan
+                           if (scan := FULL_SCAN.match(row.detail)) and scan.group(1) in Base.metadata.tables]
+
+    assert full_scans == []
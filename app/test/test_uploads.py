@@ -0,0 +1,534 @@
+import hashlib, io, os, random
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, update
+
+from app.core import security, storage, previews
+from app.models.asset import AssetVersion
+from app.models.chunk import Chunk
+from app.models.user import User
+from app.repositories import asset as asset_repo
+from app.repositories import chunk as chunk_repo
+from app.repositories import upload as upload_repo
+from app.test.test_config import async_client, clean_db, get_test_session
+
+
+ADMINUSER = {"username":"admin", "password":"admin", "roles": "admin", "id":1}
+ASSET = {"name":"rock", "description":"mossy rock texture", "asset_type":"texture"}
+PAYLOAD = bytes(range(256)) * 4096
+STATE = {}
+
+
+@pytest.fixture(autouse=True)
+def storage_dir(tmp_path_factory, monkeypatch):
+    if "storage_dir" not in STATE:
+        STATE["storage_dir"] = tmp_path_factory.mktemp("storage")
+    monkeypatch.setattr(storage, "STORAGE_DIR", STATE["storage_dir"])
+    return STATE["storage_dir"]
+
+@pytest_asyncio.fixture(autouse=True)
+async def finish_previews():
+    # jobs run as tasks on the test's event loop, they are done before it closes
+    yield
+    await previews.pipeline.drain()
+
+@pytest_asyncio.fixture
+async def admin_token(async_client):
+    data = {"username": ADMINUSER["username"], "password": ADMINUSER["password"]}
+    response = await async_client.post("/token", data=data)
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+@pytest_asyncio.fixture
+async def create_admin():
+    async for session in get_test_session():
+        admin = User(username=ADMINUSER["username"], password=security.hash_plain_password(ADMINUSER["password"]), roles=ADMINUSER["roles"])
+        session.add(admin)
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload(async_client, clean_db, create_admin, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post("/assets", headers=headers, json=ASSET)
+    assert response.status_code == 200
+    STATE["asset_id"] = asset_id = response.json()["id"]
+
+    checksum = hashlib.sha256(PAYLOAD).hexdigest()
+    new_upload = {"version_number": 1, "status": "Published", "size": len(PAYLOAD), "checksum": checksum}
+    response = await async_client.post(f"/assets/{asset_id}/uploads", headers=headers, json=new_upload)
+    assert response.status_code == 200
+    upload = response.json()
+    assert upload["offset"] == 0
+
+    half = len(PAYLOAD) // 2
+    response = await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": 0}, content=PAYLOAD[:half])
+    assert response.status_code == 200
+    assert response.json()["offset"] == half
+
+    # a part sent for a stale offset is refused, the client resumes from the reported one
+    response = await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": 0}, content=PAYLOAD[:half])
+    assert response.status_code == 409
+    assert response.headers["upload-offset"] == str(half)
+
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 409
+    assert response.json() == {"detail": "Upload Is Not Complete"}
+
+    response = await async_client.get(f"/uploads/{upload['id']}", headers=headers)
+    assert response.json()["offset"] == half
+    response = await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": half}, content=PAYLOAD[half:] + b"extra")
+    assert response.status_code == 413
+    response = await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": half}, content=PAYLOAD[half:])
+    assert response.status_code == 200
+
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 200
+    version = response.json()
+    assert version["checksum"] == checksum
+    assert version["size"] == len(PAYLOAD)
+    assert version["version_number"] == 1
+    assert version["file_path"] == storage.content_uri(checksum)
+    STATE["version"] = version
+
+    response = await async_client.get(f"/uploads/{upload['id']}", headers=headers)
+    assert response.status_code == 404
+    response = await async_client.post(f"/assets/{asset_id}/uploads", headers=headers, json=new_upload)
+    assert response.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_download_content(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    url = f"/assets/{STATE['asset_id']}/{STATE['version']['id']}/content"
+    response = await async_client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.content == PAYLOAD
+    assert response.headers["etag"] == '"' + STATE["version"]["checksum"] + '"'
+    assert response.headers["accept-ranges"] == "bytes"
+    etag = response.headers["etag"]
+
+    response = await async_client.get(url, headers={**headers, "Range": "bytes=1000-1999"})
+    assert response.status_code == 206
+    assert response.content == PAYLOAD[1000:2000]
+    assert response.headers["content-range"] == f"bytes 1000-1999/{len(PAYLOAD)}"
+
+    # several ranges come back as multipart/byteranges, one part each
+    response = await async_client.get(url, headers={**headers, "Range": "bytes=0-9, 5000-5099, -4"})
+    assert response.status_code == 206
+    assert int(response.headers["content-length"]) == len(response.content)
+    media_type, _, boundary = response.headers["content-type"].partition("; boundary=")
+    assert media_type == "multipart/byteranges"
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    expected = [(0, 10), (5000, 5100), (len(PAYLOAD) - 4, len(PAYLOAD))]
+    for part, (start, end) in zip(parts[1:-1], expected):
+        part_headers, _, body = part.partition(b"\r\n\r\n")
+        assert f"Content-Range: bytes {start}-{end - 1}/{len(PAYLOAD)}".encode() in part_headers
+        assert body == PAYLOAD[start:end] + b"\r\n"
+    response = await async_client.get(url, headers={**headers, "Range": "bytes=0-9, nonsense"})
+    assert response.status_code == 200
+    assert len(response.content) == len(PAYLOAD)
+
+    response = await async_client.get(url, headers={**headers, "Range": "bytes=-10", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == PAYLOAD[-10:]
+    response = await async_client.get(url, headers={**headers, "Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert len(response.content) == len(PAYLOAD)
+
+    response = await async_client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = await async_client.post(f"/assets/{STATE['asset_id']}", headers=headers, json={"version_number": 5, "file_path": "/share/rock.png"})
+    response = await async_client.get(f"/assets/{STATE['asset_id']}/{response.json()['id']}/content", headers=headers)
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Version Has No Stored Content"}
+
+@pytest.mark.asyncio
+async def test_upload_checksum_and_abort(async_client, admin_token, storage_dir):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post(f"/assets/{STATE['asset_id']}/uploads", headers=headers,
+                                       json={"version_number": 2, "checksum": "0" * 64})
+    upload = response.json()
+    response = await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": 0}, content=b"not what was promised")
+    assert response.status_code == 200
+
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Checksum Mismatch"}
+
+    response = await async_client.delete(f"/uploads/{upload['id']}", headers=headers)
+    assert response.status_code == 200
+    assert not storage.upload_path(upload["id"]).exists()
+
+    response = await async_client.post(f"/assets/{100}/uploads", headers=headers, json={"version_number": 1})
+    assert response.status_code == 404
+
+    # a chunk is held in memory while it is hashed, one larger than the chunker makes is refused up front
+    oversized = {"hash": "0" * 64, "size": storage.CHUNK_MAX_BYTES + 1}
+    response = await async_client.post(f"/assets/{STATE['asset_id']}/uploads", headers=headers,
+                                       json={"checksum": "0" * 64, "chunks": [oversized]})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_parts_hold_no_transaction(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post(f"/assets/{STATE['asset_id']}/uploads", headers=headers, json={})
+    upload = response.json()
+
+    async def body():
+        # the transaction that read the upload is over before its bytes arrive
+        assert not session.in_transaction()
+        assert set(upload_repo._locks) == {upload["id"]}
+        yield b"some bytes"
+
+    async for session in get_test_session():
+        part = await upload_repo.write_part(upload["id"], 0, body(), session)
+        assert part.offset == len(b"some bytes")
+        with pytest.raises(upload_repo.UploadNotFound):
+            await upload_repo.write_part("0" * 32, 0, body(), session)
+    # no lock is kept for an upload nobody is writing, or for one that does not exist
+    assert upload_repo._locks == {}
+
+    response = await async_client.delete(f"/uploads/{upload['id']}", headers=headers)
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_complete_upload_is_atomic(async_client, admin_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post(f"/assets/{STATE['asset_id']}/uploads", headers=headers,
+                                       json={"version_number": 3, "checksum": hashlib.sha256(PAYLOAD).hexdigest()})
+    upload = response.json()
+    await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": 0}, content=PAYLOAD)
+
+    add_references = chunk_repo.add_references
+    async def fail(*args, **kwargs):
+        raise RuntimeError("lost the database")
+    monkeypatch.setattr(chunk_repo, "add_references", fail)
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 500
+    # nothing of the version was kept, so the upload is still there to be completed again
+    response = await async_client.get(f"/uploads/{upload['id']}", headers=headers)
+    assert response.status_code == 200
+
+    monkeypatch.setattr(chunk_repo, "add_references", add_references)
+
+    # the process dies right after the commit: the upload went with it, a retry can not publish twice
+    def die(asset_id):
+        raise RuntimeError("killed")
+    monkeypatch.setattr(asset_repo.response_cache, "invalidate", die)
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 500
+    monkeypatch.undo()
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 404
+    response = await async_client.get(f"/assets/{STATE['asset_id']}/versions/", headers=headers, params={"version_number": 3})
+    [version] = response.json()
+    # version 1 holds the same content, the chunks were referenced once more and not twice
+    refcounts = await _live_chunks()
+    assert all(refcounts[hashlib.sha256(chunk).hexdigest()] == 2 for chunk in storage.split(PAYLOAD))
+
+    response = await async_client.delete(f"/assets/{STATE['asset_id']}/{version['id']}", headers=headers)
+    assert response.status_code == 200
+
+
+async def _publish_chunks(async_client, headers, version_number: int, data: bytes) -> tuple[dict, int]:
+    chunks = storage.split(data)
+    refs = [{"hash": hashlib.sha256(chunk).hexdigest(), "size": len(chunk)} for chunk in chunks]
+    response = await async_client.post(f"/assets/{STATE['asset_id']}/uploads", headers=headers,
+                                       json={"version_number": version_number, "checksum": hashlib.sha256(data).hexdigest(), "chunks": refs})
+    assert response.status_code == 200
+    upload = response.json()
+    missing = set(upload["missing_chunks"])
+    for ref, chunk in zip(refs, chunks):
+        if ref["hash"] in missing:
+            missing.discard(ref["hash"])
+            response = await async_client.put(f"/uploads/{upload['id']}/chunks/{ref['hash']}", headers=headers, content=chunk)
+            assert response.status_code == 204
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 200
+    return response.json(), len(upload["missing_chunks"])
+
+async def _live_chunks() -> dict:
+    # the loop runs to its end so the session is closed on this event loop, not when the generator is collected
+    async for session in get_test_session():
+        refcounts = {chunk.hash: chunk.refcount for chunk in (await session.execute(select(Chunk))).scalars()}
+    return refcounts
+
+@pytest.mark.asyncio
+async def test_deduplicated_versions(async_client, admin_token, monkeypatch):
+    monkeypatch.setattr(storage, "CHUNK_MIN_BYTES", 4096)
+    monkeypatch.setattr(storage, "CHUNK_MAX_BYTES", 65536)
+    monkeypatch.setattr(storage, "RUN_LENGTH", 8)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    data = random.Random(1).randbytes(256 * 1024)
+    edited = data[:100_000] + b"retouched" + data[100_009:]
+
+    first, sent = await _publish_chunks(async_client, headers, 6, data)
+    total = len(storage.split(data))
+    assert sent == total > 20
+    # an edit in the middle only costs the chunks around it
+    second, sent = await _publish_chunks(async_client, headers, 7, edited)
+    assert 0 < sent <= 2
+    # the same bytes again: nothing to send, nothing new on disk
+    before = await _live_chunks()
+    third, sent = await _publish_chunks(async_client, headers, 8, data)
+    assert sent == 0
+    assert third["checksum"] == first["checksum"]
+    assert set(await _live_chunks()) == set(before)
+
+    url = f"/assets/{STATE['asset_id']}/{second['id']}/content"
+    response = await async_client.get(url, headers=headers)
+    assert response.content == edited
+    response = await async_client.get(url, headers={**headers, "Range": "bytes=99990-100019"})
+    assert response.status_code == 206
+    assert response.content == edited[99990:100020]
+    response = await async_client.get(url, headers={**headers, "Range": f"bytes={len(edited)}-"})
+    assert response.status_code == 416
+
+    for version in (first, third):
+        response = await async_client.delete(f"/assets/{STATE['asset_id']}/{version['id']}", headers=headers)
+        assert response.status_code == 200
+    refcounts = await _live_chunks()
+    released = [chunk_hash for chunk_hash, refcount in refcounts.items() if refcount == 0]
+    assert 0 < len(released) <= 2
+    assert all(refcounts[hashlib.sha256(chunk).hexdigest()] == 1 for chunk in storage.split(edited))
+
+    async for session in get_test_session():
+        assert sorted(await chunk_repo.collect_garbage(0, session)) == sorted(released)
+    assert not any(storage.has_chunk(chunk_hash) for chunk_hash in released)
+    response = await async_client.get(url, headers=headers)
+    assert response.content == edited
+
+    # deleting the asset releases what its remaining versions hold
+    response = await async_client.delete(f"/assets/{STATE['asset_id']}", headers=headers)
+    assert response.status_code == 200
+    assert set((await _live_chunks()).values()) == {0}
+
+
+@pytest.mark.asyncio
+async def test_edit_stored_file_path(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post("/assets", headers=headers, json=ASSET)
+    asset_id = response.json()["id"]
+    first = await _upload(async_client, headers, asset_id, 1, b"first content")
+    second = await _upload(async_client, headers, asset_id, 2, b"second content")
+    url = f"/assets/{asset_id}/{first['id']}"
+
+    # pointed at content another version holds: the references move with the path
+    response = await async_client.put(url, headers=headers, json={"file_path": second["file_path"]})
+    assert response.status_code == 200
+    response = await async_client.get(f"{url}/content", headers=headers)
+    assert response.content == b"second content"
+    refcounts = await _live_chunks()
+    assert refcounts[first["checksum"]] == 0
+    assert refcounts[second["checksum"]] == 2
+
+    response = await async_client.put(url, headers=headers, json={"file_path": storage.content_uri("0" * 64)})
+    assert response.status_code == 409
+
+    # pointed outside the chunk store: the version no longer has stored content
+    response = await async_client.put(url, headers=headers, json={"file_path": "/share/rock.png"})
+    assert response.status_code == 200
+    response = await async_client.get(f"{url}/content", headers=headers)
+    assert response.status_code == 404
+    async for session in get_test_session():
+        version = await session.get(AssetVersion, first["id"])
+        assert (version.checksum, version.size) == (None, None)
+    assert (await _live_chunks())[second["checksum"]] == 1
+
+    # a new version may name stored content too, it then holds that content like an uploaded one
+    response = await async_client.post(f"/assets/{asset_id}", headers=headers, json={"file_path": second["file_path"]})
+    assert response.status_code == 200
+    response = await async_client.get(f"/assets/{asset_id}/{response.json()['id']}/content", headers=headers)
+    assert response.content == b"second content"
+    response = await async_client.post("/assets/versions/bulk", headers=headers,
+                                       json=[{"asset_id": asset_id, "file_path": second["file_path"]},
+                                             {"asset_id": asset_id, "file_path": "/share/rock.png"}])
+    assert response.status_code == 200
+    assert (await _live_chunks())[second["checksum"]] == 3
+    for url, body in ((f"/assets/{asset_id}", {"file_path": storage.content_uri("0" * 64)}),
+                      ("/assets/versions/bulk", [{"asset_id": asset_id, "file_path": storage.content_uri("0" * 64)}])):
+        response = await async_client.post(url, headers=headers, json=body)
+        assert response.status_code == 409
+
+    response = await async_client.delete(f"/assets/{asset_id}", headers=headers)
+    assert response.status_code == 200
+
+
+async def _release_long_ago(chunk_hash: str):
+    long_ago = datetime.now() - timedelta(hours=2)
+    async for session in get_test_session():
+        await session.execute(update(Chunk).where(Chunk.hash == chunk_hash).values(released_at=long_ago))
+        await session.commit()
+    os.utime(storage.chunk_path(chunk_hash), (long_ago.timestamp(), long_ago.timestamp()))
+
+@pytest.mark.asyncio
+async def test_reused_chunks_survive_garbage_collection(async_client, admin_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post("/assets", headers=headers, json=ASSET)
+    asset_id = response.json()["id"]
+    data = random.Random(2).randbytes(4096)
+    chunk_hash = hashlib.sha256(data).hexdigest()
+    first = await _upload(async_client, headers, asset_id, 1, data)
+    response = await async_client.delete(f"/assets/{asset_id}/{first['id']}", headers=headers)
+    assert response.status_code == 200
+    await _release_long_ago(chunk_hash)
+
+    # a collection runs after the content was verified and before the new version references it
+    manifest_digest = storage.manifest_digest
+    async def collect_after(manifest):
+        digest = await manifest_digest(manifest)
+        async for session in get_test_session():
+            assert await chunk_repo.collect_garbage(60, session) == []
+        return digest
+    monkeypatch.setattr(storage, "manifest_digest", collect_after)
+    response = await async_client.post(f"/assets/{asset_id}/uploads", headers=headers,
+                                       json={"checksum": chunk_hash, "chunks": [{"hash": chunk_hash, "size": len(data)}]})
+    upload = response.json()
+    assert upload["missing_chunks"] == []
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 200
+    monkeypatch.setattr(storage, "manifest_digest", manifest_digest)
+    response = await async_client.get(f"/assets/{asset_id}/{response.json()['id']}/content", headers=headers)
+    assert response.content == data
+    assert (await _live_chunks())[chunk_hash] == 1
+
+    # a file the collection keeps because it was used again keeps its row, so a later round can remove both
+    response = await async_client.delete(f"/assets/{asset_id}", headers=headers)
+    await _release_long_ago(chunk_hash)
+    storage.hold_chunks([chunk_hash])
+    async for session in get_test_session():
+        assert await chunk_repo.collect_garbage(60, session) == []
+    assert (await _live_chunks())[chunk_hash] == 0
+    assert storage.has_chunk(chunk_hash)
+
+
+async def _upload(async_client, headers, asset_id: int, version_number: int, data: bytes) -> dict:
+    response = await async_client.post(f"/assets/{asset_id}/uploads", headers=headers,
+                                       json={"version_number": version_number, "checksum": hashlib.sha256(data).hexdigest()})
+    upload = response.json()
+    await async_client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": 0}, content=data)
+    response = await async_client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+@pytest.mark.asyncio
+async def test_texture_previews(async_client, clean_db, create_admin, admin_token):
+    Image = pytest.importorskip("PIL.Image")
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post("/assets", headers=headers, json=ASSET)
+    asset_id = response.json()["id"]
+    png = io.BytesIO()
+    Image.effect_noise((1024, 512), 64).convert("RGB").save(png, format="PNG")
+
+    version = first = await _upload(async_client, headers, asset_id, 1, png.getvalue())
+    await previews.pipeline.drain()
+    url = f"/assets/{asset_id}/{version['id']}/preview"
+    response = await async_client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    with Image.open(io.BytesIO(response.content)) as preview:
+        assert preview.size == (previews.pipeline.cache.max_side, previews.pipeline.cache.max_side // 2)
+    response = await async_client.get(url, headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+    # a lost preview is made again when asked for
+    previews.pipeline.cache.path(version["checksum"]).unlink()
+    response = await async_client.get(url, headers=headers)
+    assert response.status_code == 202
+    await previews.pipeline.drain()
+    response = await async_client.get(url, headers=headers)
+    assert response.status_code == 200
+
+    version = await _upload(async_client, headers, asset_id, 2, b"not an image")
+    await previews.pipeline.drain()
+    response = await async_client.get(f"/assets/{asset_id}/{version['id']}/preview", headers=headers)
+    assert response.status_code == 422
+
+    # pointing a version at other content starts that content's preview, as an upload would
+    previews.pipeline.cache.path(first["checksum"]).unlink()
+    response = await async_client.put(f"/assets/{asset_id}/{version['id']}", headers=headers, json={"file_path": first["file_path"]})
+    assert response.status_code == 200
+    await previews.pipeline.drain()
+    response = await async_client.get(f"/assets/{asset_id}/{version['id']}/preview", headers=headers)
+    assert response.status_code == 200
+
+    response = await async_client.post("/assets", headers=headers, json={**ASSET, "asset_type": "rig"})
+    version = await _upload(async_client, headers, response.json()["id"], 1, png.getvalue())
+    response = await async_client.get(f"/assets/{version['asset_id']}/{version['id']}/preview", headers=headers)
+    assert response.status_code == 404
+
+    response = await async_client.get("/metrics", headers=headers)
+    assert "preview_pipeline_completed" in response.text
+    assert 'preview_job_duration_seconds_count{outcome="failed"}' in response.text
+
+def test_preview_cache_eviction(storage_dir):
+    cache = previews.PreviewCache(max_side=8, max_bytes=250)
+    for n in range(4):
+        cache.put(f"{n:064x}", bytes(100))
+        # eviction goes by recency, so reading the first keeps it
+        assert cache.get(f"{0:064x}") is not None
+    assert cache.get(f"{1:064x}") is None
+    assert cache.get(f"{2:064x}") is None
+    assert cache.get(f"{3:064x}") is not None
+
+class _BrokenPool(ThreadPoolExecutor):
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("a worker died")
+
+@pytest.mark.asyncio
+async def test_preview_failures(storage_dir):
+    pytest.importorskip("PIL.Image")
+    executors = iter([_BrokenPool(), ThreadPoolExecutor(max_workers=1)])
+    pipeline = previews.PreviewPipeline(lambda: next(executors), 1, previews.PreviewCache(max_side=8, max_bytes=1 << 20), 60, 1 << 20)
+    try:
+        manifest = [storage.put_chunk(b"not an image")]
+
+        # a broken pool is replaced and the content is not held against
+        assert pipeline.submit("1" * 64, manifest)
+        await pipeline.drain()
+        assert not isinstance(pipeline.executor, _BrokenPool)
+        assert not pipeline.failed_for("1" * 64)
+
+        # neither is a chunk that is not on disk
+        assert pipeline.submit("2" * 64, [("f" * 64, 1)])
+        await pipeline.drain()
+        assert not pipeline.failed_for("2" * 64)
+
+        # content pillow can not decode is remembered and not queued again
+        assert pipeline.submit("1" * 64, manifest)
+        await pipeline.drain()
+        assert pipeline.failed_for("1" * 64)
+        assert not pipeline.submit("1" * 64, manifest)
+        assert pipeline.stats()["failed"] == 3
+
+        # content past max_input_bytes is never handed to a worker
+        assert not pipeline.submit("3" * 64, [("f" * 64, (1 << 20) + 1)])
+        assert not pipeline.pending("3" * 64)
+    finally:
+        pipeline.executor.shutdown()
+
+def test_preview_reads_chunks(storage_dir):
+    Image = pytest.importorskip("PIL.Image")
+    png = io.BytesIO()
+    Image.effect_noise((64, 32), 64).convert("RGB").save(png, format="PNG")
+    data = png.getvalue()
+    # cut at odd places so pillow's reads and seeks cross chunk boundaries
+    cuts = [0, 7, 100, len(data) // 2, len(data)]
+    chunks = [(str(storage.chunk_path(chunk_hash)), size)
+              for chunk_hash, size in (storage.put_chunk(data[low:high]) for low, high in zip(cuts, cuts[1:]))]
+
+    with previews.ChunkReader(chunks) as reader:
+        reader.seek(5)
+        assert reader.read(10) == data[5:15]
+        reader.seek(-3, io.SEEK_END)
+        assert reader.read() == data[-3:]
+    with Image.open(io.BytesIO(previews.render_preview(chunks, 16))) as preview:
+        assert preview.size == (16, 8)
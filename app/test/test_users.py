@@ -3,7 +3,8 @@ import pytest_asyncio
 
 from app.schemas.user import UserUpdate
 from app.models.user import User
-from app.core import security
+from app.core import security, utils
+from app.repositories import user as user_repo
 
 from app.test.test_config import async_client, get_test_session, clean_db
 
@@ -50,6 +51,41 @@ async def test_users_me(async_client, clean_db, create_admin, admin_token):
     assert response.json() == {"username": ADMINUSER["username"], "roles": ADMINUSER["roles"], "id": ADMINUSER["id"]}
 
 
+@pytest.mark.asyncio
+async def test_principal_cache(async_client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    hits = security.principal_cache.hits
+    response = await async_client.get("/user/me", headers=headers)
+    assert response.status_code == 200
+    assert security.principal_cache.hits == hits + 1
+    assert security.principal_cache.stats()["size"] == 1
+
+
+@pytest.mark.asyncio
+async def test_principal_cache_skips_stale_lookups(async_client, admin_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    security.principal_cache.clear()
+    get_user_by_id = user_repo.get_user_by_id
+
+    async def change_roles_meanwhile(userid, db_session):
+        user = await get_user_by_id(userid, db_session)
+        async for session in get_test_session():
+            await user_repo.update_user(userid, UserUpdate(roles="guest"), session)
+        return user
+
+    monkeypatch.setattr(user_repo, "get_user_by_id", change_roles_meanwhile)
+    response = await async_client.get("/user/me", headers=headers)
+    assert response.status_code == 200
+    monkeypatch.setattr(user_repo, "get_user_by_id", get_user_by_id)
+    # the principal read before the change is not kept, the next request loads the new roles
+    assert security.principal_cache.get(ADMINUSER["id"]) is None
+    response = await async_client.get("/user/me", headers=headers)
+    assert response.json()["roles"] == "guest"
+
+    async for session in get_test_session():
+        await user_repo.update_user(ADMINUSER["id"], UserUpdate(roles=ADMINUSER["roles"]), session)
+
+
 @pytest.mark.asyncio
 async def test_create_new_account(async_client):
     payload = {"username": VALIDUSER["username"], "password": VALIDUSER["password"]}
@@ -83,6 +119,10 @@ async def test_update_user(async_client, admin_token, user_token):
     VALIDUSER["roles"] = "artist"
     assert response.json() == {"username": VALIDUSER["username"], "roles": VALIDUSER["roles"], "id":VALIDUSER["id"]}
 
+    stale = '"' + str(int(response.headers["etag"].strip('"')) - 1) + '"'
+    response = await async_client.put(f"/users/{VALIDUSER['id']}", json={"roles": "admin"}, headers={**headers, "If-Match": stale})
+    assert response.status_code == 412
+
     # Check VALIDUSER new access
     headers = {"Authorization": f"Bearer {user_token}"}
     response = await async_client.get(f"users/{VALIDUSER['id']}", headers=headers)
@@ -99,4 +139,12 @@ async def test_delete_user(async_client, admin_token):
     headers = {"Authorization": f"Bearer {admin_token}"}
     response = await async_client.get(f"users/{VALIDUSER["id"]}", headers = headers)
     assert response.status_code == 404
-    assert response.json() == {"detail":"user not found"}
\ No newline at end of file
+    assert response.json() == {"detail":"user not found"}
+
+def test_scope_matching():
+    artist_scopes = utils.get_scopes("artist")
+    assert utils.scope_granted(artist_scopes, "asset:view")
+    assert not utils.scope_granted(artist_scopes, "asset:viewer")
+    assert utils.scope_granted(artist_scopes, "version:new")
+    assert utils.scope_granted(utils.get_scopes("admin"), "asset:edit:me")
+    assert not utils.scope_granted(utils.get_scopes("guest unknown"), "user:me")
@@ -0,0 +1,36 @@
+"""
+shared by the benchmarks. imported before anything from app: the settings are read at import time and
+need these variables, a benchmark runs without a .env
+"""
+import os, statistics
+
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("SECRETE_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_KEY_EXPIRE_MINUTES", "30")
+
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.database import get_db_session, get_db_read_session, get_db_sessionmaker
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {"count": len(samples), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "max_ms": samples[-1] * 1000, "mean_ms": statistics.fmean(samples) * 1000}
+
+
+def use_sessions(app: FastAPI, session_local: async_sessionmaker):
+    """points every database dependency of the app at the benchmark's own database"""
+    async def get_bench_session():
+        db = session_local()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.dependency_overrides[get_db_session] = get_bench_session
+    app.dependency_overrides[get_db_read_session] = get_bench_session
+    app.dependency_overrides[get_db_sessionmaker] = lambda: session_local
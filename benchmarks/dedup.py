@@ -0,0 +1,89 @@
+"""
+publishing successive versions of a large file through the chunk store: bytes sent, time and disk used
+per version when each one only edits a few spots, against the size of the content itself.
+
+    python -m benchmarks.dedup --size-mb 512 --versions 5 --edits 3
+"""
+import argparse, asyncio, hashlib, json, pathlib, random, shutil, tempfile, time
+
+from benchmarks._common import use_sessions
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.main import app
+from app.core import security, storage
+from app.core.database import Base
+from app.models.user import User
+
+
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def disk_usage(path: pathlib.Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+async def publish(client: AsyncClient, headers: dict, asset_id: int, version_number: int, data: bytes) -> dict:
+    # what a pipeline client does: chunk locally, announce the manifest, send only what the store lacks
+    started = time.perf_counter()
+    chunks = storage.split(data)
+    refs = [{"hash": hashlib.sha256(chunk).hexdigest(), "size": len(chunk)} for chunk in chunks]
+    upload = (await client.post(f"/assets/{asset_id}/uploads", headers=headers,
+                                json={"version_number": version_number, "checksum": hashlib.sha256(data).hexdigest(), "chunks": refs})).json()
+    missing, sent = set(upload["missing_chunks"]), 0
+    for ref, chunk in zip(refs, chunks):
+        if ref["hash"] in missing:
+            missing.discard(ref["hash"])
+            response = await client.put(f"/uploads/{upload['id']}/chunks/{ref['hash']}", headers=headers, content=chunk)
+            assert response.status_code == 204, response.text
+            sent += len(chunk)
+    response = await client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+    assert response.status_code == 200, response.text
+    return {"chunks": len(chunks), "sent_mb": sent / (1 << 20), "seconds": time.perf_counter() - started}
+
+
+async def main(args):
+    storage.STORAGE_DIR = pathlib.Path(tempfile.mkdtemp(dir=args.dir))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_local() as session:
+        session.add(User(username="bench", password=security.hash_plain_password("bench"), roles="admin"))
+        await session.commit()
+    use_sessions(app, session_local)
+
+    rng = random.Random(3)
+    data = bytearray(rng.randbytes(args.size_mb << 20))
+    sample = bytes(data[:64 << 20])
+    started = time.perf_counter()
+    storage.split(sample)
+    report = {"size_mb": args.size_mb, "split_mb_per_second": len(sample) / (1 << 20) / (time.perf_counter() - started), "versions": []}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        token = (await client.post("/token", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        asset_id = (await client.post("/assets", headers=headers, json={"name": "big", "description": "big", "asset_type": "texture"})).json()["id"]
+
+        for version_number in range(1, args.versions + 1):
+            if version_number > 1:
+                for _ in range(args.edits):
+                    at = rng.randrange(len(data) - 64)
+                    data[at:at + 64] = rng.randbytes(64)
+            result = await publish(client, headers, asset_id, version_number, bytes(data))
+            result["disk_mb"] = disk_usage(storage.STORAGE_DIR / "chunks") / (1 << 20)
+            report["versions"].append(result)
+        report["republish_unchanged"] = await publish(client, headers, asset_id, args.versions + 1, bytes(data))
+
+    report["logical_mb"] = args.size_mb * (args.versions + 1)
+    shutil.rmtree(storage.STORAGE_DIR)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--versions", type=int, default=5)
+    parser.add_argument("--edits", type=int, default=3, help="64-byte edits between versions")
+    parser.add_argument("--dir", default=None, help="where to put the storage dir, defaults to the system temp dir")
+    asyncio.run(main(parser.parse_args()))
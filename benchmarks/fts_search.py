@@ -0,0 +1,96 @@
+"""
+full-text (FTS5) asset search latency vs. the ILIKE scan it replaces, on a seeded SQLite file.
+
+    python -m benchmarks.fts_search --assets 1000000 --queries 200
+"""
+import argparse, asyncio, json, os, random, sqlite3, tempfile, time
+from datetime import datetime
+
+from benchmarks._common import percentiles
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.core.database import Base
+from app.models.asset import Asset
+from app.repositories import asset as asset_repo
+from app.schemas.asset import AssetSearch
+
+
+WORDS = [f"{stem}{suffix}" for stem in ("rock", "tree", "hero", "sword", "castle", "cloud", "moss", "brick", "wolf", "lamp",
+                                        "river", "armor", "crate", "banner", "skull", "vine", "gear", "boot", "robe", "tile")
+         for suffix in ("", "let", "wood", "stone", "fire", "ice", "dark", "gold")]
+# selective terms, roughly 10 assets each at 1M assets; common WORDS match ~5% of the catalogue each
+RARE_WORDS = 100_000
+
+def rare_word(rng: random.Random) -> str:
+    return f"tag{rng.randrange(RARE_WORDS):05d}"
+
+
+def seed(path: str, assets: int, batch: int = 50000):
+    rng = random.Random(42)
+    now = datetime.now().isoformat(sep=" ")
+    conn = sqlite3.connect(path)
+    for start in range(0, assets, batch):
+        rows = [(" ".join(rng.sample(WORDS, 2)) + f" {rare_word(rng)}", " ".join(rng.sample(WORDS, 6)) + f" {rare_word(rng)}",
+                 "texture", now, now)
+                for _ in range(start, min(assets, start + batch))]
+        conn.executemany("INSERT INTO assets(name, description, asset_type, created_at, last_update) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.execute("INSERT INTO assets_fts(rowid, name, description) SELECT id, name, description FROM assets")
+    conn.commit()
+    conn.close()
+
+
+async def timed(run, queries: list[str]) -> dict:
+    samples = []
+    for q in queries:
+        started = time.perf_counter()
+        await run(q)
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "fts_bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    seed(path, args.assets)
+    report = {"assets": args.assets, "seed_seconds": time.perf_counter() - started}
+
+    rng = random.Random(7)
+    common = [rng.choice(WORDS) for _ in range(args.queries)]
+    rare = [rare_word(rng) for _ in range(args.queries)]
+    rare_prefix = [rare_word(rng)[:7] for _ in range(args.queries)]
+    two_words = [" ".join(rng.sample(WORDS, 2)) for _ in range(args.queries)]
+    session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_local() as db_session:
+        async def fts(q: str):
+            await asset_repo.search_assets(AssetSearch(q=q, limit=args.limit), db_session)
+            db_session.expunge_all()
+
+        async def ilike(q: str):
+            # what clients had before q=: substring match over both columns, no ranking
+            query = select(Asset).where(*(or_(Asset.name.ilike(f"%{w}%"), Asset.description.ilike(f"%{w}%")) for w in q.split()))
+            await db_session.execute(query.order_by(Asset.id).limit(args.limit))
+            db_session.expunge_all()
+
+        for name, queries in (("rare_word", rare), ("rare_prefix", rare_prefix), ("common_word", common), ("two_common_words", two_words)):
+            report[f"fts_{name}"] = await timed(fts, queries)
+            report[f"ilike_{name}"] = await timed(ilike, queries[:args.ilike_queries])
+
+    await engine.dispose()
+    os.remove(path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ilike-queries", type=int, default=20, help="the scan is slow, sample fewer")
+    parser.add_argument("--limit", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
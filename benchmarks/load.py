@@ -0,0 +1,182 @@
+"""
+mixed-workload load test of the real app through ASGITransport, on a seeded SQLite file.
+
+    python -m benchmarks.load --users 50 --assets 10000 --versions 5 --requests 5000 --concurrency 32 --save baseline.json
+    python -m benchmarks.load ... --baseline baseline.json --tolerance 0.2    # exits 1 on a regression
+"""
+import argparse, asyncio, itertools, json, os, random, sqlite3, sys, tempfile, time
+from datetime import datetime
+
+from benchmarks._common import percentiles, use_sessions
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from app.main import app
+from app.core import security
+from app.core.config import get_settings
+from app.core.database import Base, create_engine
+
+
+WORDS = ["rock", "tree", "hero", "sword", "castle", "cloud", "moss", "brick", "wolf", "lamp",
+         "river", "armor", "crate", "banner", "skull", "vine", "gear", "boot", "robe", "tile"]
+DEFAULT_MIX = "token=5,get=40,search=25,add_version=15,update=15"
+
+
+def seed(path: str, users: int, assets: int, versions: int, batch: int = 20000):
+    rng = random.Random(42)
+    now = datetime.now().isoformat(sep=" ")
+    # one bcrypt hash shared by every user, hashing each would dominate the seed time
+    password = security.hash_plain_password("bench")
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users(username, password, roles) VALUES (?, ?, ?)",
+                     [(f"user{n}", password, "admin") for n in range(users)])
+    for start in range(0, assets, batch):
+        ids = range(start + 1, min(assets, start + batch) + 1)
+        conn.executemany("INSERT INTO assets(id, name, description, asset_type, created_at, last_update) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(i, " ".join(rng.sample(WORDS, 2)), " ".join(rng.sample(WORDS, 6)), rng.choice(("texture", "rig")), now, now)
+                          for i in ids])
+        conn.executemany("INSERT INTO asset_versions(asset_id, version_number, status, file_path, created_at, last_update) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(i, v, "Published" if v == 1 else "InProgress", f"/assets/{i}/{v}.bin", now, now)
+                          for i in ids for v in range(1, versions + 1)])
+    conn.execute("UPDATE assets SET latest_version_id = (SELECT max(id) FROM asset_versions WHERE asset_id = assets.id), "
+                 "latest_published_version_id = (SELECT max(id) FROM asset_versions WHERE asset_id = assets.id AND status = 'Published')")
+    conn.execute("INSERT INTO assets_fts(rowid, name, description) SELECT id, name, description FROM assets")
+    conn.commit()
+    conn.close()
+
+
+class Workload:
+    """one request per call, picked from the weighted mix"""
+
+    def __init__(self, client: AsyncClient, args, tokens: list[str]):
+        self.client = client
+        self.args = args
+        self.tokens = tokens
+        self.rng = random.Random(7)
+        # new versions are numbered past the seeded ones, one counter per asset keeps them unique
+        self.next_version = {}
+        mix = dict(item.split("=") for item in args.mix.split(","))
+        self.operations = [getattr(self, name) for name in mix]
+        self.weights = [float(weight) for weight in mix.values()]
+
+    def pick(self):
+        return self.rng.choices(self.operations, self.weights)[0]
+
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+
+    def asset_id(self) -> int:
+        return self.rng.randint(1, self.args.assets)
+
+    async def token(self):
+        return await self.client.post("/token", data={"username": f"user{self.rng.randrange(self.args.users)}", "password": "bench"})
+
+    async def get(self):
+        return await self.client.get(f"/assets/{self.asset_id()}", headers=self.headers())
+
+    async def search(self):
+        return await self.client.get("/assets/", params={"q": self.rng.choice(WORDS), "limit": 20}, headers=self.headers())
+
+    async def add_version(self):
+        asset_id = self.asset_id()
+        version_number = self.next_version.get(asset_id, self.args.versions + 1)
+        self.next_version[asset_id] = version_number + 1
+        return await self.client.post(f"/assets/{asset_id}", headers=self.headers(),
+                                      json={"version_number": version_number, "file_path": f"/assets/{asset_id}/{version_number}.bin"})
+
+    async def update(self):
+        return await self.client.put(f"/assets/{self.asset_id()}", headers=self.headers(),
+                                     json={"description": " ".join(self.rng.sample(WORDS, 6))})
+
+
+async def run(workload: Workload, requests: int, concurrency: int) -> dict:
+    samples, errors = {}, {}
+    remaining = itertools.count()
+
+    async def worker():
+        while next(remaining) < requests:
+            operation = workload.pick()
+            started = time.perf_counter()
+            response = await operation()
+            samples.setdefault(operation.__name__, []).append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[operation.__name__] = errors.get(operation.__name__, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {name: {"count": len(times), "errors": errors.get(name, 0), "per_second": len(times) / elapsed, **percentiles(times)}
+                 for name, times in sorted(samples.items())}
+    return {"seconds": elapsed, "per_second": requests / elapsed, "endpoints": endpoints}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, current in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if current["per_second"] < before["per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {before['per_second']:.1f}/s -> {current['per_second']:.1f}/s")
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "load_bench.db")
+    engine = create_engine(f"sqlite+aiosqlite:///{path}", get_settings())
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    started = time.perf_counter()
+    seed(path, args.users, args.assets, args.versions)
+    seed_seconds = time.perf_counter() - started
+
+    session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    use_sessions(app, session_local)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        tokens = []
+        for n in range(min(args.users, args.concurrency)):
+            response = await client.post("/token", data={"username": f"user{n}", "password": "bench"})
+            tokens.append(response.json()["access_token"])
+        workload = Workload(client, args, tokens)
+        # warm the caches and the query plans before anything is measured
+        await run(workload, args.warmup, args.concurrency)
+        report = await run(workload, args.requests, args.concurrency)
+
+    await engine.dispose()
+    os.remove(path)
+    report["dataset"] = {"users": args.users, "assets": args.assets, "versions": args.versions, "seed_seconds": seed_seconds}
+    report["config"] = {"requests": args.requests, "concurrency": args.concurrency, "mix": args.mix}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    print(json.dumps(report, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--assets", type=int, default=10000)
+    parser.add_argument("--versions", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight pairs")
+    parser.add_argument("--save", help="write the report here, e.g. as the next baseline")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,98 @@
+"""
+/root latency while /token is hammered, with bcrypt on the password pool vs. inline on the event loop.
+
+    python -m benchmarks.password_offload --logins 200 --concurrency 20
+"""
+import argparse, asyncio, json, time
+
+from benchmarks._common import percentiles, use_sessions
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.main import app
+from app.core import security
+from app.core.database import Base
+from app.models.user import User
+
+
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+class InlinePasswordPool(security.PasswordWorkPool):
+    """the pre-pool behaviour: bcrypt runs directly on the event loop"""
+
+    async def run(self, fn, *args):
+        return fn(*args)
+
+
+async def probe_root(client: AsyncClient, stop: asyncio.Event, interval: float) -> list[float]:
+    # latency is measured from when the probe was due, so time spent waiting for a blocked loop counts
+    samples = []
+    while not stop.is_set():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        response = await client.get("/root")
+        samples.append(time.perf_counter() - due)
+        assert response.status_code == 200
+    return samples
+
+
+async def hammer_token(client: AsyncClient, logins: int, concurrency: int):
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with limiter:
+            response = await client.post("/token", data={"username": "bench", "password": "bench"})
+            assert response.status_code == 200
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+
+
+async def scenario(client: AsyncClient, logins: int, concurrency: int, interval: float, under_load: bool) -> dict:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_root(client, stop, interval))
+    started = time.perf_counter()
+    if under_load:
+        await hammer_token(client, logins, concurrency)
+    else:
+        await asyncio.sleep(1)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    result = {"root": percentiles(await probe)}
+    if under_load:
+        result["token_per_second"] = logins / elapsed
+    return result
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_local() as session:
+        session.add(User(username="bench", password=security.hash_plain_password("bench"), roles="guest"))
+        await session.commit()
+    use_sessions(app, session_local)
+
+    report = {}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        report["idle"] = await scenario(client, args.logins, args.concurrency, args.interval, under_load=False)
+        report["pool"] = await scenario(client, args.logins, args.concurrency, args.interval, under_load=True)
+        report["pool"]["password_pool"] = security.password_pool.stats()
+
+        offloaded = security.password_pool
+        security.password_pool = InlinePasswordPool(offloaded.executor, 1)
+        try:
+            report["inline"] = await scenario(client, args.logins, args.concurrency, args.interval, under_load=True)
+        finally:
+            security.password_pool = offloaded
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between /root probes")
+    asyncio.run(main(parser.parse_args()))
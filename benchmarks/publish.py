@@ -0,0 +1,102 @@
+"""
+many publishers adding versions to the same asset at once, on a SQLite file. "server" leaves the numbering to
+the api, "client" is the old way: read the latest version, post the next number, retry on a conflict.
+
+    python -m benchmarks.publish --publishers 50 --versions-each 4    # exits 1 on a gap, a missing version or a retry
+    python -m benchmarks.publish --mode client --publishers 50 --versions-each 4    # for comparison
+"""
+import argparse, asyncio, json, os, sys, tempfile, time
+
+from benchmarks._common import percentiles, use_sessions
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from app.main import app
+from app.core import security
+from app.core.config import get_settings
+from app.core.database import Base, create_engine
+from app.models.user import User
+
+
+class Publisher:
+    def __init__(self, client: AsyncClient, headers: dict, asset_id: int, mode: str, max_attempts: int):
+        self.client = client
+        self.headers = headers
+        self.asset_id = asset_id
+        self.mode = mode
+        self.max_attempts = max_attempts
+        self.retries = 0
+        self.failures = 0
+        self.samples = []
+
+    async def publish(self, name: str):
+        started = time.perf_counter()
+        for _ in range(self.max_attempts):
+            version = {"file_path": f"/publish/{name}"}
+            if self.mode == "client":
+                latest = await self.client.get(f"/assets/{self.asset_id}/latest", headers=self.headers)
+                version["version_number"] = latest.json()["version_number"] + 1 if latest.status_code == 200 else 1
+            response = await self.client.post(f"/assets/{self.asset_id}", headers=self.headers, json=version)
+            if response.status_code == 200:
+                self.samples.append(time.perf_counter() - started)
+                return
+            self.retries += 1
+        self.failures += 1
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "publish_bench.db")
+    engine = create_engine(f"sqlite+aiosqlite:///{path}", get_settings())
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_local() as session:
+        session.add(User(username="bench", password=security.hash_plain_password("bench"), roles="admin"))
+        await session.commit()
+
+    use_sessions(app, session_local)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        token = (await client.post("/token", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        asset_id = (await client.post("/assets", headers=headers, json={"name": "hero", "description": "contended", "asset_type": "rig"})).json()["id"]
+
+        publishers = [Publisher(client, headers, asset_id, args.mode, args.max_attempts) for _ in range(args.publishers)]
+
+        async def run(n: int, publisher: Publisher):
+            for m in range(args.versions_each):
+                await publisher.publish(f"{n}/{m}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(n, publisher) for n, publisher in enumerate(publishers)))
+        elapsed = time.perf_counter() - started
+
+        response = await client.get(f"/assets/{asset_id}", headers=headers)
+        numbers = sorted(version["version_number"] for version in response.json()["versions"])
+
+    await engine.dispose()
+    os.remove(path)
+
+    expected = args.publishers * args.versions_each
+    samples = [sample for publisher in publishers for sample in publisher.samples]
+    report = {"mode": args.mode, "publishers": args.publishers, "versions_each": args.versions_each,
+              "published": len(numbers), "expected": expected,
+              "gap_free": numbers == list(range(1, len(numbers) + 1)),
+              "retries": sum(publisher.retries for publisher in publishers),
+              "failures": sum(publisher.failures for publisher in publishers),
+              "seconds": elapsed, "per_second": len(samples) / elapsed}
+    if samples:
+        report.update(percentiles(samples))
+    print(json.dumps(report, indent=2))
+    ok = report["gap_free"] and report["published"] == expected and report["retries"] == 0
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["server", "client"], default="server")
+    parser.add_argument("--publishers", type=int, default=50)
+    parser.add_argument("--versions-each", type=int, default=4)
+    parser.add_argument("--max-attempts", type=int, default=20, help="per version, client mode retries on a conflict")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,62 @@
+"""
+per-response CPU for an asset with 500 versions: the old InDb -> dict -> Out -> jsonable_encoder path vs. one TypeAdapter pass.
+
+    python -m benchmarks.serialization --versions 500 --rounds 200
+"""
+import argparse, json, statistics, time
+from datetime import datetime
+
+import benchmarks._common  # noqa: F401, sets the environment the settings need
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.serialization import json_response
+from app.models.asset import Asset, AssetVersion, AssetStatus
+from app.schemas.asset import AssetInDb, AssetOut
+
+
+def build_asset(versions: int) -> Asset:
+    now = datetime.now()
+    asset = Asset(id=1, name="castle gate", description="a weathered stone gate", asset_type="model",
+                  created_at=now, last_update=now)
+    asset.versions = [AssetVersion(id=n, asset_id=1, version_number=n, file_path=f"/assets/1/{n}.fbx",
+                                   status=AssetStatus.Published, created_at=now) for n in range(1, versions + 1)]
+    return asset
+
+
+def before(asset: Asset) -> bytes:
+    # what the routers did: validate into InDb, dump, rebuild Out, then FastAPI encodes it again
+    asset_in_db = AssetInDb.model_validate(asset)
+    out = AssetOut(**asset_in_db.model_dump())
+    return JSONResponse(jsonable_encoder(out)).body
+
+
+def after(asset: Asset) -> bytes:
+    return json_response(AssetOut, asset).body
+
+
+def measure(run, asset: Asset, rounds: int) -> dict:
+    run(asset)
+    samples = []
+    for _ in range(rounds):
+        started = time.process_time()
+        run(asset)
+        samples.append(time.process_time() - started)
+    return {"rounds": rounds, "mean_cpu_ms": statistics.fmean(samples) * 1000,
+            "p50_cpu_ms": statistics.median(samples) * 1000}
+
+
+def main(args):
+    asset = build_asset(args.versions)
+    assert json.loads(before(asset)) == json.loads(after(asset))
+    report = {"versions": args.versions, "before": measure(before, asset, args.rounds), "after": measure(after, asset, args.rounds)}
+    report["speedup"] = report["before"]["mean_cpu_ms"] / report["after"]["mean_cpu_ms"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--versions", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=200)
+    main(parser.parse_args())
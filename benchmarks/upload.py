@@ -0,0 +1,103 @@
+"""
+resumable upload throughput for a multi-GB file sent in parts through the real app, and the memory it costs,
+then download throughput of the stored file, whole and as parallel Range segments.
+
+    python -m benchmarks.upload --size-mb 4096 --part-mb 64 --segments 8
+"""
+import argparse, asyncio, hashlib, json, os, pathlib, resource, shutil, tempfile, time
+
+from benchmarks._common import use_sessions
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.main import app
+from app.core import security, storage
+from app.core.database import Base
+from app.models.user import User
+
+
+CHUNK = os.urandom(1 << 16)
+
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+session_local = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def part_body(size: int):
+    # what a client streaming from disk sends: 64KiB at a time, never the whole part
+    for _ in range(size // len(CHUNK)):
+        yield CHUNK
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main(args):
+    storage.STORAGE_DIR = pathlib.Path(tempfile.mkdtemp(dir=args.dir))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_local() as session:
+        session.add(User(username="bench", password=security.hash_plain_password("bench"), roles="admin"))
+        await session.commit()
+    use_sessions(app, session_local)
+
+    size, part = args.size_mb << 20, args.part_mb << 20
+    expected = hashlib.sha256()
+    for _ in range(size // len(CHUNK)):
+        expected.update(CHUNK)
+
+    report = {"size_mb": args.size_mb, "part_mb": args.part_mb, "rss_before_mb": max_rss_mb()}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        token = (await client.post("/token", data={"username": "bench", "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        asset_id = (await client.post("/assets", headers=headers, json={"name": "big", "description": "big", "asset_type": "texture"})).json()["id"]
+        upload = (await client.post(f"/assets/{asset_id}/uploads", headers=headers,
+                                    json={"version_number": 1, "size": size, "checksum": expected.hexdigest()})).json()
+
+        started = time.perf_counter()
+        for offset in range(0, size, part):
+            response = await client.put(f"/uploads/{upload['id']}", headers=headers, params={"offset": offset},
+                                        content=part_body(min(part, size - offset)))
+            assert response.status_code == 200, response.text
+        parts_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = await client.post(f"/uploads/{upload['id']}/complete", headers=headers)
+        assert response.status_code == 200, response.text
+        complete_seconds = time.perf_counter() - started
+        # httpx's ASGITransport buffers whole response bodies, so memory is only meaningful up to here
+        report["rss_after_upload_mb"] = max_rss_mb()
+        content_url = f"/assets/{asset_id}/{response.json()['id']}/content"
+
+        async def download(range_header: str | None = None) -> int:
+            received = 0
+            request_headers = headers if range_header is None else {**headers, "Range": range_header}
+            async with client.stream("GET", content_url, headers=request_headers) as response:
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+            return received
+
+        started = time.perf_counter()
+        assert await download() == size
+        report["download_mb_per_second"] = args.size_mb / (time.perf_counter() - started)
+
+        segment = size // args.segments
+        ranges = [f"bytes={start}-{min(size, start + segment) - 1}" for start in range(0, size, segment)]
+        started = time.perf_counter()
+        assert sum(await asyncio.gather(*(download(r) for r in ranges))) == size
+        report["segmented_download_mb_per_second"] = args.size_mb / (time.perf_counter() - started)
+
+    report.update(parts_seconds=parts_seconds, upload_mb_per_second=args.size_mb / parts_seconds,
+                  complete_seconds=complete_seconds)
+    shutil.rmtree(storage.STORAGE_DIR)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=2048)
+    parser.add_argument("--part-mb", type=int, default=64)
+    parser.add_argument("--segments", type=int, default=8, help="parallel Range requests for the segmented download")
+    parser.add_argument("--dir", default=None, help="where to put the storage dir, defaults to the system temp dir")
+    asyncio.run(main(parser.parse_args()))